@@ -2,24 +2,27 @@
 # @Time    : 12/3/2024 10:08 AM
 # @FileName: scenario_controller.py
 # @Software: PyCharm
+import copy
 import json
 import datetime
 import os
 import re
+from collections import defaultdict
 
-from PySide6.QtCore import QObject, Slot, Qt, Signal
+from PySide6.QtCore import QObject, Slot, Qt, Signal, QTimer
 from PySide6.QtWidgets import QInputDialog, QMessageBox, QDialog
 from requests import session, delete
-from sqlalchemy import text
+from sqlalchemy import text, select, bindparam
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy.orm.sync import update
 from sqlalchemy.sql.base import elements
 
 from models.models import Scenario, BehaviorValue, AttributeValue, Category, Entity, Template, BehaviorValueReference, \
     AttributeValueReference, entity_category, Owl, Bayes, OwlClassBehavior, OwlClassAttribute, OwlClass, BayesNodeState, \
-    BayesNode, BayesNodeTarget
+    BayesNode, BayesNodeTarget, AttributeDefinition, BehaviorDefinition
 from utils.get_config import get_cfg
+from utils.plan import invalidate_plan_cache, invalidate_bayes_state_cache
 # 假设您已经在 models/scenario.py 中定义了 Scenario 类，
 # 其中字段为 scenario_id, scenario_name, scenario_description, ...
 from views.dialogs.custom_error_dialog import CustomErrorDialog
@@ -30,12 +33,74 @@ from views.scenario_manager import ScenarioDialog
 import logging
 import json
 from sqlalchemy.orm import Session
-from typing import Dict, Any, Union, List, Tuple
+from typing import Dict, Any, Union, List, Tuple, Optional
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class _BulkIdMismatch(RuntimeError):
+    """批量插入得到的自增 ID 段被并发写入打乱，无法与本批行一一对应"""
+
+
+# (scenario_id, OWL 记录 ID) -> fetch_ontology_data 的结果
+_ontology_cache: Dict[Tuple[int, Tuple[int, ...]], Tuple[Dict, Dict, Dict, Dict]] = {}
+
+# 父 ID 未知（实体不在本次预取范围内）
+_UNKNOWN = object()
+
+# 属性/行为定义属于种子数据，进程内只加载一次：
+# attribute_definition_id / behavior_definition_id -> get_scenario_data 中定义相关的字段
+_definition_cache: Dict[str, Dict[int, Dict[str, Any]]] = {}
+
+
+def get_definition_cache(session: Session) -> Tuple[Dict[int, Dict[str, Any]], Dict[int, Dict[str, Any]]]:
+    """返回 (属性定义字典, 行为定义字典)，首次调用时各用一次联表查询加载"""
+    if not _definition_cache:
+        attribute_defs = {}
+        for attr_def in session.query(AttributeDefinition).options(
+                joinedload(AttributeDefinition.attribute_code),
+                joinedload(AttributeDefinition.attribute_aspect),
+                joinedload(AttributeDefinition.attribute_type)).all():
+            attribute_defs[attr_def.attribute_definition_id] = {
+                "attribute_definition_id": attr_def.attribute_definition_id,
+                "china_default_name": attr_def.china_default_name,
+                "english_default_name": attr_def.english_default_name,
+                "attribute_code_name": attr_def.attribute_code.attribute_code_name,
+                "attribute_aspect_name": attr_def.attribute_aspect.attribute_aspect_name,
+                "attribute_type_code": attr_def.attribute_type.attribute_type_code,
+                "is_required": bool(attr_def.is_required),
+                "is_multi_valued": bool(attr_def.is_multi_valued),
+                "is_reference": bool(attr_def.is_reference),
+                "reference_target_type_id": attr_def.reference_target_type_id,
+                "default_value": attr_def.default_value,
+                "description": attr_def.description,
+            }
+
+        behavior_defs = {}
+        for bh_def in session.query(BehaviorDefinition).options(
+                joinedload(BehaviorDefinition.behavior_code_ref)).all():
+            code_obj = bh_def.behavior_code_ref
+            behavior_defs[bh_def.behavior_definition_id] = {
+                "behavior_definition_id": bh_def.behavior_definition_id,
+                "china_default_name": bh_def.china_default_name,
+                "english_default_name": bh_def.english_default_name,
+                "behavior_code_name": code_obj.behavior_code_name if code_obj else "",
+                "object_entity_type_id": bh_def.object_entity_type_id,
+                "is_required": bool(bh_def.is_required),
+                "is_multi_valued": bool(bh_def.is_multi_valued),
+                "description": bh_def.description,
+            }
+
+        _definition_cache["attribute"] = attribute_defs
+        _definition_cache["behavior"] = behavior_defs
+    return _definition_cache["attribute"], _definition_cache["behavior"]
+
+
+def invalidate_definition_cache() -> None:
+    """属性/行为定义被修改（如重新导入种子数据）后调用"""
+    _definition_cache.clear()
+
 
 
 class ScenarioController(QObject):
@@ -51,6 +116,16 @@ class ScenarioController(QObject):
         self.current_scenario = None
         self.session = self.db_manager.get_session()
 
+        # 界面共用的长会话定期 expire，避免浏览想定时已加载对象持续占用内存
+        try:
+            expire_interval = get_cfg().get("database", {}).get("session_expire_interval_seconds", 300)
+        except (OSError, ValueError):
+            expire_interval = 300
+        self.session_expire_timer = QTimer(self)
+        self.session_expire_timer.timeout.connect(self.expire_idle_session)
+        if expire_interval and expire_interval > 0:
+            self.session_expire_timer.start(int(expire_interval * 1000))
+
         # 连接信号
         self.scenario_manager.scenario_selected.connect(self.handle_scenario_selected)
         self.scenario_manager.add_requested.connect(self.handle_add_requested)
@@ -63,6 +138,10 @@ class ScenarioController(QObject):
         self.tab_widget.ElementSettingTab.refresh_scenario_data.connect(self.handle_scenario_selected)
         self.tab_widget.generate_model_save_to_database.connect(self.generate_model_save_to_database)
         self.tab_widget.generate_bayes_save_to_database.connect(self.generate_bayes_save_to_database)
+        # 后台生成任务使用各自的数据库会话直接写入，完成后回到界面线程刷新
+        self.tab_widget.set_job_backend(self.db_manager, self.save_model_to_database, self.save_bayes_to_database)
+        self.tab_widget.model_saved.connect(self.on_model_saved)
+        self.tab_widget.bayes_saved.connect(lambda: self.session.commit())
         self.tab_widget.ConditionSettingTab.save_plan_to_database_signal.connect(self.apply_changes_from_json)
         # 加载初始数据
         self.load_scenarios()
@@ -170,9 +249,13 @@ class ScenarioController(QObject):
         根据 scenario_id，获取该场景下所有的实体(Entity)、
         以及与实体相关的属性(AttributeValue) / 行为(BehaviorValue) / 类别(Category) 等信息，
         并组织成一个包含 scenario + entities + attributes + behaviors 等的字典。
+
+        实体的类别、属性值、行为值及其引用通过 selectinload 批量加载，
+        属性/行为定义取自进程级缓存，查询次数与实体数量无关。
         """
         # 1. 查找对应的场景
         scenario = session.query(Scenario).filter_by(scenario_id=scenario_id).one()
+        attribute_defs, behavior_defs = get_definition_cache(session)
 
         # 2. 组织顶层结构
         scenario_data = {
@@ -185,8 +268,25 @@ class ScenarioController(QObject):
             "entities": []
         }
 
+        entities = (
+            session.query(Entity)
+            .filter(Entity.scenario_id == scenario_id)
+            .options(
+                selectinload(Entity.categories),
+                selectinload(Entity.attribute_values).selectinload(AttributeValue.references),
+                selectinload(Entity.behavior_values).selectinload(BehaviorValue.references),
+            )
+            .order_by(Entity.entity_id)
+            .all()
+        )
+        # 定义缓存中缺少的定义（运行期间新增）时重新加载一次
+        if any(av.attribute_definition_id not in attribute_defs for e in entities for av in e.attribute_values) or \
+                any(bv.behavior_definition_id not in behavior_defs for e in entities for bv in e.behavior_values):
+            invalidate_definition_cache()
+            attribute_defs, behavior_defs = get_definition_cache(session)
+
         # 3. 遍历该 scenario 下的所有 entity
-        for entity in scenario.entities:
+        for entity in entities:
             entity_dict = {
                 "entity_id": entity.entity_id,
                 "entity_name": entity.entity_name,
@@ -210,88 +310,48 @@ class ScenarioController(QObject):
 
             # 5. 收集 attribute_value
             for av in entity.attribute_values:
-                attr_def = av.attribute_definition
-                # 优先使用 attribute_value.attribute_name，如果没有则 fallback 到 attribute_code_name
-                final_attr_name = av.attribute_name or attr_def.attribute_code.attribute_code_name
-
+                attr_def = attribute_defs[av.attribute_definition_id]
                 attribute_item = {
                     "attribute_value_id": av.attribute_value_id,
-                    "attribute_definition_id": attr_def.attribute_definition_id,
-                    "china_default_name": attr_def.china_default_name,
-                    "english_default_name": attr_def.english_default_name,
-                    "attribute_code_name": attr_def.attribute_code.attribute_code_name,
-                    "attribute_aspect_name": attr_def.attribute_aspect.attribute_aspect_name,
-                    "attribute_type_code": attr_def.attribute_type.attribute_type_code,
-                    "is_required": bool(attr_def.is_required),
-                    "is_multi_valued": bool(attr_def.is_multi_valued),
-                    "is_reference": bool(attr_def.is_reference),
-                    "reference_target_type_id": attr_def.reference_target_type_id,
-                    "default_value": attr_def.default_value,
-                    "description": attr_def.description,
+                    **attr_def,
                     # 读取存放在 attribute_value 表里的值
                     "attribute_value": av.attribute_value,
-
-                    # 最终的展示名称(可能来自 attribute_name, 或者 attribute_code_name)
-                    "attribute_name": final_attr_name,
-
-                    # referenced_entities
-                    "referenced_entities": []
+                    # 优先使用 attribute_value.attribute_name，如果没有则 fallback 到 attribute_code_name
+                    "attribute_name": av.attribute_name or attr_def["attribute_code_name"],
+                    # 如果是引用型属性 (is_reference=True)，从 attribute_value_reference 表查所有引用
+                    "referenced_entities": [ref.referenced_entity_id for ref in av.references]
+                    if attr_def["is_reference"] else []
                 }
-
-                # 如果是引用型属性 (is_reference=True)，从 attribute_value_reference 表查所有引用
-                if attr_def.is_reference:
-                    for ref in av.references:
-                        attribute_item["referenced_entities"].append(ref.referenced_entity_id)
-
                 entity_dict["attributes"].append(attribute_item)
 
             # 6. 收集 behavior_value
             for bv in entity.behavior_values:
-                bh_def = bv.behavior_definition
-                # behavior_value.behavior_name 若不为空，就直接用；否则 fallback 到 behavior_code_name
-                code_obj = bh_def.behavior_code_ref  # BehaviorCode
-                fallback_name = code_obj.behavior_code_name if code_obj else ""
-
-                final_behavior_name = bv.behavior_name or fallback_name
-
+                bh_def = behavior_defs[bv.behavior_definition_id]
                 behavior_item = {
                     "behavior_value_id": bv.behavior_value_id,
-                    "behavior_definition_id": bh_def.behavior_definition_id,
-                    # 用中文名 english_default_name 也可以存到这里视具体需求
-                    "china_default_name": bh_def.china_default_name,
-                    "english_default_name": bh_def.english_default_name,
-                    # 最终的行为名
-                    "behavior_name": final_behavior_name,
-
-                    # behavior_code_name => behavior_code_ref.behavior_code_name
-                    "behavior_code_name": code_obj.behavior_code_name if code_obj else "",
-
-                    "object_entity_type_id": bh_def.object_entity_type_id,
-                    "is_required": bool(bh_def.is_required),
-                    "is_multi_valued": bool(bh_def.is_multi_valued),
-                    "description": bh_def.description,
+                    **bh_def,
+                    # behavior_value.behavior_name 若不为空，就直接用；否则 fallback 到 behavior_code_name
+                    "behavior_name": bv.behavior_name or bh_def["behavior_code_name"],
                     "create_time": str(bv.create_time),
                     "update_time": str(bv.update_time),
-
-                    # behavior_value_references
-                    "object_entities": []
+                    # 收集 behavior_value_reference
+                    "object_entities": [ref.object_entity_id for ref in bv.references]
                 }
-
-                # 收集 behavior_value_reference
-                for ref in bv.references:
-                    behavior_item["object_entities"].append(ref.object_entity_id)
-
                 entity_dict["behaviors"].append(behavior_item)
 
             scenario_data["entities"].append(entity_dict)
 
         return scenario_data
 
-    def apply_changes_from_json(self,entity_data_list: List[Dict[str, Any]],delete_mode = True):
+    def apply_changes_from_json(self,entity_data_list: List[Dict[str, Any]],delete_mode = True, bulk: bool = True):
         """
         将 JSON 列表中的多个实体（含 attributes/behaviors 等）批量写回数据库。
 
         - entity_data_list: 形如您贴出的 JSON 数组，每个元素是一个 Entity 的完整信息。
+        - bulk: True 时与库中现有数据做一次性比对，只写入有变化的行（见 _apply_changes_bulk）；
+                False 或批量写入无法安全分配 ID 时使用逐条写入的旧流程。
+
+        返回各类实际变更的行数统计。
         """
         session = self.session
         if delete_mode == True:
@@ -316,6 +376,32 @@ class ScenarioController(QObject):
                     session.rollback()
                     print(f"删除失败: {str(e)}")
                     raise
+        else:
+            entities_to_delete = set()
+
+        stats = None
+        if bulk:
+            try:
+                stats = self._apply_changes_bulk(session, entity_data_list)
+            except _BulkIdMismatch as e:
+                # 自增 ID 段与本批插入不一致（并发写入），整体回滚后按逐条流程重做
+                session.rollback()
+                print(f"批量回写无法分配连续 ID（{e}），改用逐条回写。")
+                return self.apply_changes_from_json(entity_data_list, delete_mode, bulk=False)
+        else:
+            self._apply_changes_by_row(session, entity_data_list)
+
+        session.commit()
+        invalidate_plan_cache(self.current_scenario.scenario_id)
+        if stats is not None:
+            stats["entities_deleted"] = len(entities_to_delete)
+            print(f"回写完成，实际变更: {stats}")
+        else:
+            print("回写完成。")
+        return stats
+
+    def _apply_changes_by_row(self, session: Session, entity_data_list: List[Dict[str, Any]]):
+        """逐条写回（旧流程）：每个实体/属性/行为单独查询与 flush"""
         # 0. 用于记录临时负数ID => 数据库生成ID 的映射
         temp_id_map = {}
 
@@ -337,8 +423,321 @@ class ScenarioController(QObject):
             self._process_entity_attributes(session, ent_data, temp_id_map)
             self._process_entity_behaviors(session, ent_data, temp_id_map)
 
-        session.commit()
-        print("回写完成。")
+    def _apply_changes_bulk(self, session: Session, entity_data_list: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        批量写回：
+        1. 一次预取现有实体、类别关联、属性值、行为值及引用；
+        2. 负数临时 ID 的新行用多行 INSERT 一次插入，按自增 ID 段换算真实 ID；
+        3. 与预取结果比对，只对有变化的行执行 executemany 更新，引用与类别关联按集合差异重写。
+        语义与 _apply_changes_by_row 一致。
+        """
+        now = datetime.datetime.now()
+        stats = dict.fromkeys([
+            "entities_inserted", "entities_updated", "category_links_changed",
+            "attribute_values_inserted", "attribute_values_updated", "attribute_references_changed",
+            "behavior_values_inserted", "behavior_values_updated", "behavior_references_changed"
+        ], 0)
+        temp_id_map: Dict[int, int] = {}
+
+        def real_id(any_id: int) -> int:
+            return temp_id_map[any_id] if any_id < 0 else any_id
+
+        # ---------- 1. 预取 ----------
+        existing_ids = [e["entity_id"] for e in entity_data_list if e["entity_id"] >= 0]
+        current_entities = {
+            row.entity_id: row for row in session.execute(
+                select(Entity.entity_id, Entity.entity_name, Entity.entity_type_id, Entity.scenario_id,
+                       Entity.entity_parent_id, Entity.update_time)
+                .where(Entity.entity_id.in_(existing_ids))
+            )
+        } if existing_ids else {}
+
+        av_ids = [a["attribute_value_id"] for e in entity_data_list for a in e.get("attributes", [])
+                  if a["attribute_value_id"] >= 0]
+        current_avs = {
+            row.attribute_value_id: row for row in session.execute(
+                select(AttributeValue.attribute_value_id, AttributeValue.attribute_name,
+                       AttributeValue.attribute_value)
+                .where(AttributeValue.attribute_value_id.in_(av_ids))
+            )
+        } if av_ids else {}
+        current_av_refs: Dict[int, set] = {}
+        if av_ids:
+            for av_id, ref_id in session.execute(
+                    select(AttributeValueReference.attribute_value_id, AttributeValueReference.referenced_entity_id)
+                    .where(AttributeValueReference.attribute_value_id.in_(av_ids))):
+                current_av_refs.setdefault(av_id, set()).add(ref_id)
+
+        bv_ids = [b["behavior_value_id"] for e in entity_data_list for b in e.get("behaviors", [])
+                  if b["behavior_value_id"] >= 0]
+        current_bvs = {
+            row.behavior_value_id: row for row in session.execute(
+                select(BehaviorValue.behavior_value_id, BehaviorValue.behavior_name)
+                .where(BehaviorValue.behavior_value_id.in_(bv_ids))
+            )
+        } if bv_ids else {}
+        current_bv_refs: Dict[int, set] = {}
+        if bv_ids:
+            for bv_id, obj_id in session.execute(
+                    select(BehaviorValueReference.behavior_value_id, BehaviorValueReference.object_entity_id)
+                    .where(BehaviorValueReference.behavior_value_id.in_(bv_ids))):
+                current_bv_refs.setdefault(bv_id, set()).add(obj_id)
+
+        current_categories: Dict[int, set] = {}
+        if existing_ids:
+            for e_id, cat_id in session.execute(
+                    select(entity_category.c.entity_id, entity_category.c.category_id)
+                    .where(entity_category.c.entity_id.in_(existing_ids))):
+                current_categories.setdefault(e_id, set()).add(cat_id)
+
+        # ---------- 2. 实体 ----------
+        new_entities = [e for e in entity_data_list if e["entity_id"] < 0]
+        new_entity_ids = self._bulk_insert_ids(
+            session, Entity.__table__, Entity.entity_id,
+            [{
+                "entity_name": e["entity_name"],
+                "entity_type_id": e["entity_type_id"],
+                "scenario_id": e["scenario_id"],
+                "entity_parent_id": e.get("entity_parent_id") if (e.get("entity_parent_id") or 0) >= 0 else None,
+                "create_time": self._parse_datetime(e.get("create_time")) or now,
+                "update_time": self._parse_datetime(e.get("update_time")) or now,
+            } for e in new_entities],
+            ["entity_name", "entity_type_id"]
+        )
+        for e, new_id in zip(new_entities, new_entity_ids):
+            temp_id_map[e["entity_id"]] = new_id
+        stats["entities_inserted"] = len(new_entity_ids)
+
+        # 期望的实体字段；临时父 ID 在新实体插入后才能换算
+        parent_updates: Dict[int, Optional[int]] = {}
+        entity_updates = []
+        for e in entity_data_list:
+            parent_id = e.get("entity_parent_id")
+            if e["entity_id"] < 0:
+                if parent_id is not None and parent_id < 0:
+                    parent_updates[temp_id_map[e["entity_id"]]] = temp_id_map[parent_id]
+                continue
+            # 与逐条流程一致：已有实体的临时父 ID 置空
+            if parent_id is not None and parent_id < 0:
+                parent_id = None
+            current = current_entities.get(e["entity_id"])
+            desired = (e["entity_name"], e["entity_type_id"], e["scenario_id"], parent_id,
+                       self._parse_datetime(e.get("update_time")) or (current.update_time if current else now))
+            if current is None or tuple(current[1:]) != desired:
+                entity_updates.append(dict(zip(
+                    ["b_entity_id", "b_name", "b_type_id", "b_scenario_id", "b_parent_id", "b_update_time"],
+                    (e["entity_id"],) + desired
+                )))
+        # 实体更新后各实体的父 ID（新实体插入时父 ID 已置空或为真实 ID）
+        parent_after_entities = {eid: row.entity_parent_id for eid, row in current_entities.items()}
+        parent_after_entities.update({u["b_entity_id"]: u["b_parent_id"] for u in entity_updates})
+        for e in new_entities:
+            parent_id = e.get("entity_parent_id")
+            parent_after_entities[temp_id_map[e["entity_id"]]] = parent_id if (parent_id or 0) >= 0 else None
+        if entity_updates:
+            session.execute(
+                Entity.__table__.update()
+                .where(Entity.entity_id == bindparam("b_entity_id"))
+                .values(entity_name=bindparam("b_name"), entity_type_id=bindparam("b_type_id"),
+                        scenario_id=bindparam("b_scenario_id"), entity_parent_id=bindparam("b_parent_id"),
+                        update_time=bindparam("b_update_time")),
+                entity_updates
+            )
+        stats["entities_updated"] = len(entity_updates)
+
+        # ---------- 3. 类别关联 ----------
+        new_category_ids: Dict[int, int] = {}
+        link_deletes, link_inserts = [], []
+        for e in entity_data_list:
+            e_id = real_id(e["entity_id"])
+            desired = set()
+            for cat_dict in e.get("categories", []):
+                cat_id = cat_dict["category_id"]
+                if cat_id < 0:
+                    if cat_id not in new_category_ids:
+                        cat_obj = Category(
+                            category_name=cat_dict["category_name"],
+                            description=cat_dict.get("description"),
+                            create_time=now,
+                            update_time=now
+                        )
+                        session.add(cat_obj)
+                        session.flush()
+                        new_category_ids[cat_id] = cat_obj.category_id
+                    cat_id = new_category_ids[cat_id]
+                desired.add(cat_id)
+            if desired != current_categories.get(e_id, set()):
+                link_deletes.append({"b_entity_id": e_id})
+                link_inserts.extend({"entity_id": e_id, "category_id": c} for c in sorted(desired))
+        if link_deletes:
+            session.execute(entity_category.delete().where(entity_category.c.entity_id == bindparam("b_entity_id")),
+                            link_deletes)
+        if link_inserts:
+            session.execute(entity_category.insert(), link_inserts)
+        stats["category_links_changed"] = len(link_deletes)
+
+        # ---------- 4. 属性值 ----------
+        new_attrs = [(e, a) for e in entity_data_list for a in e.get("attributes", []) if a["attribute_value_id"] < 0]
+        new_av_ids = self._bulk_insert_ids(
+            session, AttributeValue.__table__, AttributeValue.attribute_value_id,
+            [{
+                "entity_id": real_id(e["entity_id"]),
+                "attribute_definition_id": a["attribute_definition_id"],
+                "attribute_name": a.get("attribute_name"),
+                "attribute_value": None if a.get("attribute_type_code") in ("Item", "Entity") else a.get("attribute_value"),
+                "create_time": now,
+                "update_time": now,
+            } for e, a in new_attrs],
+            ["entity_id", "attribute_definition_id"]
+        )
+        for (e, a), new_id in zip(new_attrs, new_av_ids):
+            temp_id_map[a["attribute_value_id"]] = new_id
+        stats["attribute_values_inserted"] = len(new_av_ids)
+
+        av_updates, ref_deletes, ref_inserts = [], [], []
+        for e in entity_data_list:
+            e_id = real_id(e["entity_id"])
+            for a in e.get("attributes", []):
+                av_id = real_id(a["attribute_value_id"])
+                attr_type_code = a.get("attribute_type_code")
+                value = None if attr_type_code in ("Item", "Entity") else a.get("attribute_value")
+
+                current = current_avs.get(a["attribute_value_id"]) if a["attribute_value_id"] >= 0 else None
+                if a["attribute_value_id"] >= 0 and (
+                        current is None or (current.attribute_name, current.attribute_value) != (a.get("attribute_name"), value)):
+                    av_updates.append({"b_av_id": av_id, "b_name": a.get("attribute_name"),
+                                       "b_value": value, "b_update_time": now})
+
+                if attr_type_code == "Item":
+                    # Item 引用：被引用实体挂到当前实体下
+                    for ref_id in set(a.get("referenced_entities", [])):
+                        parent_updates[real_id(ref_id)] = e_id
+                elif attr_type_code == "Entity":
+                    refs = []
+                    for ref_id in a.get("referenced_entities", []):
+                        if isinstance(ref_id, dict):
+                            ref_id = ref_id["referenced_entity_id"]
+                        refs.append(real_id(ref_id))
+                    refs = list(dict.fromkeys(refs))
+                    if set(refs) != current_av_refs.get(av_id, set()):
+                        ref_deletes.append({"b_av_id": av_id})
+                        ref_inserts.extend({"attribute_value_id": av_id, "referenced_entity_id": r} for r in refs)
+
+        if av_updates:
+            session.execute(
+                AttributeValue.__table__.update()
+                .where(AttributeValue.attribute_value_id == bindparam("b_av_id"))
+                .values(attribute_name=bindparam("b_name"), attribute_value=bindparam("b_value"),
+                        update_time=bindparam("b_update_time")),
+                av_updates
+            )
+        if ref_deletes:
+            session.execute(
+                AttributeValueReference.__table__.delete()
+                .where(AttributeValueReference.attribute_value_id == bindparam("b_av_id")),
+                ref_deletes
+            )
+        if ref_inserts:
+            session.execute(AttributeValueReference.__table__.insert(), ref_inserts)
+        stats["attribute_values_updated"] = len(av_updates)
+        stats["attribute_references_changed"] = len(ref_deletes)
+
+        # 父实体：新实体的临时父 ID 与 Item 引用，与实体更新后的父 ID 比较
+        parent_changes = [
+            {"b_entity_id": child, "b_parent_id": parent}
+            for child, parent in parent_updates.items()
+            if parent_after_entities.get(child, _UNKNOWN) != parent
+        ]
+        if parent_changes:
+            session.execute(
+                Entity.__table__.update()
+                .where(Entity.entity_id == bindparam("b_entity_id"))
+                .values(entity_parent_id=bindparam("b_parent_id")),
+                parent_changes
+            )
+        stats["entities_updated"] += len(parent_changes)
+
+        # ---------- 5. 行为值 ----------
+        new_bhvs = [(e, b) for e in entity_data_list for b in e.get("behaviors", []) if b["behavior_value_id"] < 0]
+        new_bv_ids = self._bulk_insert_ids(
+            session, BehaviorValue.__table__, BehaviorValue.behavior_value_id,
+            [{
+                "behavior_definition_id": b["behavior_definition_id"],
+                "behavior_name": b.get("behavior_name"),
+                "subject_entity_id": real_id(e["entity_id"]),
+                "create_time": self._parse_datetime(b.get("create_time")) or now,
+                "update_time": self._parse_datetime(b.get("update_time")) or now,
+            } for e, b in new_bhvs],
+            ["subject_entity_id", "behavior_definition_id"]
+        )
+        for (e, b), new_id in zip(new_bhvs, new_bv_ids):
+            temp_id_map[b["behavior_value_id"]] = new_id
+        stats["behavior_values_inserted"] = len(new_bv_ids)
+
+        bv_updates, bref_deletes, bref_inserts = [], [], []
+        for e in entity_data_list:
+            for b in e.get("behaviors", []):
+                bv_id = real_id(b["behavior_value_id"])
+                if b["behavior_value_id"] >= 0:
+                    current = current_bvs.get(bv_id)
+                    if current is None or current.behavior_name != b.get("behavior_name"):
+                        bv_updates.append({"b_bv_id": bv_id, "b_name": b.get("behavior_name"),
+                                           "b_update_time": self._parse_datetime(b.get("update_time")) or now})
+                objs = []
+                for ref_data in b.get("object_entities", []):
+                    obj_id = ref_data["object_entity_id"] if isinstance(ref_data, dict) else ref_data
+                    objs.append(real_id(obj_id))
+                objs = list(dict.fromkeys(objs))
+                if set(objs) != current_bv_refs.get(bv_id, set()):
+                    bref_deletes.append({"b_bv_id": bv_id})
+                    bref_inserts.extend({"behavior_value_id": bv_id, "object_entity_id": o} for o in objs)
+
+        if bv_updates:
+            session.execute(
+                BehaviorValue.__table__.update()
+                .where(BehaviorValue.behavior_value_id == bindparam("b_bv_id"))
+                .values(behavior_name=bindparam("b_name"), update_time=bindparam("b_update_time")),
+                bv_updates
+            )
+        if bref_deletes:
+            session.execute(
+                BehaviorValueReference.__table__.delete()
+                .where(BehaviorValueReference.behavior_value_id == bindparam("b_bv_id")),
+                bref_deletes
+            )
+        if bref_inserts:
+            session.execute(BehaviorValueReference.__table__.insert(), bref_inserts)
+        stats["behavior_values_updated"] = len(bv_updates)
+        stats["behavior_references_changed"] = len(bref_deletes)
+
+        # 以上均为 Core 语句，已加载的 ORM 对象需要重新读取
+        session.expire_all()
+        return stats
+
+    @staticmethod
+    def _bulk_insert_ids(session: Session, table, pk_col, rows: List[Dict[str, Any]],
+                         check_cols: List[str], chunk_size: int = 1000) -> List[int]:
+        """
+        多行 INSERT 插入 rows 并返回各行的自增 ID（与 rows 顺序一致）。
+
+        MySQL 的多行 INSERT 中 lastrowid 为第一行的 ID，其余行顺延；
+        插入后按 check_cols 回读校验该 ID 段，若被并发插入打乱则抛出 _BulkIdMismatch。
+        """
+        ids: List[int] = []
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            first_id = session.execute(table.insert().values(chunk)).lastrowid
+            chunk_ids = list(range(first_id, first_id + len(chunk)))
+            stored = session.execute(
+                select(pk_col, *[table.c[c] for c in check_cols])
+                .where(pk_col.between(chunk_ids[0], chunk_ids[-1]))
+                .order_by(pk_col)
+            ).all()
+            expected = [(i, *[row[c] for c in check_cols]) for i, row in zip(chunk_ids, chunk)]
+            if [tuple(r) for r in stored] != expected:
+                raise _BulkIdMismatch(f"{table.name}: {chunk_ids[0]}..{chunk_ids[-1]}")
+            ids.extend(chunk_ids)
+        return ids
 
     def _process_single_entity(self,session: Session, ent_data: Dict[str, Any], temp_id_map: Dict[int, int]) -> int:
         """
@@ -645,9 +1044,12 @@ class ScenarioController(QObject):
             self.current_scenario = None
             self.reset_status_bar()
 
-    def add_scenario(self, scenario_name, scenario_description=''):
-        """在数据库中插入新情景"""
+    def add_scenario(self, scenario_name, scenario_description='', clone_from=None):
+        """在数据库中插入新情景；传入 clone_from 时整体复制该情景的数据"""
         try:
+            if clone_from is not None:
+                return self.clone_scenario(clone_from, scenario_name, scenario_description or None)
+
             # 创建新的 Scenario 实例
             new_scenario = Scenario(
                 scenario_name=scenario_name,
@@ -755,75 +1157,238 @@ class ScenarioController(QObject):
             print(f"执行 SQL 查询时出错: {e}")
             return []
 
+    @Slot()
+    def expire_idle_session(self):
+        """定时器回调：共享会话空闲（无待写入修改）时释放已加载对象的属性数据"""
+        if self.db_manager.expire_idle_session(self.session):
+            logging.debug(f"共享会话已 expire，连接池: {self.db_manager.pool_status()}")
+
     def __del__(self):
         if self.session:
             self.session.close()
             print("Session closed.")
 
 
-    def replicate_all_for_scenario(self, scenario_id: int):
+    def replicate_all_for_scenario(self, scenario_id: int, template_ids: Optional[List[int]] = None) -> int:
         """
         1) 根据 scenario_id 获取该场景。
-        2) 遍历数据库中所有(或特定) Template，为每个 Template 在该场景下新建一个 Entity。
+        2) 遍历数据库中所有(或 template_ids 指定的) Template，为每个 Template 在该场景下新建一个 Entity。
         3) 为该新 Entity:
            - 附加模板所指定的 category
            - 不管 is_required 与否，对 template.attribute_definitions 中的每个属性都建一条 AttributeValue
            - 同理，对 template.behavior_definitions 中的每个行为都建一条 BehaviorValue
-        4) 最后 commit。
+        4) 最后 commit，返回新建实体数。
+
+        模板及其属性/行为定义一次预加载；实体用一条多行 INSERT 写入并回读 ID，
+        类别关联、属性值、行为值各用一次 executemany 写入。
         """
+        for attempt in range(2):
+            try:
+                count = self._replicate_templates(scenario_id, template_ids)
+                self.session.commit()
+                print(f"复制完成: scenario_id={scenario_id} 已新增 {count} 个entity。")
+                return count
+            except _BulkIdMismatch as e:
+                self.session.rollback()
+                if attempt:
+                    raise
+                print(f"批量插入实体时 ID 段被并发写入打乱（{e}），重试一次。")
+            except Exception:
+                self.session.rollback()
+                raise
+
+    def _replicate_templates(self, scenario_id: int, template_ids: Optional[List[int]]) -> int:
+        session = self.session
 
         # 0. 找到目标场景
-        scenario_obj = self.session.query(Scenario).get(scenario_id)
+        scenario_obj = session.get(Scenario, scenario_id)
         if not scenario_obj:
             raise ValueError(f"Scenario(id={scenario_id}) not found.")
 
-        # 1. 获取要复制的所有模板 (可根据业务需求，添加 filter)
-        all_templates = self.session.query(Template).all()
-
-        # 2. 遍历模板，新建实体
-        for tpl in all_templates:
-            # 2.1 创建一个 entity 对象
-            new_entity = Entity(
-                entity_name=f"{tpl.template_name}_复制品",
-                entity_type_id=tpl.entity_type_id,
-                scenario_id=scenario_obj.scenario_id,
-                create_time=datetime.utcnow(),
-                update_time=datetime.utcnow()
-            )
-            self.session.add(new_entity)
-            self.session.flush()  # 拿到 new_entity.entity_id
-
-            # 2.2 附加模板的 category 到新实体上
-            #     template.category_id -> 找到 Category 后 append
-            cat_obj = self.session.query(Category).get(tpl.category_id)
-            if cat_obj:
-                new_entity.categories.append(cat_obj)
+        # 1. 获取要复制的所有模板，连同属性、行为定义一起加载
+        query = session.query(Template).options(
+            selectinload(Template.attribute_definitions),
+            selectinload(Template.behavior_definitions)
+        )
+        if template_ids is not None:
+            query = query.filter(Template.template_id.in_(template_ids))
+        all_templates = query.order_by(Template.template_id).all()
+        if not all_templates:
+            return 0
 
-            # 2.3 遍历 template.attribute_definitions，对每条都创建 AttributeValue
+        # 2. 实体一次插入
+        current_time = datetime.datetime.utcnow()
+        entity_rows = [{
+            "entity_name": f"{tpl.template_name}_复制品",
+            "entity_type_id": tpl.entity_type_id,
+            "scenario_id": scenario_obj.scenario_id,
+            "create_time": current_time,
+            "update_time": current_time
+        } for tpl in all_templates]
+        entity_ids = self._bulk_insert_ids(session, Entity.__table__, Entity.entity_id,
+                                           entity_rows, ["entity_name", "scenario_id"])
+
+        # 3. 类别关联、属性值、行为值
+        category_rows, attribute_rows, behavior_rows = [], [], []
+        for tpl, entity_id in zip(all_templates, entity_ids):
+            # template.category_id 为非空外键，直接关联
+            category_rows.append({"entity_id": entity_id, "category_id": tpl.category_id})
             for attr_def in tpl.attribute_definitions:
-                av = AttributeValue(
-                    entity_id=new_entity.entity_id,
-                    attribute_definition_id=attr_def.attribute_definition_id,
-                    attribute_value=attr_def.default_value,  # 可以用默认值，也可设为 None
-                    create_time=datetime.utcnow(),
-                    update_time=datetime.utcnow()
-                )
-                self.session.add(av)
-                # 不一定要 flush()，可留到 commit 一并提交
-
-            # 2.4 遍历 template.behavior_definitions，对每条都创建 BehaviorValue
+                attribute_rows.append({
+                    "entity_id": entity_id,
+                    "attribute_definition_id": attr_def.attribute_definition_id,
+                    "attribute_value": attr_def.default_value,  # 可以用默认值，也可设为 None
+                    "create_time": current_time,
+                    "update_time": current_time
+                })
             for bhv_def in tpl.behavior_definitions:
-                bv = BehaviorValue(
-                    behavior_definition_id=bhv_def.behavior_definition_id,
-                    subject_entity_id=new_entity.entity_id,
-                    create_time=datetime.utcnow(),
-                    update_time=datetime.utcnow()
+                behavior_rows.append({
+                    "behavior_definition_id": bhv_def.behavior_definition_id,
+                    "subject_entity_id": entity_id,
+                    "create_time": current_time,
+                    "update_time": current_time
+                })
+
+        session.execute(entity_category.insert(), category_rows)
+        if attribute_rows:
+            session.execute(AttributeValue.__table__.insert(), attribute_rows)
+        if behavior_rows:
+            session.execute(BehaviorValue.__table__.insert(), behavior_rows)
+        return len(entity_ids)
+
+    def clone_scenario(self, source_scenario_id: int, scenario_name: str,
+                       scenario_description: Optional[str] = None) -> Scenario:
+        """
+        整体复制一个想定：实体（含父子关系）、类别关联、属性值、行为值及其引用。
+
+        各表均在数据库端用 INSERT ... SELECT 复制，旧 ID -> 新 ID 的映射放在临时表中，
+        引用关系通过与映射表 JOIN 改写到新实体上；引用本想定以外实体的保持原值。
+        贝叶斯网络、本体与后验数据属于生成结果，不复制，需在新想定中重新生成。
+        """
+        session = self.session
+        try:
+            source = session.get(Scenario, source_scenario_id)
+            if not source:
+                raise ValueError(f"Scenario(id={source_scenario_id}) not found.")
+            current_time = datetime.datetime.utcnow()
+            new_scenario = Scenario(
+                scenario_name=scenario_name,
+                scenario_description=source.scenario_description if scenario_description is None
+                else scenario_description,
+                scenario_create_time=current_time,
+                scenario_update_time=current_time,
+                emergency_id=source.emergency_id
+            )
+            session.add(new_scenario)
+            session.flush()
+            params = {"src": source_scenario_id, "dst": new_scenario.scenario_id, "now": current_time}
+
+            # 1. 实体：按旧 ID 顺序插入，新 ID 随之递增，按序号一一对应
+            session.execute(text(
+                "INSERT INTO entity (entity_name, entity_type_id, entity_parent_id, scenario_id, create_time, update_time) "
+                "SELECT entity_name, entity_type_id, NULL, :dst, :now, :now "
+                "FROM entity WHERE scenario_id = :src ORDER BY entity_id"
+            ), params)
+            entity_map = self._create_id_map(
+                session, "tmp_entity_map",
+                "SELECT entity_id FROM entity WHERE scenario_id = :src ORDER BY entity_id",
+                "SELECT entity_id FROM entity WHERE scenario_id = :dst ORDER BY entity_id",
+                params)
+            # 父子关系在 Python 中改写后用一条 executemany UPDATE 写回
+            # （MySQL 不允许在同一语句中两次引用同一张临时表，不能用映射表自连接）
+            parent_rows = session.execute(text(
+                "SELECT entity_id, entity_parent_id FROM entity "
+                "WHERE scenario_id = :src AND entity_parent_id IS NOT NULL"
+            ), params).all()
+            parent_updates = [{"b_entity_id": entity_map[entity_id], "b_parent_id": entity_map[parent_id]}
+                              for entity_id, parent_id in parent_rows if parent_id in entity_map]
+            if parent_updates:
+                session.execute(
+                    Entity.__table__.update()
+                    .where(Entity.entity_id == bindparam("b_entity_id"))
+                    .values(entity_parent_id=bindparam("b_parent_id")),
+                    parent_updates
                 )
-                self.session.add(bv)
+            session.execute(text(
+                "INSERT INTO entity_category (entity_id, category_id) "
+                "SELECT m.new_id, ec.category_id FROM entity_category ec "
+                "JOIN tmp_entity_map m ON m.old_id = ec.entity_id"
+            ))
 
-        # 3. 一次性 commit
-        self.session.commit()
-        print(f"复制完成: scenario_id={scenario_id} 已新增 {len(all_templates)} 个entity。")
+            # 2. 属性值及其引用
+            session.execute(text(
+                "INSERT INTO attribute_value (entity_id, attribute_definition_id, attribute_name, attribute_value, "
+                "create_time, update_time) "
+                "SELECT m.new_id, av.attribute_definition_id, av.attribute_name, av.attribute_value, :now, :now "
+                "FROM attribute_value av JOIN tmp_entity_map m ON m.old_id = av.entity_id "
+                "ORDER BY av.attribute_value_id"
+            ), params)
+            self._create_id_map(session, "tmp_attribute_value_map",
+                                "SELECT av.attribute_value_id FROM attribute_value av "
+                                "JOIN entity e ON e.entity_id = av.entity_id "
+                                "WHERE e.scenario_id = :src ORDER BY av.attribute_value_id",
+                                "SELECT av.attribute_value_id FROM attribute_value av "
+                                "JOIN entity e ON e.entity_id = av.entity_id "
+                                "WHERE e.scenario_id = :dst ORDER BY av.attribute_value_id",
+                                params)
+            session.execute(text(
+                "INSERT INTO attribute_value_reference (attribute_value_id, referenced_entity_id) "
+                "SELECT vm.new_id, COALESCE(em.new_id, r.referenced_entity_id) "
+                "FROM attribute_value_reference r "
+                "JOIN tmp_attribute_value_map vm ON vm.old_id = r.attribute_value_id "
+                "LEFT JOIN tmp_entity_map em ON em.old_id = r.referenced_entity_id"
+            ))
+
+            # 3. 行为值及其引用
+            session.execute(text(
+                "INSERT INTO behavior_value (behavior_definition_id, subject_entity_id, behavior_name, "
+                "create_time, update_time) "
+                "SELECT bv.behavior_definition_id, m.new_id, bv.behavior_name, :now, :now "
+                "FROM behavior_value bv JOIN tmp_entity_map m ON m.old_id = bv.subject_entity_id "
+                "ORDER BY bv.behavior_value_id"
+            ), params)
+            self._create_id_map(session, "tmp_behavior_value_map",
+                                "SELECT bv.behavior_value_id FROM behavior_value bv "
+                                "JOIN entity e ON e.entity_id = bv.subject_entity_id "
+                                "WHERE e.scenario_id = :src ORDER BY bv.behavior_value_id",
+                                "SELECT bv.behavior_value_id FROM behavior_value bv "
+                                "JOIN entity e ON e.entity_id = bv.subject_entity_id "
+                                "WHERE e.scenario_id = :dst ORDER BY bv.behavior_value_id",
+                                params)
+            session.execute(text(
+                "INSERT INTO behavior_value_reference (behavior_value_id, object_entity_id) "
+                "SELECT vm.new_id, COALESCE(em.new_id, r.object_entity_id) "
+                "FROM behavior_value_reference r "
+                "JOIN tmp_behavior_value_map vm ON vm.old_id = r.behavior_value_id "
+                "LEFT JOIN tmp_entity_map em ON em.old_id = r.object_entity_id"
+            ))
+
+            for table in ("tmp_entity_map", "tmp_attribute_value_map", "tmp_behavior_value_map"):
+                session.execute(text(f"DROP TEMPORARY TABLE IF EXISTS {table}"))
+            session.commit()
+            session.refresh(new_scenario)
+            print(f"想定复制完成: {source_scenario_id} -> {new_scenario.scenario_id}")
+            return new_scenario
+        except Exception:
+            session.rollback()
+            for table in ("tmp_entity_map", "tmp_attribute_value_map", "tmp_behavior_value_map"):
+                session.execute(text(f"DROP TEMPORARY TABLE IF EXISTS {table}"))
+            raise
+
+    @staticmethod
+    def _create_id_map(session: Session, table: str, old_sql: str, new_sql: str,
+                       params: Dict[str, Any]) -> Dict[int, int]:
+        """按顺序对齐旧/新 ID，写入临时映射表 table(old_id, new_id)，并返回 {旧 ID: 新 ID}"""
+        old_ids = session.execute(text(old_sql), params).scalars().all()
+        new_ids = session.execute(text(new_sql), params).scalars().all()
+        if len(old_ids) != len(new_ids):
+            raise _BulkIdMismatch(f"{table}: {len(old_ids)} -> {len(new_ids)}")
+        session.execute(text(f"DROP TEMPORARY TABLE IF EXISTS {table}"))
+        session.execute(text(f"CREATE TEMPORARY TABLE {table} (old_id INT PRIMARY KEY, new_id INT NOT NULL)"))
+        if old_ids:
+            session.execute(text(f"INSERT INTO {table} (old_id, new_id) VALUES (:old_id, :new_id)"),
+                            [{"old_id": o, "new_id": n} for o, n in zip(old_ids, new_ids)])
+        return dict(zip(old_ids, new_ids))
 
     def populate_owl_database(self, session, scenario_id, owl_dir):
         # 1. Insert OWL files
@@ -858,82 +1423,95 @@ class ScenarioController(QObject):
                     self.process_owl_structure(session, structure, owl.owl_id)
 
     def process_owl_structure(self,session, structure, owl_id):
-        # Keep track of class IDs for parent relationships
-        class_map = {}
+        """
+        将本体结构 JSON 批量写入 owl_class / owl_class_attribute / owl_class_behavior。
+
+        类用一次 executemany 插入，再按 owl_id 一次取回 名称 -> ID 映射（owl_id 为本事务新建，
+        不会混入其他数据）；父类关系一次批量 UPDATE；属性与行为各一次 executemany 插入。
+        """
         print(f"structure: {structure}")
+        if not structure:
+            return
 
         # First pass: Create all classes
-        for class_name, class_data in structure.items():
-            owl_class = OwlClass(
-                owl_class_name=class_name,
-                owl_id=owl_id
-            )
-            session.add(owl_class)
-            session.flush()
-            class_map[class_name] = owl_class.owl_class_id
+        session.execute(OwlClass.__table__.insert(),
+                        [{"owl_class_name": class_name, "owl_id": owl_id} for class_name in structure])
+        class_map = dict(session.execute(
+            select(OwlClass.owl_class_name, OwlClass.owl_class_id).where(OwlClass.owl_id == owl_id)
+        ).all())
 
         # Second pass: Set parent relationships
-        for class_name, class_data in structure.items():
-            if 'parent_class' in class_data and class_data['parent_class'] in class_map:
-                owl_class = session.query(OwlClass).filter_by(
-                    owl_class_name=class_name,
-                    owl_id=owl_id
-                ).first()
-                if owl_class:
-                    owl_class.owl_class_parent = class_map[class_data['parent_class']]
+        parent_rows = [
+            {"b_class_id": class_map[class_name], "b_parent_id": class_map[class_data['parent_class']]}
+            for class_name, class_data in structure.items()
+            if 'parent_class' in class_data and class_data['parent_class'] in class_map
+        ]
+        if parent_rows:
+            session.execute(
+                OwlClass.__table__.update()
+                .where(OwlClass.owl_class_id == bindparam("b_class_id"))
+                .values(owl_class_parent=bindparam("b_parent_id")),
+                parent_rows
+            )
 
         # Third pass: Add properties
         current_time = datetime.datetime.utcnow()
+        attribute_rows, behavior_rows = [], []
 
         for class_name, class_data in structure.items():
-            if 'properties' in class_data:
-                owl_class = session.query(OwlClass).filter_by(
-                    owl_class_name=class_name,
-                    owl_id=owl_id
-                ).first()
-
-                if owl_class:
-                    for prop in class_data['properties']:
-                        # 处理 None 和列表
-                        if prop['property_value'] is None:
-                            value = ""
-                        elif isinstance(prop['property_value'], list):
-                            value = ", ".join(map(str, prop['property_value']))  # 转换为字符串并用逗号分隔
-                        else:
-                            # 取'_'之前的部分
-                            value = str(prop['property_value'])
-                        if prop['property_type'].lower() == 'datatypeproperty':
-                            # Add attribute
-                            attr = OwlClassAttribute(
-                                owl_class_attribute_name=prop['property_name'].split('_')[0],
-                                owl_class_attribute_range=prop['property_range'],
-                                owl_class_attribute_value=value,
-                                owl_class_id=owl_class.owl_class_id,
-                                create_time=current_time,
-                                update_time=current_time
-                            )
-                            session.add(attr)
-
-                        elif prop['property_type'].lower() == 'objectproperty':
-                            # Add behavior
-                            value = str(prop['property_value'])
-                            behavior = OwlClassBehavior(
-                                owl_class_behavior_name=prop['property_name'].split('_')[0],
-                                owl_class_behavior_range=prop['property_domain'][0],
-                                owl_class_behavior_value=value,
-                                owl_class_id=owl_class.owl_class_id,
-                                create_time=current_time,
-                                update_time=current_time
-                            )
-                            session.add(behavior)
+            for prop in class_data.get('properties', []):
+                # 处理 None 和列表
+                if prop['property_value'] is None:
+                    value = ""
+                elif isinstance(prop['property_value'], list):
+                    value = ", ".join(map(str, prop['property_value']))  # 转换为字符串并用逗号分隔
+                else:
+                    value = str(prop['property_value'])
+                if prop['property_type'].lower() == 'datatypeproperty':
+                    # Add attribute
+                    attribute_rows.append({
+                        "owl_class_attribute_name": prop['property_name'].split('_')[0],
+                        "owl_class_attribute_range": prop['property_range'],
+                        "owl_class_attribute_value": value,
+                        "owl_class_id": class_map[class_name],
+                        "create_time": current_time,
+                        "update_time": current_time
+                    })
+                elif prop['property_type'].lower() == 'objectproperty':
+                    # Add behavior
+                    behavior_rows.append({
+                        "owl_class_behavior_name": prop['property_name'].split('_')[0],
+                        "owl_class_behavior_range": prop['property_domain'][0],
+                        "owl_class_behavior_value": str(prop['property_value']),
+                        "owl_class_id": class_map[class_name],
+                        "create_time": current_time,
+                        "update_time": current_time
+                    })
+
+        if attribute_rows:
+            session.execute(OwlClassAttribute.__table__.insert(), attribute_rows)
+        if behavior_rows:
+            session.execute(OwlClassBehavior.__table__.insert(), behavior_rows)
+        print(f"owl_id={owl_id}: 写入 {len(class_map)} 个类、{len(attribute_rows)} 个属性、{len(behavior_rows)} 个行为")
 
     def generate_model_save_to_database(self):
-        session = self.session
+        """界面线程中用共享会话写入 OWL 数据，完成后刷新界面"""
+        try:
+            self.save_model_to_database(self.session, self.current_scenario.scenario_id)
+            self.on_model_saved(True)
+        except Exception as e:
+            print(f"插入OWL数据时出错: {e}")
+            self.on_model_saved(False)
 
+    def save_model_to_database(self, session: Session, scenario_id: int) -> None:
+        """
+        用传入的会话删除该想定原有的 OWL 记录并重新写入，出错时回滚并抛出。
+        不访问界面对象，后台任务可用自己的会话调用。
+        """
         # Delete existing OWL records
         try:
             rows_deleted = session.query(Owl).filter(
-                Owl.scenario_id == self.current_scenario.scenario_id
+                Owl.scenario_id == scenario_id
             ).delete()
 
             if rows_deleted > 0:
@@ -946,30 +1524,40 @@ class ScenarioController(QObject):
         except Exception as e:
             session.rollback()
             print(f"删除记录时出错: {e}")
-            return
+            raise
 
         # Add new records
         owl_dir = os.path.abspath(os.path.join(
             os.path.dirname(__file__),
-            f'../data/sysml2/{self.current_scenario.scenario_id}/owl'
+            f'../data/sysml2/{scenario_id}/owl'
         ))
 
         try:
-            self.populate_owl_database(session, self.current_scenario.scenario_id, owl_dir)
+            self.populate_owl_database(session, scenario_id, owl_dir)
             session.commit()
-            self.status_bar.owl_status_label.setText(self.tr("OWL 文件状态: ") + self.tr("就绪"))
             print("OWL数据库更新成功")
-            self.update_gui_with_data()
-
-        except Exception as e:
+        except Exception:
             session.rollback()
-            print(f"插入OWL数据时出错: {e}")
+            raise
+
+    @Slot(bool)
+    def on_model_saved(self, success: bool):
+        """OWL 数据写入后（可能由后台会话完成）刷新共享会话与界面"""
+        if not success:
             self.status_bar.owl_status_label.setText(self.tr("OWL 文件状态: ") + self.tr("错误"))
+            return
+        # 结束共享会话当前的事务，之后的查询能看到其他会话提交的数据
+        self.session.commit()
+        self.status_bar.owl_status_label.setText(self.tr("OWL 文件状态: ") + self.tr("就绪"))
+        self.update_gui_with_data()
 
     def fetch_ontology_data(self,session, scenario_id: int) -> Tuple[Dict, Dict, Dict, Dict]:
         """
         从数据库获取数据并组织成所需的字典格式
 
+        类、属性、行为各用一次查询整体取出后在内存中分组；
+        结果按 (scenario_id, OWL 记录) 缓存，OWL 重新生成后记录 ID 改变，缓存自然失效。
+
         Returns:
             Tuple[Dict, Dict, Dict, Dict]: 返回SVG_FILES, CLASS_OPTIONS, ATTRIBUTE_SAMPLE_DATA, BEHAVIOR_SAMPLE_DATA
         """
@@ -982,54 +1570,69 @@ class ScenarioController(QObject):
             4: "情景本体"
         }
 
+        owl_records = session.query(Owl.owl_id, Owl.owl_type_id, Owl.owl_file_path) \
+            .filter_by(scenario_id=scenario_id).order_by(Owl.owl_id).all()
+        cache_key = (scenario_id, tuple(owl.owl_id for owl in owl_records))
+        cached = _ontology_cache.get(cache_key)
+        if cached is None:
+            cached = self._load_ontology_data(session, owl_records, owl_type_to_name)
+            # 同一想定只保留最新一代
+            for key in [k for k in _ontology_cache if k[0] == scenario_id]:
+                del _ontology_cache[key]
+            _ontology_cache[cache_key] = cached
+
+        # 界面会就地修改这些字典（如切换英文键），返回副本
+        return copy.deepcopy(cached)
+
+    @staticmethod
+    def _load_ontology_data(session, owl_records, owl_type_to_name) -> Tuple[Dict, Dict, Dict, Dict]:
+        """按 OWL 记录批量加载类、属性与行为"""
         svg_files = {}
-        owl_records = session.query(Owl).filter_by(scenario_id=scenario_id).all()
-
         for owl in owl_records:
             owl_name = owl_type_to_name.get(owl.owl_type_id)
             if owl_name:
                 # 获取完整的SVG路径
-                svg_path = owl.owl_file_path.replace('.owl', '.svg')
-                svg_files[owl_name] = svg_path
+                svg_files[owl_name] = owl.owl_file_path.replace('.owl', '.svg')
 
         # 2. 获取每个本体的类
         class_options = {name: [] for name in owl_type_to_name.values()}
+        owl_ids = [owl.owl_id for owl in owl_records]
+        classes = session.query(OwlClass.owl_class_id, OwlClass.owl_class_name, OwlClass.owl_id) \
+            .filter(OwlClass.owl_id.in_(owl_ids)).order_by(OwlClass.owl_class_id).all() if owl_ids else []
 
+        classes_by_owl = defaultdict(list)
+        for cls in classes:
+            classes_by_owl[cls.owl_id].append(cls.owl_class_name)
         for owl in owl_records:
             owl_name = owl_type_to_name.get(owl.owl_type_id)
             if owl_name:
-                # 查询该owl_id下的所有类
-                classes = session.query(OwlClass).filter_by(owl_id=owl.owl_id).all()
-                class_options[owl_name] = [cls.owl_class_name for cls in classes]
+                class_options[owl_name] = classes_by_owl.get(owl.owl_id, [])
+
+        # 3./4. 获取每个类的属性与行为（只添加有属性/行为的类，同名类以后出现的为准）
+        class_ids = [cls.owl_class_id for cls in classes]
+        attributes_by_class = defaultdict(list)
+        behaviors_by_class = defaultdict(list)
+        if class_ids:
+            for attr in session.query(OwlClassAttribute.owl_class_id, OwlClassAttribute.owl_class_attribute_name,
+                                      OwlClassAttribute.owl_class_attribute_range,
+                                      OwlClassAttribute.owl_class_attribute_value) \
+                    .filter(OwlClassAttribute.owl_class_id.in_(class_ids)) \
+                    .order_by(OwlClassAttribute.owl_class_attribute_id):
+                attributes_by_class[attr[0]].append(tuple(attr[1:]))
+            for behavior in session.query(OwlClassBehavior.owl_class_id, OwlClassBehavior.owl_class_behavior_name,
+                                          OwlClassBehavior.owl_class_behavior_range,
+                                          OwlClassBehavior.owl_class_behavior_value) \
+                    .filter(OwlClassBehavior.owl_class_id.in_(class_ids)) \
+                    .order_by(OwlClassBehavior.owl_class_behavior_id):
+                behaviors_by_class[behavior[0]].append(tuple(behavior[1:]))
 
-        # 3. 获取每个类的属性
         attribute_sample_data = {}
-
-        # 获取所有类
-        all_classes = session.query(OwlClass).join(Owl).filter(Owl.scenario_id == scenario_id).all()
-
-        for cls in all_classes:
-            # 查询该类的所有属性
-            attributes = session.query(OwlClassAttribute).filter_by(owl_class_id=cls.owl_class_id).all()
-
-            if attributes:  # 只添加有属性的类
-                attribute_sample_data[cls.owl_class_name] = [
-                    (attr.owl_class_attribute_name, attr.owl_class_attribute_range, attr.owl_class_attribute_value)
-                    for attr in attributes
-                ]
-
-        # 4. 获取每个类的行为
         behavior_sample_data = {}
-
-        for cls in all_classes:
-            # 查询该类的所有行为
-            behaviors = session.query(OwlClassBehavior).filter_by(owl_class_id=cls.owl_class_id).all()
-
-            if behaviors:  # 只添加有行为的类
-                behavior_sample_data[cls.owl_class_name] = [
-                    (behavior.owl_class_behavior_name, behavior.owl_class_behavior_range, behavior.owl_class_behavior_value)
-                    for behavior in behaviors
-                ]
+        for cls in classes:
+            if attributes_by_class.get(cls.owl_class_id):
+                attribute_sample_data[cls.owl_class_name] = attributes_by_class[cls.owl_class_id]
+            if behaviors_by_class.get(cls.owl_class_id):
+                behavior_sample_data[cls.owl_class_name] = behaviors_by_class[cls.owl_class_id]
 
         return svg_files, class_options, attribute_sample_data, behavior_sample_data
 
@@ -1058,113 +1661,173 @@ class ScenarioController(QObject):
         except Exception as e:
             return False, f"数据获取失败: {str(e)}"
 
-    def generate_bayes_save_to_database(self):
+    def generate_bayes_save_to_database(self, analyzer=None):
         """
-        生成贝叶斯网络并保存到数据库
-        如果当前场景已存在贝叶斯网络则更新，否则创建新的
+        生成贝叶斯网络并保存到数据库（界面线程，使用共享会话），见 save_bayes_to_database
         """
-        try:
-            # 查找当前场景的贝叶斯网络
-            existing_bayes = self.session.query(Bayes).filter(
-                Bayes.scenario_id == self.current_scenario.scenario_id
-            ).first()
-
-            # 获取新的文件路径
-            bn_file = os.path.abspath(os.path.join(
-                os.path.dirname(__file__),
-                f'../data/bn/{self.current_scenario.scenario_id}/bn_structure.bif'
-            ))
+        return self.save_bayes_to_database(self.session, self.current_scenario.scenario_id, analyzer)
 
-            if existing_bayes:
-                # 更新现有贝叶斯网络的文件路径
-                existing_bayes.bayes_file_path = bn_file
-                bayes = existing_bayes
-            else:
-                # 创建新的贝叶斯网络记录
-                bayes = Bayes(
-                    bayes_file_path=bn_file,
-                    scenario_id=self.current_scenario.scenario_id
-                )
-                self.session.add(bayes)
-
-            self.session.flush()  # 获取bayes_id
-
-            # 读取节点数据
-            node_data_file = os.path.join(os.path.dirname(bn_file), 'node_data.json')
-            with open(node_data_file, 'r') as f:
-                node_data = json.load(f)
-
-            # 处理节点和状态
-            node_id_map = {}  # 用于存储节点名称到ID的映射
-            current_time = datetime.datetime.utcnow()
+    def save_bayes_to_database(self, session: Session, scenario_id: int, analyzer=None) -> Dict[str, int]:
+        """
+        生成贝叶斯网络并保存到数据库
+        如果当前场景已存在贝叶斯网络则更新，否则创建新的
 
-            for node_name, states in node_data.items():
-                # 查找或创建节点
-                existing_node = self.session.query(BayesNode).filter(
-                    BayesNode.bayes_id == bayes.bayes_id,
-                    BayesNode.bayes_node_name == node_name
-                ).first()
+        节点、状态先验与有向边直接取自内存中的网络（analyzer.network_description()），
+        与库中一次预取的 BayesNode/BayesNodeState/BayesNodeTarget 比对后，
+        在一个事务内批量插入、更新、删除，往返次数与网络规模无关。
+        未传入 analyzer 时从 bn_structure.bif 与 node_data.json 读取网络。
+        不访问界面对象，后台任务可用自己的会话调用。
+        """
+        # 获取新的文件路径
+        bn_file = os.path.abspath(os.path.join(
+            os.path.dirname(__file__),
+            f'../data/bn/{scenario_id}/bn_structure.bif'
+        ))
+        if analyzer is not None:
+            node_states, arcs = analyzer.network_description()
+        else:
+            node_states, arcs = self._read_saved_network(bn_file)
 
-                if existing_node:
-                    node = existing_node
-                else:
-                    node = BayesNode(
-                        bayes_node_name=node_name,
-                        bayes_id=bayes.bayes_id
-                    )
-                    self.session.add(node)
-                    self.session.flush()
-
-                node_id_map[node_name] = node.bayes_node_id
-
-                # 更新节点状态
-                for state_name, probability in states:
-                    existing_state = self.session.query(BayesNodeState).filter(
-                        BayesNodeState.bayes_node_id == node.bayes_node_id,
-                        BayesNodeState.bayes_node_state_name == state_name
-                    ).first()
-
-                    if existing_state:
-                        # 更新现有状态的概率
-                        existing_state.bayes_node_state_prior_probability = float(probability)
-                        existing_state.update_time = current_time
-                    else:
-                        # 创建新的状态
-                        node_state = BayesNodeState(
-                            bayes_node_state_name=state_name,
-                            bayes_node_state_prior_probability=float(probability),
-                            bayes_node_id=node.bayes_node_id,
-                            create_time=current_time,
-                            update_time=current_time
-                        )
-                        self.session.add(node_state)
-
-            # 如果是新建的贝叶斯网络，需要创建节点关系
-            if not existing_bayes:
-                # 读取bif文件获取节点关系
-                with open(bn_file, 'r') as f:
-                    bif_content = f.read()
-
-                # 使用正则表达式提取节点关系
-                pattern = r'probability\s*\(\s*(\w+)\s*\|\s*([^)]+)\)'
-                relationships = re.findall(pattern, bif_content)
-
-                # 创建节点关系记录
-                for target, sources in relationships:
-                    target_node = target.strip()
-                    source_nodes = [s.strip() for s in sources.split(',')]
-
-                    for source_node in source_nodes:
-                        node_target = BayesNodeTarget(
-                            source_node_id=node_id_map[source_node],
-                            target_node_id=node_id_map[target_node]
-                        )
-                        self.session.add(node_target)
+        for attempt in range(2):
+            try:
+                bayes_id, stats = self._sync_bayes_network(session, scenario_id, bn_file, node_states, arcs)
+                session.commit()
+                invalidate_bayes_state_cache(bayes_id)
+                # 删除的状态会级联删除 posteriori_data，预案摘要缓存也需失效
+                invalidate_plan_cache(scenario_id)
+                print(f"贝叶斯网络数据已成功保存到数据库，实际变更: {stats}")
+                return stats
+            except _BulkIdMismatch as e:
+                session.rollback()
+                if attempt:
+                    raise
+                print(f"批量插入节点时 ID 段被并发写入打乱（{e}），重试一次。")
+            except Exception as e:
+                session.rollback()
+                print(f"保存贝叶斯网络数据时出错: {e}")
+                raise
+
+    @staticmethod
+    def _read_saved_network(bn_file: str) -> Tuple[Dict[str, List[Tuple[str, float]]], List[Tuple[str, str]]]:
+        """从已保存的网络文件读取节点状态先验与有向边"""
+        import pyAgrum as gum
+
+        with open(os.path.join(os.path.dirname(bn_file), 'node_data.json'), 'r') as f:
+            node_states = {name: [(state, float(p)) for state, p in states] for name, states in json.load(f).items()}
+        bn = gum.loadBN(bn_file)
+        arcs = [(bn.variable(tail).name(), bn.variable(head).name()) for tail, head in bn.arcs()]
+        return node_states, arcs
+
+    def _sync_bayes_network(self, session: Session, scenario_id: int, bn_file: str,
+                            node_states: Dict[str, List[Tuple[str, float]]],
+                            arcs: List[Tuple[str, str]]) -> Tuple[int, Dict[str, int]]:
+        """按差异把网络同步到 bayes_node / bayes_node_state / bayes_node_target，返回 (bayes_id, 变更统计)"""
+        current_time = datetime.datetime.utcnow()
 
-            self.session.commit()
-            print("贝叶斯网络数据已成功保存到数据库")
+        # 查找当前场景的贝叶斯网络
+        bayes = session.query(Bayes).filter(
+            Bayes.scenario_id == scenario_id
+        ).first()
+        if bayes:
+            # 更新现有贝叶斯网络的文件路径
+            bayes.bayes_file_path = bn_file
+        else:
+            # 创建新的贝叶斯网络记录
+            bayes = Bayes(
+                bayes_file_path=bn_file,
+                scenario_id=scenario_id
+            )
+            session.add(bayes)
+        session.flush()  # 获取bayes_id
+        bayes_id = bayes.bayes_id
+
+        # 1. 一次预取现有节点、状态与边
+        node_id_map = dict(session.execute(
+            select(BayesNode.bayes_node_name, BayesNode.bayes_node_id).where(BayesNode.bayes_id == bayes_id)
+        ).all())
+        current_states: Dict[Tuple[int, str], Tuple[int, float]] = {}
+        current_arcs = set()
+        if node_id_map:
+            node_ids = list(node_id_map.values())
+            for state_id, node_id, state_name, prior in session.execute(
+                    select(BayesNodeState.bayes_node_state_id, BayesNodeState.bayes_node_id,
+                           BayesNodeState.bayes_node_state_name, BayesNodeState.bayes_node_state_prior_probability)
+                    .where(BayesNodeState.bayes_node_id.in_(node_ids))):
+                current_states[(node_id, state_name)] = (state_id, prior)
+            current_arcs = set(session.execute(
+                select(BayesNodeTarget.source_node_id, BayesNodeTarget.target_node_id)
+                .where(BayesNodeTarget.source_node_id.in_(node_ids))
+            ).all())
+
+        stats = dict.fromkeys(["nodes_inserted", "nodes_deleted", "states_inserted", "states_updated",
+                               "states_deleted", "arcs_inserted", "arcs_deleted"], 0)
+
+        # 2. 节点：删除网络中已不存在的节点（级联删除其状态、边与后验），插入新节点
+        removed_nodes = [node_id_map.pop(name) for name in list(node_id_map) if name not in node_states]
+        if removed_nodes:
+            session.execute(BayesNode.__table__.delete().where(BayesNode.bayes_node_id.in_(removed_nodes)))
+        new_names = [name for name in node_states if name not in node_id_map]
+        new_ids = self._bulk_insert_ids(
+            session, BayesNode.__table__, BayesNode.bayes_node_id,
+            [{"bayes_node_name": name, "bayes_id": bayes_id} for name in new_names],
+            ["bayes_node_name", "bayes_id"]
+        )
+        node_id_map.update(zip(new_names, new_ids))
+        stats["nodes_inserted"], stats["nodes_deleted"] = len(new_ids), len(removed_nodes)
+
+        # 3. 状态：先验有变化的更新，新状态插入，多余状态删除
+        removed_node_ids = set(removed_nodes)
+        wanted_states = set()
+        state_inserts, state_updates = [], []
+        for node_name, states in node_states.items():
+            node_id = node_id_map[node_name]
+            for state_name, probability in states:
+                wanted_states.add((node_id, state_name))
+                current = current_states.get((node_id, state_name))
+                if current is None:
+                    state_inserts.append({
+                        "bayes_node_state_name": state_name,
+                        "bayes_node_state_prior_probability": float(probability),
+                        "bayes_node_id": node_id,
+                        "create_time": current_time,
+                        "update_time": current_time
+                    })
+                elif current[1] != float(probability):
+                    state_updates.append({"b_state_id": current[0], "b_prior": float(probability),
+                                          "b_update_time": current_time})
+        stale_states = [state_id for key, (state_id, _) in current_states.items()
+                        if key not in wanted_states and key[0] not in removed_node_ids]
+        if stale_states:
+            session.execute(BayesNodeState.__table__.delete()
+                            .where(BayesNodeState.bayes_node_state_id.in_(stale_states)))
+        if state_updates:
+            session.execute(
+                BayesNodeState.__table__.update()
+                .where(BayesNodeState.bayes_node_state_id == bindparam("b_state_id"))
+                .values(bayes_node_state_prior_probability=bindparam("b_prior"),
+                        update_time=bindparam("b_update_time")),
+                state_updates
+            )
+        if state_inserts:
+            session.execute(BayesNodeState.__table__.insert(), state_inserts)
+        stats["states_inserted"], stats["states_updated"], stats["states_deleted"] = \
+            len(state_inserts), len(state_updates), len(stale_states)
+
+        # 4. 有向边：与网络中的边集合比对
+        wanted_arcs = {(node_id_map[source], node_id_map[target]) for source, target in arcs}
+        current_arcs = {arc for arc in current_arcs
+                        if arc[0] not in removed_node_ids and arc[1] not in removed_node_ids}
+        stale_arcs = [{"b_source": s, "b_target": t} for s, t in current_arcs - wanted_arcs]
+        if stale_arcs:
+            session.execute(
+                BayesNodeTarget.__table__.delete()
+                .where(BayesNodeTarget.source_node_id == bindparam("b_source"),
+                       BayesNodeTarget.target_node_id == bindparam("b_target")),
+                stale_arcs
+            )
+        new_arcs = [{"source_node_id": s, "target_node_id": t} for s, t in sorted(wanted_arcs - current_arcs)]
+        if new_arcs:
+            session.execute(BayesNodeTarget.__table__.insert(), new_arcs)
+        stats["arcs_inserted"], stats["arcs_deleted"] = len(new_arcs), len(stale_arcs)
 
-        except Exception as e:
-            self.session.rollback()
-            print(f"保存贝叶斯网络数据时出错: {e}")
-            raise
\ No newline at end of file
+        return bayes_id, stats
@@ -2,47 +2,190 @@
 # @Time    : 12/3/2024 10:06 AM
 # @FileName: db_manager_config.py
 # @Software: PyCharm
+import time
+from contextlib import contextmanager
+
 from sqlalchemy import create_engine
 from sqlalchemy.dialects.mysql import pymysql
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.orm import sessionmaker, declarative_base, scoped_session
 from sqlalchemy import create_engine, text
-from models.models import Base
+from models.models import Base, SCHEMA_VERSION
 from database import seed_data
 
+# 连接池默认参数，可在 config.json 的 database.pool 中覆盖
+DEFAULT_POOL_CONFIG = {
+    "pool_size": 5,          # 常驻连接数
+    "max_overflow": 10,      # 高峰时允许额外打开的连接数
+    "pool_recycle": 3600,    # 连接存活秒数，需小于 MySQL wait_timeout
+    "pool_pre_ping": True,   # 取用前探活，避免拿到已被服务器断开的连接
+    "pool_timeout": 30       # 连接池耗尽时等待秒数
+}
+
+
+def load_pool_config(pool=None):
+    """合并默认值与传入（或 config.json 中）的连接池配置"""
+    if pool is None:
+        try:
+            from utils.get_config import get_cfg
+            pool = get_cfg().get("database", {}).get("pool", {})
+        except (OSError, ValueError):
+            pool = {}
+    config = dict(DEFAULT_POOL_CONFIG)
+    config.update({k: v for k, v in (pool or {}).items() if k in DEFAULT_POOL_CONFIG})
+    return config
+
 
 class DatabaseManager:
     def __init__(self):
         self.engine = None
         self.SessionLocal = None
+        # 线程本地会话，供后台线程使用
+        self.ScopedSession = None
+        # 启动各阶段耗时（秒），按执行顺序记录
+        self.startup_timings = {}
 
-    def connect(self, username, password, host, port, database):
+    @contextmanager
+    def _timed(self, phase):
+        start = time.perf_counter()
         try:
-            connection_string = f"mysql+mysqlconnector://{username}:{password}@{host}:{port}/{database}?charset=utf8mb4"
-            self.engine = create_engine(connection_string, echo=False)
+            yield
+        finally:
+            self.startup_timings[phase] = time.perf_counter() - start
 
-            # ✅ 设置 lc_messages
-            with self.engine.connect() as connection:
-                connection.execute(text("SET lc_messages = 'en_US'"))
+    def connect(self, username, password, host, port, database, pool=None):
+        self.startup_timings = {}
+        try:
+            with self._timed("连接"):
+                connection_string = f"mysql+mysqlconnector://{username}:{password}@{host}:{port}/{database}?charset=utf8mb4"
+                pool_config = load_pool_config(pool)
+                self.engine = create_engine(connection_string, echo=False, **pool_config)
+
+                # ✅ 设置 lc_messages
+                with self.engine.connect() as connection:
+                    connection.execute(text("SET lc_messages = 'en_US'"))
 
-            self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+                self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+                self.ScopedSession = scoped_session(self.SessionLocal)
 
-            # 创建所有表（如果尚未创建）
-            Base.metadata.create_all(bind=self.engine)
+            with self._timed("版本检查"):
+                current_version = self.get_schema_version()
 
-            # 添加种子数据
-            seed_data.seed_all(self.get_session())
+            if current_version == SCHEMA_VERSION:
+                print(f"数据库版本 {current_version} 已是最新，跳过建表与种子数据检查")
+            else:
+                print(f"数据库版本 {current_version} -> {SCHEMA_VERSION}，执行建表与种子数据初始化")
+                # 创建所有表（如果尚未创建）
+                with self._timed("建表"):
+                    Base.metadata.create_all(bind=self.engine)
+                    self.ensure_posteriori_unique_key()
 
+                # 添加种子数据，与版本号在同一事务内提交
+                with self._timed("种子数据"):
+                    seed_data.seed_all(self.get_session(), version=SCHEMA_VERSION)
+
+            self.report_startup_timings()
             print("数据库连接成功")
             return True, "连接成功"
         except Exception as e:
             return False, str(e)
 
+    def get_schema_version(self):
+        """
+        读取 schema_version 表中的版本号；表不存在（新库或旧版本库）或没有记录时返回 None
+        """
+        try:
+            with self.engine.connect() as connection:
+                return connection.execute(text(
+                    "SELECT schema_version FROM schema_version WHERE schema_version_id = 1"
+                )).scalar()
+        except ProgrammingError:
+            return None
+
+    def report_startup_timings(self):
+        """打印启动各阶段耗时"""
+        total = sum(self.startup_timings.values())
+        detail = ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in self.startup_timings.items())
+        print(f"数据库启动耗时 {total:.3f}s（{detail}）")
+
+    def ensure_posteriori_unique_key(self):
+        """
+        create_all 不会修改已存在的表：旧库的 posteriori_data 在此补建
+        (plan_id, bayes_node_state_id, time_stage) 唯一键，重复记录只保留最新一条。
+        """
+        with self.engine.begin() as connection:
+            exists = connection.execute(text(
+                "SELECT COUNT(*) FROM information_schema.statistics "
+                "WHERE table_schema = DATABASE() AND table_name = 'posteriori_data' "
+                "AND index_name = 'uq_posteriori_plan_state_stage'"
+            )).scalar()
+            if exists:
+                return
+            connection.execute(text(
+                "DELETE p1 FROM posteriori_data p1 JOIN posteriori_data p2 "
+                "ON p1.plan_id = p2.plan_id AND p1.bayes_node_state_id = p2.bayes_node_state_id "
+                "AND p1.time_stage = p2.time_stage AND p1.posteriori_data_id < p2.posteriori_data_id"
+            ))
+            connection.execute(text(
+                "ALTER TABLE posteriori_data ADD CONSTRAINT uq_posteriori_plan_state_stage "
+                "UNIQUE (plan_id, bayes_node_state_id, time_stage)"
+            ))
+            print("已为 posteriori_data 添加唯一键 uq_posteriori_plan_state_stage")
+
     def get_session(self):
         if self.SessionLocal:
             return self.SessionLocal()
         else:
             return None
 
+    @contextmanager
+    def session_scope(self):
+        """
+        短生命周期会话：正常结束时提交，异常时回滚，最后关闭并归还连接。
+        后台任务应使用它（或 thread_session），不要与界面线程共用同一个 Session。
+
+            with db_manager.session_scope() as session:
+                ...
+        """
+        if not self.SessionLocal:
+            raise RuntimeError("数据库尚未连接")
+        session = self.SessionLocal()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def thread_session(self):
+        """当前线程专属的会话（scoped_session），线程结束前应调用 remove_thread_session"""
+        if not self.ScopedSession:
+            raise RuntimeError("数据库尚未连接")
+        return self.ScopedSession()
+
+    def remove_thread_session(self):
+        """关闭并丢弃当前线程的会话"""
+        if self.ScopedSession:
+            self.ScopedSession.remove()
+
+    @staticmethod
+    def expire_idle_session(session):
+        """
+        长生命周期会话的定期清理：没有未提交的修改时 expire_all，
+        释放已加载对象的属性数据（身份映射本身为弱引用），下次访问时重新读取。
+        有待写入的修改时跳过，返回是否执行了清理。
+        """
+        if session is None or session.new or session.dirty or session.deleted:
+            return False
+        session.expire_all()
+        return True
+
+    def pool_status(self):
+        """连接池状态描述，便于排查连接耗尽"""
+        return self.engine.pool.status() if self.engine else "未连接"
+
     def get_connection_info(self):
         """
         使用 SQLAlchemy 查询数据库信息。
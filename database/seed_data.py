@@ -26,6 +26,7 @@ from models.models import (
     OwlType,
     Scenario,
     Template,
+    SchemaVersion,
     # 如果有 Entity、BehaviorValue、PosterioriData、Bayes 等模型需要插入，可一并导入
 )
 
@@ -69,7 +70,7 @@ def seed_attribute_aspect(session):
         ),
     ]
     session.bulk_save_objects(data)
-    session.commit()
+    session.flush()
 
 
 def seed_attribute_code(session):
@@ -166,7 +167,7 @@ def seed_attribute_code(session):
             update_time=r[4]
         ))
     session.bulk_save_objects(objs)
-    session.commit()
+    session.flush()
 
 
 def seed_attribute_code_name(session):
@@ -217,7 +218,7 @@ def seed_attribute_code_name(session):
             attribute_name=name
         ))
     session.bulk_save_objects(objs)
-    session.commit()
+    session.flush()
 
 
 def seed_category(session):
@@ -239,7 +240,7 @@ def seed_category(session):
                  create_time='2025-01-15 10:37:38', update_time='2025-01-15 10:37:38'),
     ]
     session.bulk_save_objects(data)
-    session.commit()
+    session.flush()
 
 
 def seed_emergency(session):
@@ -254,7 +255,7 @@ def seed_emergency(session):
         emergency_update_time='2025-01-15 11:11:07'
     )
     session.add(e)
-    session.commit()
+    session.flush()
 
 
 def seed_scenario(session):
@@ -288,7 +289,7 @@ def seed_owl_type(session):
             update_time=utime
         ))
     session.bulk_save_objects(objs)
-    session.commit()
+    session.flush()
 
 
 def seed_enum_value(session):
@@ -376,7 +377,7 @@ def seed_enum_value(session):
             update_time=utime
         ))
     session.bulk_save_objects(objs)
-    session.commit()
+    session.flush()
 
 
 def seed_template(session):
@@ -437,7 +438,7 @@ def seed_template(session):
             update_time=utime
         ))
     session.bulk_save_objects(objs)
-    session.commit()
+    session.flush()
 
 
 def seed_template_attribute_definition(session):
@@ -465,7 +466,7 @@ def seed_template_attribute_definition(session):
         tmpl = session.query(Template).filter_by(template_id=template_id).one()
         ad = session.query(AttributeDefinition).filter_by(attribute_definition_id=attr_def_id).one()
         tmpl.attribute_definitions.append(ad)
-    session.commit()
+    session.flush()
 
 
 def seed_template_behavior_definition(session):
@@ -482,7 +483,7 @@ def seed_template_behavior_definition(session):
         tmpl = session.query(Template).filter_by(template_id=template_id).one()
         bd = session.query(BehaviorDefinition).filter_by(behavior_definition_id=behavior_def_id).one()
         tmpl.behavior_definitions.append(bd)
-    session.commit()
+    session.flush()
 
 def seed_attribute_type(session):
     """
@@ -546,7 +547,7 @@ def seed_attribute_type(session):
         ),
     ]
     session.bulk_save_objects(data)
-    session.commit()
+    session.flush()
 
 
 def seed_entity_type(session):
@@ -590,7 +591,7 @@ def seed_entity_type(session):
                    create_time='2025-01-15 11:10:57', update_time='2025-01-15 11:15:32'),
     ]
     session.bulk_save_objects(data)
-    session.commit()
+    session.flush()
 
 
 def seed_attribute_definition(session):
@@ -713,7 +714,7 @@ def seed_attribute_definition(session):
             update_time=utime
         ))
     session.bulk_save_objects(objs)
-    session.commit()
+    session.flush()
 
 
 
@@ -851,7 +852,7 @@ def seed_behavior_code(session):
     ]
 
     session.bulk_save_objects(data)
-    session.commit()
+    session.flush()
 
 def seed_behavior_definition(session):
     """
@@ -895,7 +896,7 @@ def seed_behavior_definition(session):
             update_time=utime
         ))
     session.bulk_save_objects(objs)
-    session.commit()
+    session.flush()
 
 
 def seed_behavior_name_code(session):
@@ -928,14 +929,13 @@ def seed_behavior_name_code(session):
     # 一次插入一条记录，这样如果有某条记录出错，其他记录还能继续
     for code_id, name in raw_data:
         try:
-            obj = BehaviorNameCode(
-                behavior_code_id=code_id,
-                behavior_name=name
-            )
-            session.add(obj)
-            session.commit()
+            # 每条记录一个保存点，出错只回滚这一条，不影响整个初始化事务
+            with session.begin_nested():
+                session.add(BehaviorNameCode(
+                    behavior_code_id=code_id,
+                    behavior_name=name
+                ))
         except Exception as e:
-            session.rollback()
             print(f"Error inserting behavior_name_code: {code_id}, {name}")
             print(f"Error: {str(e)}")
             # 继续处理下一条记录
@@ -950,9 +950,21 @@ def has_records(session, model):
     return session.query(model).first() is not None
 
 
-def seed_all(session):
+def stamp_schema_version(session, version):
+    """写入（或更新）库结构 / 种子数据版本号，随当前事务一起提交"""
+    row = session.get(SchemaVersion, 1)
+    if row is None:
+        session.add(SchemaVersion(schema_version_id=1, schema_version=version))
+    else:
+        row.schema_version = version
+    session.flush()
+
+
+def seed_all(session, version=None):
     """
-    依照外键依赖顺序执行所有插入函数，如果表中已有数据则跳过
+    依照外键依赖顺序执行所有插入函数，如果表中已有数据则跳过。
+    所有插入在一个事务内完成；传入 version 时同一事务内写入版本号，
+    下次启动版本一致即可跳过整个检查。
     """
     try:
         print("开始数据初始化...")
@@ -1060,6 +1072,9 @@ def seed_all(session):
         else:
             print("Template 相关表已有数据，跳过")
 
+        if version is not None:
+            stamp_schema_version(session, version)
+        session.commit()
         print("数据初始化完成！")
 
     except Exception as e:
@@ -3,6 +3,7 @@ import multiprocessing
 import sys
 import json
 import os
+import time
 
 from PySide6.QtCore import QTranslator, QCoreApplication
 from PySide6.QtGui import Qt
@@ -20,7 +21,15 @@ DEFAULT_CONFIG = {
         "password": "your_password",
         "host": "localhost",
         "port": 3306,
-        "database": "your_database"
+        "database": "your_database",
+        "pool": {
+            "pool_size": 5,
+            "max_overflow": 10,
+            "pool_recycle": 3600,
+            "pool_pre_ping": True,
+            "pool_timeout": 30
+        },
+        "session_expire_interval_seconds": 300
     },
     "i18n": {
         "language": "zh_CN",
@@ -44,7 +53,21 @@ DEFAULT_CONFIG = {
         "HazardElement": "    state def HazardStates{\n        entry; then DriveState;\n        state DriveState;\n        accept Collide\n            then CollideState;\n        state CollideState;\n        accept Spill\n            then SpillState;\n        state SpillState;\n    }",
         "ResponsePlanElement": "    state def aidStates{\n        entry; then idleState;\n        state idleState;\n        accept Aid:Action\n            then implementState;\n        state implementState;\n    }\n    state def firefightingStates{\n        entry; then idleState;\n        state idleState;\n        accept FireFighting:Action\n            then implementState;\n        state implementState;\n    }\n    state def towStates{\n        entry; then idleState;\n        state idleState;\n        accept Tow:Action\n            then implementState;\n        state implementState;\n    }\n    state def rescueStates{\n        entry; then idleState;\n        state idleState;\n        accept Rescue:Action\n            then implementState;\n        state implementState;\n    }"
     },
+    "model": {
+        "export_tables": []
+    },
     "emergency_speed": 60,
+    "travel_time": {
+        "backend": "amap",
+        "matrix_path": "",
+        "detour_factor": 1.3,
+        "min_interval_seconds": 0.2,
+        "request_timeout_seconds": 10,
+        "cache_enabled": True,
+        "cache_ttl_hours": 168,
+        "cache_max_entries": 100000,
+        "max_workers": 4
+    },
     "llm": {
         "enable": False,
         "default_model": "DeepSeek-V3",
@@ -189,11 +212,14 @@ def main(app):
         password=password,
         host=host,
         port=port,
-        database=database
+        database=database,
+        pool=db_config.get("pool", {})
     )
     if success:
+        window_start = time.perf_counter()
         window = MainWindow(db_manager)
         window.showMaximized()
+        print(f"主窗口初始化耗时 {time.perf_counter() - window_start:.3f}s")
     else:
         print(f"未发现 config.json，准备创建默认配置文件")
         CustomErrorDialog("错误", f"无法连接到数据库：{message}", parent=None).show_dialog()
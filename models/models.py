@@ -15,6 +15,7 @@ from sqlalchemy import (
     ForeignKey,
     JSON,
     Table,
+    UniqueConstraint,
     func
 )
 from sqlalchemy.orm import relationship, backref
@@ -749,6 +750,9 @@ class OwlClassBehavior(Base):
 
 class PosterioriData(Base):
     __tablename__ = 'posteriori_data'
+    __table_args__ = (
+        UniqueConstraint('plan_id', 'bayes_node_state_id', 'time_stage', name='uq_posteriori_plan_state_stage'),
+    )
     posteriori_data_id = Column(Integer, primary_key=True, autoincrement=True)
     posterior_probability = Column(Float, nullable=False)
     bayes_node_state_id = Column(Integer, ForeignKey('bayes_node_state.bayes_node_state_id',
@@ -811,3 +815,19 @@ class Template(Base):
         secondary=template_behavior_definition,
         back_populates='templates'
     )
+
+
+# 库结构 / 种子数据版本：修改模型定义或种子数据后递增，启动时版本一致则跳过建表与种子检查
+SCHEMA_VERSION = 1
+
+
+class SchemaVersion(Base):
+    __tablename__ = 'schema_version'
+    schema_version_id = Column(Integer, primary_key=True, autoincrement=False)
+    schema_version = Column(Integer, nullable=False)
+    update_time = Column(
+        DateTime,
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now()
+    )
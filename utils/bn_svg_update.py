@@ -2,8 +2,15 @@
 # @Time    : 1/21/2025 10:27 AM
 # @FileName: bn_svg_update.py
 # @Software: PyCharm
+import hashlib
+import itertools
 import json
 import os
+import pickle
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from typing import Dict, List, Tuple, Optional, Any
 import xml.etree.ElementTree as ET
 from xml.dom import minidom
@@ -19,6 +26,7 @@ from scipy.stats import truncnorm, norm
 
 from views.dialogs.custom_warning_dialog import CustomWarningDialog
 from views.dialogs.missing_data_dialog import get_missing_rows, MissingDataDialog
+from utils.job_runner import on_gui_thread
 
 
 class FuzzyEvaluation:
@@ -76,6 +84,394 @@ class FuzzyEvaluation:
         defuzzified_possibility = ((a4 + a3) ** 2 - a4 * a3 - (a1 + a2) ** 2 + a1 * a2) / (3 * (a4 + a3 - a2 - a1))
         return defuzzified_possibility
 
+    def fuzzy_tensor(self, ratings: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        将 (行 × 专家) 的评估等级矩阵转换为梯形模糊数张量
+
+        Returns:
+            Tuple: (行 × 专家 × 4) 的模糊数张量、可用专家掩码、无法识别的评估值掩码
+        """
+        ratings = np.asarray(ratings, dtype=object)
+        present = pd.notna(ratings)
+        keys = np.char.strip(np.where(present, ratings, '').astype(str))
+
+        levels = list(self.mapping_evaluation_fuzzy)
+        table = np.array([self.mapping_evaluation_fuzzy[level] for level in levels] + [(0.0,) * 4])
+        codes = pd.Series(keys.ravel()).map({level: i for i, level in enumerate(levels)})
+        codes = codes.fillna(len(levels)).to_numpy(dtype=int).reshape(keys.shape)
+
+        mask = codes < len(levels)
+        return table[codes], mask, present & ~mask
+
+    def similarity_batch(self, fuzzy: np.ndarray, mask: np.ndarray) -> Tuple[
+        np.ndarray, np.ndarray, np.ndarray]:
+        """
+        calculate_similarity 的批量版本，一次处理整张评估表
+
+        Args:
+            fuzzy: (行 × 专家 × 4) 模糊数张量
+            mask: (行 × 专家) 可用专家掩码
+
+        Returns:
+            Tuple: 两两相似度 (行 × 专家 × 专家)、平均相似度与相对相似度 (行 × 专家)，
+                   缺失专家对应位置为 0
+        """
+        n_experts = fuzzy.shape[1]
+        similarity = 1 - np.abs(fuzzy[:, :, None, :] - fuzzy[:, None, :, :]).sum(axis=-1) / fuzzy.shape[-1]
+        pair_mask = mask[:, :, None] & mask[:, None, :] & ~np.eye(n_experts, dtype=bool)
+
+        n_pairs = pair_mask.sum(axis=-1)
+        pair_sum = np.where(pair_mask, similarity, 0.0).sum(axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            avg_similarity = np.where(n_pairs > 0, pair_sum / np.maximum(n_pairs, 1), 1.0)
+            avg_similarity = np.where(mask, avg_similarity, 0.0)
+            # 与 calculate_similarity 保持一致：第 i 位专家除以前 i 位（含自身）平均相似度之和
+            relative_similarity = np.where(mask, avg_similarity / np.cumsum(avg_similarity, axis=1), 0.0)
+
+        return np.where(pair_mask, similarity, 0.0), avg_similarity, relative_similarity
+
+    def aggregate_batch(self, fuzzy: np.ndarray, mask: np.ndarray, expert_weights: np.ndarray,
+                        beta: float = 0.5) -> np.ndarray:
+        """
+        calculate_aggregated_fuzzy 的批量版本：加权聚合并清晰化整张评估表
+
+        Args:
+            fuzzy: (行 × 专家 × 4) 模糊数张量
+            mask: (行 × 专家) 可用专家掩码
+            expert_weights: (专家,) 或 (行 × 专家) 的专家权重
+            beta: 专家权重与相对相似度的折中系数
+
+        Returns:
+            np.ndarray: 每行的清晰化概率，没有任何专家数据的行为 NaN
+        """
+        expert_weights = np.asarray(expert_weights, dtype=float)
+        if expert_weights.shape[-1] != mask.shape[1]:
+            raise ValueError(f"专家权重数量 {expert_weights.shape[-1]} 与专家列数量 {mask.shape[1]} 不一致")
+        _, _, relative_similarity = self.similarity_batch(fuzzy, mask)
+        weights = np.broadcast_to(expert_weights, mask.shape)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cc = np.where(mask, beta * weights + (1 - beta) * relative_similarity, 0.0)
+            weight = cc / cc.sum(axis=1, keepdims=True)
+            a1, a2, a3, a4 = np.moveaxis((weight[:, :, None] * np.where(mask[:, :, None], fuzzy, 0.0)).sum(axis=1),
+                                         -1, 0)
+            defuzzified = ((a4 + a3) ** 2 - a4 * a3 - (a1 + a2) ** 2 + a1 * a2) / (3 * (a4 + a3 - a2 - a1))
+
+        return np.where(mask.any(axis=1), defuzzified, np.nan)
+
+
+class InferenceEngine:
+    """
+    长驻推理引擎：每个网络只编译一次联结树，之后按证据差量（增、改、删单个节点）更新，
+    并按证据签名缓存各节点的后验概率。
+    """
+
+    def __init__(self, bn: gum.BayesNet, max_cached: int = 256):
+        """
+        Args:
+            bn (gum.BayesNet): 贝叶斯网络
+            max_cached (int): 最多缓存的证据签名数量（LRU 淘汰）
+        """
+        self.bn = bn
+        self.max_cached = max_cached
+        self.ie = None
+        self.evidence: Dict[str, Any] = {}
+        self._soft_evidence: Dict[str, Tuple[float, ...]] = {}
+        self._cache: "OrderedDict[Tuple, Dict[str, np.ndarray]]" = OrderedDict()
+        self.compile()
+
+    def compile(self) -> None:
+        """编译联结树，并缓存无证据时的先验后验"""
+        self.ie = gum.LazyPropagation(self.bn)
+        self.evidence = {}
+        self._soft_evidence = {}
+        self._cache.clear()
+        self.ie.makeInference()
+        self._cache[()] = self._read_all_posteriors()
+
+    def invalidate(self) -> None:
+        """网络结构或CPT发生变化后调用，丢弃已编译的引擎与缓存（硬证据与软证据在重新编译后恢复）"""
+        evidence = self.evidence.copy()
+        soft_evidence = self._soft_evidence.copy()
+        self.compile()
+        if evidence:
+            self.set_evidence(evidence)
+        for node_name, likelihood in soft_evidence.items():
+            self.add_soft_evidence(node_name, np.array(likelihood))
+
+    @property
+    def signature(self) -> Tuple:
+        """当前证据的签名（用作缓存键）"""
+        hard = tuple(sorted(self.evidence.items()))
+        soft = tuple(sorted(self._soft_evidence.items()))
+        return hard + (("__soft__", soft),) if soft else hard
+
+    def set_evidence(self, evidence: Optional[Dict[str, Any]]) -> None:
+        """
+        以差量方式设置硬证据：只对新增、变化、删除的节点调用 add/chg/eraseEvidence，
+        联结树不会被重新编译。与每次新建 LazyPropagation 的语义一致，
+        不在新证据中的软证据也会被清除。
+        """
+        evidence = dict(evidence or {})
+
+        for node_name in [n for n in self.evidence if n not in evidence]:
+            self.ie.eraseEvidence(node_name)
+            del self.evidence[node_name]
+        for node_name in [n for n in self._soft_evidence if n not in evidence]:
+            self.ie.eraseEvidence(node_name)
+            del self._soft_evidence[node_name]
+
+        for node_name, value in evidence.items():
+            if node_name in self._soft_evidence:
+                # 软证据替换为硬证据
+                self.ie.chgEvidence(node_name, value)
+                del self._soft_evidence[node_name]
+            elif node_name not in self.evidence:
+                self.ie.addEvidence(node_name, value)
+            elif self.evidence[node_name] != value:
+                self.ie.chgEvidence(node_name, value)
+            else:
+                continue
+            self.evidence[node_name] = value
+
+    def clear_evidence(self) -> None:
+        """清除所有证据（包括软证据）"""
+        if self._soft_evidence:
+            self.ie.eraseAllEvidence()
+            self.evidence = {}
+            self._soft_evidence = {}
+        else:
+            self.set_evidence({})
+
+    def add_soft_evidence(self, node_name: str, likelihood: np.ndarray) -> None:
+        """添加软证据（似然向量），并纳入证据签名"""
+        if node_name in self.evidence:
+            del self.evidence[node_name]
+        if self.ie.hasEvidence(node_name):
+            self.ie.chgEvidence(node_name, list(likelihood))
+        else:
+            self.ie.addEvidence(node_name, list(likelihood))
+        self._soft_evidence[node_name] = tuple(float(v) for v in likelihood)
+
+    def posterior(self, node_name: str) -> np.ndarray:
+        """获取当前证据下某节点的后验（命中缓存时不触发消息传递）"""
+        return self.posteriors([node_name])[node_name]
+
+    def posteriors(self, nodes: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """获取当前证据下多个节点的后验，默认返回全部节点"""
+        key = self.signature
+        cached = self._cache.get(key)
+        if cached is None:
+            cached = self._read_all_posteriors()
+            self._cache[key] = cached
+            while len(self._cache) > self.max_cached:
+                # 保留先验结果，淘汰最久未使用的签名
+                oldest = next(k for k in self._cache if k != ())
+                del self._cache[oldest]
+        else:
+            self._cache.move_to_end(key)
+
+        if nodes is None:
+            return dict(cached)
+        return {node_name: cached[node_name] for node_name in nodes}
+
+    def prior(self, node_name: str) -> np.ndarray:
+        """获取无证据时的先验后验"""
+        return self._cache[()][node_name]
+
+    def prior_view(self) -> "PosteriorView":
+        """先验后验的只读视图，可直接传给 NetworkVisualizer"""
+        return PosteriorView(self._cache[()])
+
+    def _read_all_posteriors(self) -> Dict[str, np.ndarray]:
+        """执行一次消息传递并读取所有节点的后验（数组设为只读，调用方修改缓存会直接报错）"""
+        self.ie.makeInference()
+        result = {}
+        for node in self.bn.nodes():
+            node_name = self.bn.variable(node).name()
+            posterior = np.array(self.ie.posterior(node_name).tolist())
+            posterior.flags.writeable = False
+            result[node_name] = posterior
+        return result
+
+    def query_layout(self, query_nodes: List[str]) -> List[Tuple[str, str]]:
+        """
+        批量结果的列布局：按 query_nodes 顺序依次展开每个节点的全部状态
+
+        Returns:
+            List[Tuple[str, str]]: 每一列对应的 (节点名, 状态标签)
+        """
+        layout = []
+        for node_name in query_nodes:
+            var = self.bn.variable(node_name)
+            layout.extend((node_name, var.label(i)) for i in range(var.domainSize()))
+        return layout
+
+    def evaluate_batch(self, evidence_list: List[Dict[str, Any]], query_nodes: List[str],
+                       processes: int = 0) -> np.ndarray:
+        """
+        批量计算多组证据下查询节点的后验，不写文件、不渲染
+
+        证据组先按统一的节点顺序排序，使相邻两组共享尽可能长的前缀，
+        这样每次只需对末尾少数节点做 chgEvidence。结果仍按输入顺序返回。
+
+        Args:
+            evidence_list: 证据字典列表
+            query_nodes: 需要返回后验的节点
+            processes: 大于 1 时按进程池分块并行计算
+
+        Returns:
+            np.ndarray: 形状为 (len(evidence_list), 列数)，列布局见 query_layout
+        """
+        n_columns = len(self.query_layout(query_nodes))
+        result = np.empty((len(evidence_list), n_columns))
+        if not evidence_list:
+            return result
+
+        node_order = {self.bn.variable(node).name(): i for i, node in enumerate(self.bn.nodes())}
+        # 网络中不存在的节点排在最后，由逐组推理时的异常处理返回 NaN 行，而不是中断整个批量
+        unknown = len(node_order)
+
+        def prefix_key(index: int) -> Tuple:
+            items = sorted(evidence_list[index].items(), key=lambda kv: (node_order.get(kv[0], unknown), str(kv[0])))
+            return tuple((node_order.get(name, unknown), str(name), str(value)) for name, value in items)
+
+        order = sorted(range(len(evidence_list)), key=prefix_key)
+        ordered_evidence = [evidence_list[i] for i in order]
+
+        if processes and processes > 1 and len(ordered_evidence) > processes:
+            # 排序后再切成连续的块，保证每个进程内部仍保持前缀局部性
+            chunk_size = -(-len(ordered_evidence) // processes)
+            chunks = [ordered_evidence[i:i + chunk_size]
+                      for i in range(0, len(ordered_evidence), chunk_size)]
+            with ProcessPoolExecutor(max_workers=processes, initializer=_batch_worker_init,
+                                     initargs=(bn_to_spec(self.bn),)) as pool:
+                rows = np.vstack(list(pool.map(_batch_worker_run, chunks,
+                                               itertools.repeat(query_nodes))))
+        else:
+            rows = self._evaluate_ordered(ordered_evidence, query_nodes)
+
+        result[order] = rows
+        return result
+
+    def sweep(self, nodes: List[str], query_nodes: List[str],
+              base_evidence: Optional[Dict[str, Any]] = None, processes: int = 0) -> np.ndarray:
+        """
+        遍历 nodes 所有状态组合（itertools.product 顺序，最后一个节点变化最快）
+
+        返回数组可 reshape 为 (*各节点状态数, 列数)，base_evidence 作为每组的公共证据。
+        """
+        base_evidence = dict(base_evidence or {})
+        domains = [range(self.bn.variable(node_name).domainSize()) for node_name in nodes]
+        evidence_list = [{**base_evidence, **dict(zip(nodes, combo))}
+                         for combo in itertools.product(*domains)]
+        return self.evaluate_batch(evidence_list, query_nodes, processes=processes)
+
+    def _evaluate_ordered(self, evidence_list: List[Dict[str, Any]],
+                          query_nodes: List[str]) -> np.ndarray:
+        """按给定顺序逐组差量推理，结束后恢复原有证据（含软证据）；无效证据对应的行为 NaN"""
+        n_columns = len(self.query_layout(query_nodes))
+        saved_evidence = self.evidence.copy()
+        saved_soft_evidence = self._soft_evidence.copy()
+        rows = np.empty((len(evidence_list), n_columns))
+        try:
+            for i, evidence in enumerate(evidence_list):
+                try:
+                    self.set_evidence(evidence)
+                    cached = self._cache.get(self.signature)
+                    if cached is None:
+                        # 批量路径只读查询节点，也不写入缓存，避免冲掉交互式查询的结果
+                        self.ie.makeInference()
+                        rows[i] = np.concatenate([self.ie.posterior(node_name).tolist()
+                                                  for node_name in query_nodes])
+                    else:
+                        rows[i] = np.concatenate([cached[node_name] for node_name in query_nodes])
+                except Exception as e:
+                    print(f"Error during batch inference for evidence {evidence}: {e}")
+                    rows[i] = np.nan
+        finally:
+            self.set_evidence(saved_evidence)
+            for node_name, likelihood in saved_soft_evidence.items():
+                self.add_soft_evidence(node_name, np.array(likelihood))
+        return rows
+
+
+def bn_to_spec(bn: gum.BayesNet) -> Dict[str, Any]:
+    """
+    将贝叶斯网络转换为可 pickle 的纯数据描述（变量、状态标签、弧和CPT数组），
+    用于进程间传递或缓存。
+    """
+    variables = []
+    arcs = []
+    cpts = {}
+    for node in bn.nodes():
+        var = bn.variable(node)
+        node_name = var.name()
+        variables.append((node_name, var.description(),
+                          [var.label(i) for i in range(var.domainSize())]))
+        cpt = bn.cpt(node_name)
+        # 按 CPT 维度顺序记录父节点，重建时以相同顺序加弧
+        for i in range(1, cpt.nbrDim()):
+            arcs.append((cpt.variable(i).name(), node_name))
+        cpts[node_name] = (list(cpt.var_names), np.array(cpt.toarray(), dtype=float))
+    return {'variables': variables, 'arcs': arcs, 'cpts': cpts}
+
+
+def bn_from_spec(spec: Dict[str, Any]) -> gum.BayesNet:
+    """根据 bn_to_spec 的结果重建贝叶斯网络"""
+    bn = gum.BayesNet('ScenarioDeductionBN')
+    for node_name, description, labels in spec['variables']:
+        var = gum.LabelizedVariable(node_name, description, 0)
+        for label in labels:
+            var.addLabel(label)
+        bn.add(var)
+    for tail, head in spec['arcs']:
+        bn.addArc(tail, head)
+    for node_name, (var_names, values) in spec['cpts'].items():
+        cpt = bn.cpt(node_name)
+        axes = [var_names.index(name) for name in cpt.var_names]
+        cpt.fillWith(np.transpose(values, axes).flatten().tolist())
+    return bn
+
+
+_batch_engine: Optional[InferenceEngine] = None
+
+
+def _batch_worker_init(spec: Dict[str, Any]) -> None:
+    """进程池初始化：每个进程只重建并编译一次网络"""
+    global _batch_engine
+    _batch_engine = InferenceEngine(bn_from_spec(spec), max_cached=1)
+
+
+def _batch_worker_run(evidence_list: List[Dict[str, Any]], query_nodes: List[str]) -> np.ndarray:
+    return _batch_engine._evaluate_ordered(evidence_list, query_nodes)
+
+
+# 编译后网络缓存的文件名与格式版本（格式变化时递增，使旧缓存失效）
+BN_CACHE_FILE = 'bn_compiled.pkl'
+BN_CACHE_VERSION = 1
+
+
+def file_digest(path: str) -> str:
+    """计算文件内容的 SHA-256，文件不存在时返回空字符串"""
+    if not path or not os.path.exists(path):
+        return ''
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class PosteriorView:
+    """后验概率的只读视图，提供与 LazyPropagation 相同的 posterior 接口"""
+
+    def __init__(self, posteriors: Dict[str, np.ndarray]):
+        self._posteriors = posteriors
+
+    def posterior(self, node_name: str) -> np.ndarray:
+        return self._posteriors[node_name]
+
 
 class ScenarioResilience:
     """情景韧性分析的主类"""
@@ -87,10 +483,11 @@ class ScenarioResilience:
         Args:
             ontology_path (str): 本体文件路径
         """
-        self.onto = get_ontology(ontology_path).load()
+        self._onto = None  # 延迟加载，命中网络缓存时无需解析本体
         self.bn = gum.BayesNet('ScenarioDeductionBN')
         self.data_properties_info = []
         self.ie = None
+        self.engine: Optional[InferenceEngine] = None  # 长驻推理引擎，见 enable_persistent_inference
         self.fuzzy_evaluator = FuzzyEvaluation()
         self.current_evidence = {}  # 添加追踪当前证据的属性
         self.ontology_path = ontology_path
@@ -141,6 +538,73 @@ class ScenarioResilience:
             "ScenarioResilience": ["RecoveryCapacity", "AdaptionCapacity", "AbsorptionCapacity"]
         }
 
+    @property
+    def onto(self):
+        """本体对象，首次访问时才加载"""
+        if self._onto is None:
+            self._onto = get_ontology(self.ontology_path).load()
+        return self._onto
+
+    def input_hashes(self, prior_path: str, expert_info_path: str,
+                     expert_estimation_path: str) -> Dict[str, str]:
+        """
+        计算构建网络所依赖输入的内容哈希
+
+        Returns:
+            Dict[str, str]: structure（本体）、prior（根节点先验）、cpt（专家信息与评估）三部分的哈希
+        """
+        return {
+            'structure': file_digest(self.ontology_path),
+            'prior': file_digest(prior_path),
+            'cpt': file_digest(expert_info_path) + file_digest(expert_estimation_path),
+        }
+
+    def load_cached_network(self, output_dir: str, hashes: Dict[str, str]) -> List[str]:
+        """
+        从 output_dir 下的缓存加载已构建好的网络（结构、CPT、状态标签）
+
+        Args:
+            output_dir: 网络输出目录（与 bn_structure.bif 同目录）
+            hashes: input_hashes 的结果
+
+        Returns:
+            List[str]: 仍需重建的部分。结构或条件概率输入变化时需完整重建；
+                       仅先验输入变化时只需重新设置根节点先验。
+        """
+        full_rebuild = ['structure', 'prior', 'cpt']
+        cache_path = os.path.join(output_dir, BN_CACHE_FILE)
+        if not os.path.exists(cache_path):
+            return full_rebuild
+
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+        except Exception as e:
+            print(f"读取网络缓存失败，将重新构建: {e}")
+            return full_rebuild
+
+        if cached.get('version') != BN_CACHE_VERSION:
+            return full_rebuild
+        cached_hashes = cached.get('hashes', {})
+        if any(cached_hashes.get(part) != hashes.get(part) for part in ('structure', 'cpt')):
+            return full_rebuild
+
+        self.bn = bn_from_spec(cached['spec'])
+        self._invalidate_engine()
+        print(f"已从缓存加载贝叶斯网络: {cache_path}")
+        return [] if cached_hashes.get('prior') == hashes.get('prior') else ['prior']
+
+    def save_cached_network(self, output_dir: str, hashes: Dict[str, str]) -> str:
+        """将当前网络以二进制形式写入缓存，返回缓存文件路径"""
+        os.makedirs(output_dir, exist_ok=True)
+        cache_path = os.path.join(output_dir, BN_CACHE_FILE)
+        tmp_path = cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'version': BN_CACHE_VERSION, 'hashes': hashes, 'spec': bn_to_spec(self.bn)},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+        return cache_path
+
     def process_expert_evaluation(self, expert_info_path: str, expert_estimation_path: str) -> pd.DataFrame:
         """处理专家评估数据（改进版，允许部分缺失专家数据）"""
         # 读取专家信息和计算权重
@@ -157,9 +621,13 @@ class ScenarioResilience:
         non_expert_columns = [col for col in df.columns if not re.match(r'^E\d+$', col)]
         missing_non_expert = df[non_expert_columns].isna().any(axis=1)
         if missing_non_expert.any():
-            # 这里可以弹出对话框提示用户
-            dialog = MissingDataDialog(df.loc[missing_non_expert, non_expert_columns])
-            dialog.exec()
+            # 这里可以弹出对话框提示用户；后台任务中不能创建窗口，只记录日志
+            if on_gui_thread():
+                dialog = MissingDataDialog(df.loc[missing_non_expert, non_expert_columns])
+                dialog.exec()
+            else:
+                print(f"专家评估数据中有 {int(missing_non_expert.sum())} 行缺少必填项，已舍弃:\n"
+                      f"{df.loc[missing_non_expert, non_expert_columns]}")
             # 根据需求决定是否舍弃这些行
             df = df.loc[~missing_non_expert].copy()
 
@@ -167,39 +635,23 @@ class ScenarioResilience:
         expert_columns = [col for col in df.columns if re.match(r'^E\d+$', col)]
         expert_columns.sort(key=lambda x: int(x[1:]))
 
-        # 对每一行，只提取非空的专家数据及对应权重
-        def extract_fuzzy_and_weights(row: pd.Series) -> pd.Series:
-            fuzzy_values = []
-            used_weights = []
-            for col in expert_columns:
-                val = row[col]
-                if pd.notna(val):
-                    key = str(val).strip()
-                    if key in self.fuzzy_evaluator.mapping_evaluation_fuzzy:
-                        fuzzy_values.append(self.fuzzy_evaluator.mapping_evaluation_fuzzy[key])
-                        # 根据专家列在 expert_columns 中的位置获取对应的权重
-                        expert_index = expert_columns.index(col)
-                        used_weights.append(expert_weights[expert_index])
-                    else:
-                        # 若评估值不在映射中，可选择记录警告或跳过
-                        print(f"Warning: 未识别的评估值 '{key}' 在列 {col}")
-            return pd.Series({'fuzzy': fuzzy_values, 'used_weights': used_weights})
+        # 整张表一次性转换为 (行 × 专家 × 4) 模糊数张量，缺失或无法识别的专家被掩码排除
+        fuzzy, mask, unknown = self.fuzzy_evaluator.fuzzy_tensor(df[expert_columns].to_numpy(dtype=object))
+        for r, c in np.argwhere(unknown):
+            print(f"Warning: 未识别的评估值 '{str(df[expert_columns[c]].iloc[r]).strip()}' 在列 {expert_columns[c]}")
 
-        # 使用新函数生成两个新列：fuzzy 和 used_weights
-        df[['fuzzy', 'used_weights']] = df[expert_columns].apply(extract_fuzzy_and_weights, axis=1)
+        # 专家列按在 expert_columns 中的位置取权重（与逐列处理时一致），专家信息行多于专家列时多余的不参与
+        if len(expert_weights) < len(expert_columns):
+            raise ValueError(f"专家信息表只有 {len(expert_weights)} 位专家的权重，"
+                             f"但评估表有 {len(expert_columns)} 个专家列（{', '.join(expert_columns)}）")
+        column_weights = np.array(expert_weights[:len(expert_columns)], dtype=float)
 
         # 计算条件概率：对每一行，使用仅有的专家数据及对应权重进行聚合
-        condition_probability = []
-        for idx, row in df.iterrows():
-            fuzzy_list = row['fuzzy']
-            weights_list = row['used_weights']
-            if len(fuzzy_list) > 0:
-                prob = self.fuzzy_evaluator.calculate_aggregated_fuzzy(fuzzy_list, weights_list)
-            else:
-                # 若某行完全没有专家数据，可设置默认值或抛出错误
-                prob = 0.0
-                print(f"Warning: 节点 {row['Node']} 的行 {idx} 没有任何专家评估数据")
-            condition_probability.append(prob)
+        condition_probability = self.fuzzy_evaluator.aggregate_batch(fuzzy, mask, column_weights)
+        for r in np.flatnonzero(~mask.any(axis=1)):
+            # 若某行完全没有专家数据，可设置默认值或抛出错误
+            condition_probability[r] = 0.0
+            print(f"Warning: 节点 {df['Node'].iloc[r]} 的行 {df.index[r]} 没有任何专家评估数据")
 
         df['conditonProbability'] = condition_probability
 
@@ -257,7 +709,89 @@ class ScenarioResilience:
 
         return df
 
-    def set_conditional_probabilities(self, df: pd.DataFrame) -> None:
+    def set_conditional_probabilities(self, df: pd.DataFrame, bulk: bool = True) -> None:
+        """
+        设置贝叶斯网络的条件概率表
+
+        Args:
+            df: 专家评估结果（Node, Condition, State, conditonProbability）
+            bulk: 为 True 时每个节点整表构建为 NumPy 数组并一次 fillWith，
+                  否则逐行以字典索引方式写入
+        """
+        if not bulk:
+            self._set_conditional_probabilities_by_row(df)
+            return
+
+        for node, node_df in df.groupby('Node'):
+            try:
+                self._fill_cpt_from_rows(node, node_df)
+            except Exception as e:
+                print(f"批量设置节点 {node} 时出错，改用逐行方式: {e}")
+                self._set_conditional_probabilities_by_row(node_df, verify=False)
+
+        # 完成后验证所有CPT
+        self._verify_all_cpts()
+        self._invalidate_engine()
+
+    def _condition_positions(self, node: str, actual_parents: List[str],
+                             condition_length: int) -> Optional[List[int]]:
+        """
+        返回 actual_parents 中每个父节点在 Condition 元组中的位置；
+        规则与逐行方式一致：优先按 factor_capacity 的顺序，否则按父节点顺序。
+        """
+        if node in self.factor_capacity:
+            expected_parents = self.factor_capacity[node]
+            factor_positions = {parent: i for i, parent in enumerate(expected_parents)
+                                if i < condition_length and parent in actual_parents}
+            if factor_positions and len(factor_positions) == len(actual_parents):
+                return [factor_positions[parent] for parent in actual_parents]
+
+        if condition_length < len(actual_parents):
+            return None
+        return list(range(len(actual_parents)))
+
+    def _fill_cpt_from_rows(self, node: str, node_df: pd.DataFrame) -> None:
+        """将一个节点的全部评估行写成稠密数组（父节点顺序 + 自身状态），一次 fillWith"""
+        node_id = self.bn.idFromName(node)
+        actual_parents = [self.bn.variable(p).name() for p in self.bn.parents(node_id)]
+        layout = actual_parents + [node]
+        shape = [self.bn.variable(name).domainSize() for name in layout]
+
+        cpt = self.bn.cpt(node)
+        var_names = list(cpt.var_names)
+        # 以当前CPT为底，未给出的条件保持原值
+        arr = np.transpose(np.array(cpt.toarray(), dtype=float),
+                           [var_names.index(name) for name in layout]).copy()
+
+        # 每种条件字符串只解析一次
+        parsed = {cond: (ast.literal_eval(cond) if isinstance(cond, str) else cond)
+                  for cond in node_df['Condition'].unique()}
+        conditions = node_df['Condition'].map(parsed)
+        states = node_df['State'].to_numpy(dtype=int)
+        probs = node_df['conditonProbability'].to_numpy(dtype=float)
+
+        lengths = conditions.map(len).to_numpy()
+        index = np.full((len(node_df), len(actual_parents)), -1, dtype=int)
+        for length in np.unique(lengths):
+            rows = lengths == length
+            positions = self._condition_positions(node, actual_parents, int(length))
+            if positions is None:
+                print(f"警告: 节点 {node} 有 {int(rows.sum())} 行条件长度为 {length}，"
+                      f"需要 {len(actual_parents)} 个父节点，已跳过")
+                continue
+            cond_matrix = np.array([tuple(c) for c in conditions[rows]], dtype=int).reshape(-1, int(length))
+            index[rows] = cond_matrix[:, positions]
+
+        full_index = np.column_stack([index, states])
+        valid = ((full_index >= 0) & (full_index < np.array(shape))).all(axis=1)
+        if not valid.all():
+            print(f"警告: 节点 {node} 有 {int((~valid).sum())} 行条件或状态越界，已跳过")
+
+        arr[tuple(full_index[valid].T)] = probs[valid]
+        cpt.fillWith(np.transpose(arr, [layout.index(name) for name in var_names]).flatten().tolist())
+        print(f"节点 {node} 批量写入 {int(valid.sum())} 个条件概率，父节点: {actual_parents}")
+
+    def _set_conditional_probabilities_by_row(self, df: pd.DataFrame, verify: bool = True) -> None:
         """使用字典索引方式设置贝叶斯网络的条件概率表"""
         # 按节点分组处理数据
         grouped_df = df.groupby('Node')
@@ -355,41 +889,31 @@ class ScenarioResilience:
                 import traceback
                 print(traceback.format_exc())
 
-        # 完成后验证所有CPT
-        self._verify_all_cpts()
+        if verify:
+            # 完成后验证所有CPT
+            self._verify_all_cpts()
+            self._invalidate_engine()
 
     def _verify_all_cpts(self):
-        """验证所有节点的CPT是否正确设置和归一化"""
+        """验证所有节点的CPT是否正确设置和归一化（按自身状态轴整体求和）"""
         print("\n验证所有CPT:")
         for node in self.bn.nodes():
             node_name = self.bn.variable(node).name()
-            parent_ids = list(self.bn.parents(node))
+            cpt = self.bn.cpt(node_name)
+            var_names = list(cpt.var_names)
+            totals = np.array(cpt.toarray(), dtype=float).sum(axis=var_names.index(node_name))
 
-            if not parent_ids:  # 根节点
-                probs = self.bn.cpt(node_name).tolist()
-                total = sum(probs)
+            if not list(self.bn.parents(node)):  # 根节点
+                total = float(totals)
                 print(f"根节点 {node_name} 的概率和: {total}")
                 if not abs(total - 1.0) < 1e-10:
                     print(f"警告: 根节点 {node_name} 的概率和不为1")
-            else:
-                # 获取所有父节点的取值范围
-                parent_vars = [self.bn.variable(p) for p in parent_ids]
-                parent_domains = [var.domainSize() for var in parent_vars]
-                parent_names = [var.name() for var in parent_vars]
-
-                # 获取所有可能的父节点组合
-                all_combinations = list(itertools.product(*[range(dom) for dom in parent_domains]))
-
-                for combo in all_combinations:
-                    # 创建条件字典
-                    cond_dict = {parent_names[i]: combo[i] for i in range(len(parent_names))}
-
-                    # 获取该条件下的所有状态概率
-                    probs = self.bn.cpt(node_name)[cond_dict]
-                    total = sum(probs)
+                continue
 
-                    if not abs(total - 1.0) < 1e-10:
-                        print(f"警告: 节点 {node_name} 条件 {cond_dict} 下的概率和为 {total}")
+            parent_names = [name for name in var_names if name != node_name]
+            for combo in np.argwhere(~(np.abs(totals - 1.0) < 1e-10)):
+                cond_dict = {parent_names[i]: int(combo[i]) for i in range(len(parent_names))}
+                print(f"警告: 节点 {node_name} 条件 {cond_dict} 下的概率和为 {totals[tuple(combo)]}")
 
         print("CPT验证完成")
 
@@ -545,6 +1069,8 @@ class ScenarioResilience:
                     print(
                         f"Warning: Column {node_name} not found in the dataframe. Skipping prior probability setting for this node.")
 
+        self._invalidate_engine()
+
     def _set_discrete_prior(self, node_name: str, data: pd.Series) -> None:
         """设置离散变量的先验概率"""
         # category_counts = data.value_counts()
@@ -630,19 +1156,63 @@ class ScenarioResilience:
         """计算截断正态分布中区间的概率"""
         return dist.cdf(end) - dist.cdf(start)
 
+    def enable_persistent_inference(self, max_cached: int = 256) -> InferenceEngine:
+        """
+        开启长驻推理模式：联结树只编译一次，之后的 make_inference 以证据差量更新，
+        并按证据签名缓存后验。网络结构或CPT变化后会自动重新编译。
+        """
+        self.engine = InferenceEngine(self.bn, max_cached=max_cached)
+        self.ie = self.engine.ie
+        return self.engine
+
+    def _invalidate_engine(self) -> None:
+        """CPT 或结构改变后，使长驻引擎重新编译"""
+        if self.engine is not None:
+            if self.engine.bn is not self.bn:
+                # 网络对象已被替换（如从缓存加载），需针对新网络重新编译
+                self.engine = InferenceEngine(self.bn, max_cached=self.engine.max_cached)
+            else:
+                self.engine.invalidate()
+            self.ie = self.engine.ie
+
+    def posterior(self, node_name: str) -> np.ndarray:
+        """获取当前证据下节点的后验概率"""
+        if self.engine is not None:
+            return self.engine.posterior(node_name)
+        return np.array(self.ie.posterior(node_name).tolist())
+
+    def evaluate_batch(self, evidence_list: List[Dict[str, Any]], query_nodes: List[str],
+                       processes: int = 0) -> np.ndarray:
+        """
+        批量计算多组证据下查询节点的后验，复用同一个已编译引擎，无文件和渲染副作用。
+        列布局见 InferenceEngine.query_layout。
+        """
+        engine = self.engine if self.engine is not None else InferenceEngine(self.bn, max_cached=1)
+        return engine.evaluate_batch(evidence_list, query_nodes, processes=processes)
+
+    def sweep(self, nodes: List[str], query_nodes: List[str],
+              base_evidence: Optional[Dict[str, Any]] = None, processes: int = 0) -> np.ndarray:
+        """遍历 nodes 的全部状态组合，返回查询节点后验，详见 InferenceEngine.sweep"""
+        engine = self.engine if self.engine is not None else InferenceEngine(self.bn, max_cached=1)
+        return engine.sweep(nodes, query_nodes, base_evidence=base_evidence, processes=processes)
+
     def make_inference(self, evidence: Optional[Dict] = None) -> None:
         """
         执行带有给定证据的贝叶斯网络推理
         """
-        # 创建新的推理引擎
-        self.ie = gum.LazyPropagation(self.bn)
-
         # 更新当前证据
         if evidence is not None:
             self.current_evidence = evidence.copy()
         else:
             self.current_evidence = {}
 
+        if self.engine is not None:
+            self._make_incremental_inference()
+            return
+
+        # 创建新的推理引擎
+        self.ie = gum.LazyPropagation(self.bn)
+
         # 如果有证据需要设置
         if self.current_evidence:
             print("Setting all evidence at once...")
@@ -669,6 +1239,18 @@ class ScenarioResilience:
 
         print("Inference completed.")
 
+    def _make_incremental_inference(self) -> None:
+        """长驻模式下的推理：只应用证据差量，命中缓存时不做消息传递"""
+        try:
+            self.engine.set_evidence(self.current_evidence)
+            self.engine.posteriors()
+        except Exception as e:
+            print(f"Error during evidence setting or inference: {e}")
+            self.engine.clear_evidence()
+            self.engine.posteriors()
+            print("Falling back to inference without evidence.")
+        self.ie = self.engine.ie
+
     def clear_evidence(self) -> None:
         """清除所有证据并重新进行推理"""
         self.current_evidence = {}
@@ -746,6 +1328,27 @@ class ScenarioResilience:
                   encoding='utf-8') as f:
             json.dump(node_data, f, indent=4, ensure_ascii=False)
 
+    def network_description(self) -> Tuple[Dict[str, List[Tuple[str, float]]], List[Tuple[str, str]]]:
+        """
+        网络的节点、状态先验与有向边，供数据库同步使用（不经过 BIF 文件）
+
+        Returns:
+            ({节点名: [(状态名, 先验概率), ...]}, [(父节点名, 子节点名), ...])
+            状态名与 node_data.json 一致（优先使用 state_mapping）。
+        """
+        engine = self.engine if self.engine is not None else InferenceEngine(self.bn, max_cached=1)
+
+        nodes = {}
+        for node in self.bn.nodes():
+            node_name = self.bn.variable(node).name()
+            prior = engine.prior(node_name)
+            states = self.state_mapping.get(node_name,
+                                            [f"State{i + 1}" for i in range(len(prior))])
+            nodes[node_name] = [(state, float(p)) for state, p in zip(states, prior)]
+
+        arcs = [(self.bn.variable(tail).name(), self.bn.variable(head).name()) for tail, head in self.bn.arcs()]
+        return nodes, arcs
+
     def set_soft_evidence(self, node_name: str, pmf: dict):
         """
         pmf 如 {'Open':0.2,'Partial':0.5,'Closed':0.3}
@@ -761,6 +1364,10 @@ class ScenarioResilience:
         vec = np.array([pmf.get(lbl, 0.0) for lbl in labels], dtype=float)
         s = vec.sum()
         vec = vec / (s if s > 1e-12 else 1.0)
+        if self.engine is not None:
+            # 长驻模式下软证据也需进入证据签名，否则会命中错误的缓存
+            self.engine.add_soft_evidence(node_name, vec)
+            return
         ve = gum.VirtualEvidence(self.bn, nid, vec)
         self.ie.addEvidence(ve)
 
@@ -888,8 +1495,14 @@ class NetworkVisualizer:
     def visualize_network(self, bn: gum.BayesNet, output_dir: str,
                           evidence: Optional[Dict] = None,
                           state_mapping: Optional[Dict] = None,
-                          ie: Optional[gum.LazyPropagation] = None) -> gum.LazyPropagation:
-        """生成完整的贝叶斯网络可视化"""
+                          ie: Optional[gum.LazyPropagation] = None,
+                          prior_ie: Optional[Any] = None) -> gum.LazyPropagation:
+        """
+        生成完整的贝叶斯网络可视化
+
+        ie / prior_ie 可以是任何提供 posterior(node_name) 的对象（如 InferenceEngine、PosteriorView），
+        传入 prior_ie 时不再为先验图单独创建推理引擎。
+        """
         os.makedirs(output_dir, exist_ok=True)
 
         # 清理旧的evidence文件
@@ -901,9 +1514,12 @@ class NetworkVisualizer:
         dot_structure = self.create_network_dot(bn)
         dot_structure.render(os.path.join(output_dir, 'bn_structure'), format='svg', cleanup=True)
 
-        # 2. 创建一个新的推理引擎用于初始状态
-        initial_ie = gum.LazyPropagation(bn)
-        initial_ie.makeInference()
+        # 2. 初始状态：优先复用已缓存的先验，否则创建一个新的推理引擎
+        if prior_ie is not None:
+            initial_ie = prior_ie
+        else:
+            initial_ie = gum.LazyPropagation(bn)
+            initial_ie.makeInference()
 
         # 保存初始推理结果（无证据状态）
         dot_inference = self.create_network_dot(bn, initial_ie, None, state_mapping)
@@ -1211,67 +1827,262 @@ def save_cpt_tables(bn, output_file):
 
     print(f"\nCPT表格已完整保存到: {output_file}")
 
-def update_with_evidence(analyzer: ScenarioResilience, evidence: Optional[Dict[str, int]] = None,output_dir = "./scenario_bn") -> None:
-    """使用新证据更新贝叶斯网络，如果没有提供证据则清除现有证据"""
-    # 执行推理
-    # export_detailed_cpts(analyzer.bn, os.path.join(output_dir, 'detailed_cpts.txt'))
-    # save_cpt_tables(analyzer.bn, os.path.join(output_dir, 'cpt_tables.txt'))
+@dataclass
+class InferenceResult:
+    """一次推理的纯数据结果，不涉及文件与渲染"""
+    evidence: Dict[str, Any]
+    posteriors: Dict[str, np.ndarray]
+    state_mapping: Dict[str, List[str]] = field(default_factory=dict)
+
+    def posterior_dict(self) -> Dict[str, Dict[Any, float]]:
+        """以状态名称为键的后验字典（与 posterior_probabilities.json 格式一致）"""
+        posterior_dict = {}
+        for node_name, posterior in self.posteriors.items():
+            posterior = posterior.tolist()
+            state_labels = self.state_mapping.get(node_name, [])
+
+            if not state_labels:
+                # 如果没有找到映射，则使用索引作为键
+                posterior_dict[node_name] = {index: prob for index, prob in enumerate(posterior)}
+                continue
+            # 确保状态标签的数量与后验概率的长度一致
+            if len(state_labels) != len(posterior):
+                raise ValueError(f"节点 '{node_name}' 的状态标签数量与后验概率数量不匹配。")
+            posterior_dict[node_name] = {state: prob for state, prob in zip(state_labels, posterior)}
+        return posterior_dict
+
+    def view(self) -> PosteriorView:
+        """可直接传给 NetworkVisualizer 的后验视图"""
+        return PosteriorView(self.posteriors)
+
+
+def infer(analyzer: ScenarioResilience, evidence: Optional[Dict[str, int]] = None) -> InferenceResult:
+    """执行推理并返回 InferenceResult，不写文件、不渲染"""
     if evidence is None:
         analyzer.clear_evidence()
     else:
-        # 保存到 evidence.log 中
-        with open('evidence.log', 'a') as f:
-            import time
-            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
-            evidence_str = f"{timestamp} - {str(evidence)}\n"
-            f.write(evidence_str)
         analyzer.make_inference(evidence)
 
-    # 构建后验概率的字典，使用状态名称作为键
-    posterior_dict = {}
+    posteriors = {}
     for node in analyzer.bn.nodes():
         node_name = analyzer.bn.variable(node).name()
-        print(f"142315{node_name}")
-        # 打印条件概率表，不要省略
+        posteriors[node_name] = analyzer.posterior(node_name)
 
-        print(analyzer.bn.cpt(node_name))
-        posterior = analyzer.ie.posterior(node_name).tolist()
-        print(f"142315{posterior}")
+    return InferenceResult(evidence=dict(analyzer.current_evidence), posteriors=posteriors,
+                           state_mapping=analyzer.state_mapping)
 
 
-        # 获取该节点的状态映射
-        state_labels = analyzer.state_mapping.get(node_name, [])
+class RenderPipeline:
+    """
+    延迟且合并的可视化渲染阶段
 
-        if not state_labels:
-            # 如果没有找到映射，则使用索引作为键
-            posterior_with_labels = {index: prob for index, prob in enumerate(posterior)}
+    request 只登记渲染任务，同一输出目录的多次请求只保留最后一次；
+    真正渲染发生在视图需要图片时调用 render，或在 auto_render 的静默期结束后。
+    登记时保存网络的快照（bn_to_spec），之后对 CPT 的修改不会与旧的推理结果混在一起渲染。
+    结构图对同一网络不会变化，渲染一次后缓存复用；先验图按 CPT 内容缓存。
+    待渲染任务与图片缓存都有上限，超出时淘汰最久未使用的条目。
+    """
+
+    def __init__(self, debounce: float = 0.3, max_pending: int = 32, max_cached_svg: int = 16):
+        self.debounce = debounce
+        self.max_pending = max_pending
+        self.max_cached_svg = max_cached_svg
+        self.visualizer = NetworkVisualizer()
+        self._pending: "OrderedDict[str, Tuple[Dict[str, Any], InferenceResult, Any]]" = OrderedDict()
+        self._timers: Dict[str, threading.Timer] = {}
+        # _lock 只保护登记表；graphviz 渲染在 _render_lock 下串行执行，不阻塞 request
+        self._lock = threading.RLock()
+        self._render_lock = threading.Lock()
+        self._structure_svg: "OrderedDict[Tuple, str]" = OrderedDict()
+        self._prior_svg: "OrderedDict[Tuple, str]" = OrderedDict()
+
+    def request(self, bn: gum.BayesNet, result: InferenceResult, output_dir: str,
+                prior_ie: Optional[Any] = None, auto_render: bool = False) -> None:
+        """登记一次渲染请求；auto_render 为 True 时在静默期后自动渲染"""
+        output_dir = os.path.abspath(output_dir)
+        spec = bn_to_spec(bn)
+        with self._lock:
+            self._pending.pop(output_dir, None)
+            self._pending[output_dir] = (spec, result, prior_ie)
+            self._cancel_timer(output_dir)
+            while len(self._pending) > self.max_pending:
+                stale_dir, _ = self._pending.popitem(last=False)
+                self._cancel_timer(stale_dir)
+            if auto_render:
+                timer = threading.Timer(self.debounce, self.render, args=(output_dir,))
+                timer.daemon = True
+                self._timers[output_dir] = timer
+                timer.start()
+
+    def _cancel_timer(self, output_dir: str) -> None:
+        timer = self._timers.pop(output_dir, None)
+        if timer is not None:
+            timer.cancel()
+
+    def is_pending(self, output_dir: str) -> bool:
+        with self._lock:
+            return os.path.abspath(output_dir) in self._pending
+
+    def render(self, output_dir: str) -> Optional[str]:
+        """
+        渲染 output_dir 上最近一次请求（没有待渲染任务时直接返回已有图片）
+
+        Returns:
+            Optional[str]: combined_visualization.svg 的路径，不存在时为 None
+        """
+        output_dir = os.path.abspath(output_dir)
+        combined_path = os.path.join(output_dir, 'combined_visualization.svg')
+        with self._render_lock:
+            with self._lock:
+                self._cancel_timer(output_dir)
+                job = self._pending.pop(output_dir, None)
+            if job is not None:
+                self._render_job(output_dir, *job)
+        return combined_path if os.path.exists(combined_path) else None
+
+    def render_all(self) -> None:
+        """渲染所有待处理的请求"""
+        with self._lock:
+            output_dirs = list(self._pending)
+        for output_dir in output_dirs:
+            self.render(output_dir)
+
+    def _cached_svg(self, cache: "OrderedDict[Tuple, str]", key: Tuple, build) -> str:
+        """按 LRU 取图，未命中时调用 build() 渲染并写入缓存"""
+        if key in cache:
+            cache.move_to_end(key)
         else:
-            # 确保状态标签的数量与后验概率的长度一致
-            if len(state_labels) != len(posterior):
-                raise ValueError(f"节点 '{node_name}' 的状态标签数量与后验概率数量不匹配。")
-            # 使用状态名称作为键
-            posterior_with_labels = {state: prob for state, prob in zip(state_labels, posterior)}
+            cache[key] = build()
+            while len(cache) > self.max_cached_svg:
+                cache.popitem(last=False)
+        return cache[key]
 
-        posterior_dict[node_name] = posterior_with_labels
+    def _render_job(self, output_dir: str, spec: Dict[str, Any], result: InferenceResult,
+                    prior_ie: Optional[Any]) -> None:
+        os.makedirs(output_dir, exist_ok=True)
+        structure_key = (tuple(name for name, _, _ in spec['variables']), tuple(sorted(spec['arcs'])))
+        snapshot: List[gum.BayesNet] = []
+
+        def bn() -> gum.BayesNet:
+            # 只有需要重新渲染时才从快照重建网络
+            if not snapshot:
+                snapshot.append(bn_from_spec(spec))
+            return snapshot[0]
+
+        # 1. 结构图：同一网络只渲染一次
+        structure_svg = self._cached_svg(
+            self._structure_svg, structure_key,
+            lambda: self.visualizer.create_network_dot(bn()).pipe(format='svg').decode('utf-8'))
+        self._write_svg(output_dir, 'bn_structure.svg', structure_svg)
+
+        # 2. 先验图：结构与CPT不变时复用
+        def build_prior() -> str:
+            ie = prior_ie
+            if ie is None:
+                ie = gum.LazyPropagation(bn())
+                ie.makeInference()
+            dot_inference = self.visualizer.create_network_dot(bn(), ie, None, result.state_mapping)
+            return dot_inference.pipe(format='svg').decode('utf-8')
+
+        prior_key = structure_key + (self._cpt_digest(spec), tuple(sorted(result.state_mapping)))
+        self._write_svg(output_dir, 'bn_inference.svg', self._cached_svg(self._prior_svg, prior_key, build_prior))
+
+        # 3. 证据图：直接使用推理结果，不再创建推理引擎
+        evidence_file = os.path.join(output_dir, 'bn_inference_with_evidence.svg')
+        if result.evidence:
+            dot_evidence = self.visualizer.create_network_dot(bn(), result.view(), result.evidence,
+                                                              result.state_mapping)
+            self._write_svg(output_dir, 'bn_inference_with_evidence.svg',
+                            dot_evidence.pipe(format='svg').decode('utf-8'))
+        elif os.path.exists(evidence_file):
+            os.remove(evidence_file)
 
-    # 打印为带状态名称的 JSON 格式
-    print("\nPosterior Probabilities after Evidence:")
-    print(json.dumps(posterior_dict, indent=4, ensure_ascii=False))
-    # 保存到文件,如果目录不存在则创建
+        self.visualizer.combine_visualizations(output_dir)
+
+    @staticmethod
+    def _cpt_digest(spec: Dict[str, Any]) -> str:
+        sha = hashlib.sha1()
+        for node_name, (_, values) in spec['cpts'].items():
+            sha.update(node_name.encode('utf-8'))
+            sha.update(np.asarray(values, dtype=float).tobytes())
+        return sha.hexdigest()
+
+    @staticmethod
+    def _write_svg(output_dir: str, filename: str, content: str) -> None:
+        with open(os.path.join(output_dir, filename), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+
+# 全局渲染阶段，供各视图按需取图
+render_pipeline = RenderPipeline()
+
+# 后验文件的后台写入线程（单线程保证同一目录按提交顺序落盘）
+_persist_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='posterior-persist')
+
+
+def _write_posterior_json(output_dir: str, posterior_dict: Dict[str, Dict[Any, float]]) -> None:
+    """保存后验概率到 posterior_probabilities.json，如果目录不存在则创建"""
     os.makedirs(output_dir, exist_ok=True)
     with open(os.path.join(output_dir, 'posterior_probabilities.json'), 'w',
               encoding='utf-8') as f:
         json.dump(posterior_dict, f, indent=4, ensure_ascii=False)
 
-    # 可视化更新后的网络，传入当前的推理引擎
-    visualizer = NetworkVisualizer()
-    ie = visualizer.visualize_network(
-        bn=analyzer.bn,
-        output_dir=output_dir,
-        evidence=analyzer.current_evidence,
-        state_mapping=analyzer.state_mapping,
-        ie=analyzer.ie
-    )
+
+def flush_persistence() -> None:
+    """等待所有已提交的后台写入完成"""
+    _persist_executor.submit(lambda: None).result()
+
+
+def update_with_evidence(analyzer: ScenarioResilience, evidence: Optional[Dict[str, int]] = None,
+                         output_dir="./scenario_bn", persist: bool = True,
+                         persist_async: bool = False, render: bool = True) -> InferenceResult:
+    """
+    使用新证据更新贝叶斯网络，如果没有提供证据则清除现有证据
+
+    可视化不再同步生成，只向 render_pipeline 登记请求；需要图片时调用
+    render_pipeline.render(output_dir)。
+
+    Args:
+        analyzer: 情景韧性分析器
+        evidence: 证据字典
+        output_dir: 输出目录
+        persist: 是否写入 posterior_probabilities.json
+        persist_async: 为 True 时在后台线程写文件，调用方直接使用返回值
+        render: 是否登记可视化请求；不会取图的调用方应传 False，避免积压待渲染任务
+
+    Returns:
+        InferenceResult: 推理结果，result.posterior_dict() 即写入文件的后验字典
+    """
+    # 执行推理
+    # export_detailed_cpts(analyzer.bn, os.path.join(output_dir, 'detailed_cpts.txt'))
+    # save_cpt_tables(analyzer.bn, os.path.join(output_dir, 'cpt_tables.txt'))
+    if evidence is not None:
+        # 保存到 evidence.log 中
+        with open('evidence.log', 'a') as f:
+            import time
+            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+            evidence_str = f"{timestamp} - {str(evidence)}\n"
+            f.write(evidence_str)
+    result = infer(analyzer, evidence)
+
+    # 构建后验概率的字典，使用状态名称作为键
+    posterior_dict = result.posterior_dict()
+
+    # 打印为带状态名称的 JSON 格式
+    print("\nPosterior Probabilities after Evidence:")
+    print(json.dumps(posterior_dict, indent=4, ensure_ascii=False))
+    if persist:
+        if persist_async:
+            _persist_executor.submit(_write_posterior_json, output_dir, posterior_dict)
+        else:
+            _write_posterior_json(output_dir, posterior_dict)
+
+    # 登记可视化请求；长驻模式下先验图直接使用缓存的后验
+    if render:
+        engine = analyzer.engine
+        render_pipeline.request(analyzer.bn, result, output_dir,
+                                prior_ie=engine.prior_view() if engine is not None else None)
+    return result
 
 def bn_svg_update():
     """主函数演示用法"""
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18
+# @FileName: job_runner.py
+# @Software: PyCharm
+"""
+后台任务执行：把耗时的生成流程放到 QThreadPool 中运行，界面线程只负责显示进度。
+
+任务函数签名为 fn(job)，通过 job.progress(step, label) / job.stage_done(name, status, seconds)
+上报结构化进度，通过 job.checkpoint() 在阶段之间响应取消。
+所有信号都在界面线程接收（信号对象创建于界面线程，跨线程自动排队）。
+任务内访问数据库应使用 DatabaseManager.session_scope() 打开自己的会话。
+"""
+
+import time
+import traceback
+from typing import Any, Callable, Optional
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, QThread, QCoreApplication, Signal
+
+
+class JobCancelled(Exception):
+    """任务在阶段之间被取消"""
+
+
+class JobSignals(QObject):
+    # (当前步骤, 总步骤数, 提示文字)
+    progress = Signal(int, int, str)
+    # (阶段名, "ran"/"skipped", 耗时秒)
+    stage_finished = Signal(str, str, float)
+    # 任务函数的返回值
+    finished = Signal(object)
+    # 出错信息
+    failed = Signal(str)
+    cancelled = Signal()
+
+
+class Job(QRunnable):
+    """在线程池中执行 fn(job) 的可取消任务"""
+
+    def __init__(self, fn: Callable[['Job'], Any], total_steps: int = 0, name: str = ''):
+        super().__init__()
+        self.setAutoDelete(False)  # 由 JobRunner 持有引用，避免信号对象提前析构
+        self.fn = fn
+        self.total_steps = total_steps
+        self.name = name or getattr(fn, '__name__', 'job')
+        self.signals = JobSignals()
+        self._cancel_requested = False
+        self.started_at: Optional[float] = None
+
+    def cancel(self) -> None:
+        """请求取消；任务在下一个 checkpoint 处停止"""
+        self._cancel_requested = True
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._cancel_requested
+
+    def checkpoint(self) -> None:
+        """阶段之间调用，已请求取消时抛出 JobCancelled"""
+        if self._cancel_requested:
+            raise JobCancelled(self.name)
+
+    def progress(self, step: int, label: str) -> None:
+        self.signals.progress.emit(step, self.total_steps, label)
+
+    def stage_done(self, name: str, status: str, seconds: float) -> None:
+        self.signals.stage_finished.emit(name, status, float(seconds))
+
+    def run(self) -> None:
+        self.started_at = time.perf_counter()
+        try:
+            self.checkpoint()
+            result = self.fn(self)
+        except JobCancelled:
+            print(f"[job] {self.name}: 已取消")
+            self.signals.cancelled.emit()
+        except Exception as e:
+            traceback.print_exc()
+            self.signals.failed.emit(str(e))
+        else:
+            print(f"[job] {self.name}: 完成，耗时 {time.perf_counter() - self.started_at:.2f}s")
+            self.signals.finished.emit(result)
+
+
+class JobRunner(QObject):
+    """
+    任务调度器。默认串行执行（max_threads=1）：生成流程共享 owlready2 的默认世界与输出目录，
+    不宜并发；需要并行的轻量任务可另建 max_threads 更大的实例。
+    """
+
+    def __init__(self, max_threads: int = 1, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self._jobs = set()
+
+    def submit(self, fn: Callable[[Job], Any], total_steps: int = 0, name: str = '') -> Job:
+        job = Job(fn, total_steps, name)
+        self._jobs.add(job)
+        for sig in (job.signals.finished, job.signals.failed, job.signals.cancelled):
+            sig.connect(lambda *args, j=job: self._jobs.discard(j))
+        self.pool.start(job)
+        return job
+
+    def is_busy(self) -> bool:
+        return bool(self._jobs)
+
+    def cancel_all(self) -> None:
+        for job in list(self._jobs):
+            job.cancel()
+
+    def wait(self, msecs: int = -1) -> bool:
+        """等待所有任务结束（用于退出程序前）"""
+        return self.pool.waitForDone(msecs)
+
+
+def on_gui_thread() -> bool:
+    """当前是否在界面线程（后台任务中不能创建窗口部件）"""
+    app = QCoreApplication.instance()
+    return app is None or QThread.currentThread() == app.thread()
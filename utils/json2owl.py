@@ -1,17 +1,17 @@
 import types
 from owlready2 import *
 import json
-from openpyxl import Workbook
 import datetime
 import os
 from rdflib import URIRef, RDF, OWL
 import types
 from owlready2 import *
 import json
-from openpyxl import Workbook
 import datetime
 import os
 
+from utils.table_export import table_path, write_table
+
 def create_ontology(input_path, output_path):
     """
     创建本体并保存到指定的位置，并在 ABox 层面带上数据属性的具体值。
@@ -586,58 +586,70 @@ def Emergency_owl_creator(output_path):
     print(f"Emergency本体已保存到: {output_path}")
 
 
-def owl_excel_creator(input_owl_path, output_excel_path):
-    """
-    将OWL文件中的属性信息整理为Excel文件。
-    包括所有的数据属性和对象属性，分别写到同一个Sheet里。
-    """
-    # 加载OWL文件
-    onto = get_ontology(input_owl_path).load()
-
-    # 创建一个新的Excel工作簿
-    wb = Workbook()
-    ws = wb.active
-    # 以输出 Excel 的名字作为 sheet 名(去掉扩展名 + "_Prop")
-    ws.title = os.path.splitext(os.path.basename(output_excel_path))[0] + "_Prop"
+OWL_PROPERTY_HEADERS = ["label", "name", "domain", "range"]
 
-    # 初始化空列表
-    data_properties_list = []
-    object_properties_list = []
 
+def owl_property_rows(onto):
+    """已加载本体中的属性行：先数据属性，后对象属性（与 OWL_PROPERTY_HEADERS 对应）"""
     # 收集数据属性信息
     for dp in onto.data_properties():
-        dp_dict = {
-            "label": "DataProperty",
-            "name": dp.name,
-            "domain": dp.domain[0].name if dp.domain else "",
-            "range": str(dp.range[0]) if dp.range else ""
-        }
-        data_properties_list.append(dp_dict)
+        yield [
+            "DataProperty",
+            dp.name,
+            dp.domain[0].name if dp.domain else "",
+            str(dp.range[0]) if dp.range else ""
+        ]
 
     # 收集对象属性信息
     for op in onto.object_properties():
-        op_dict = {
-            "label": "ObjectProperty",
-            "name": op.label[0] if op.label else op.name,
-            "domain": op.domain[0].name if op.domain else "",
-            "range": op.range[0].name if op.range else ""
-        }
-        object_properties_list.append(op_dict)
-
-    # 写表头
-    ws.append(["label", "name", "domain", "range"])
-
-    # 先写数据属性
-    for prop in data_properties_list:
-        ws.append([prop["label"], prop["name"], prop["domain"], prop["range"]])
-
-    # 再写对象属性
-    for prop in object_properties_list:
-        ws.append([prop["label"], prop["name"], prop["domain"], prop["range"]])
-
-    # 保存 Excel 文件
-    wb.save(output_excel_path)
-    print(f"Excel文件已保存为: {output_excel_path}")
+        yield [
+            "ObjectProperty",
+            op.label[0] if op.label else op.name,
+            op.domain[0].name if op.domain else "",
+            op.range[0].name if op.range else ""
+        ]
+
+
+def owl_excel_creator(input_owl_path, output_excel_path, onto=None):
+    """
+    将OWL文件中的属性信息整理为表格文件（格式由扩展名决定，xlsx / csv / parquet / feather）。
+    包括所有的数据属性和对象属性，分别写到同一个Sheet里。
+    已在内存中的本体可通过 onto 传入，避免重新加载；否则在独立的 World 中加载，用完即释放。
+    """
+    world = None
+    if onto is None:
+        world = World()
+        onto = world.get_ontology(input_owl_path).load()
+    try:
+        # 以输出文件的名字作为 sheet 名(去掉扩展名 + "_Prop")
+        sheet_title = os.path.splitext(os.path.basename(output_excel_path))[0] + "_Prop"
+        write_table(OWL_PROPERTY_HEADERS, list(owl_property_rows(onto)), output_excel_path, sheet_title)
+    finally:
+        if world is not None:
+            world.close()
+    print(f"属性表已保存为: {output_excel_path}")
+
+
+def export_owl_properties(owl_paths, output_dir, formats=('csv',)):
+    """
+    按需导出本体属性表：每个 OWL 只加载一次，写出 <本体名>_Prop.<格式>。
+    返回写出的文件路径。
+    """
+    written = []
+    for owl_path in owl_paths:
+        if not os.path.exists(owl_path):
+            continue
+        name = os.path.splitext(os.path.basename(owl_path))[0] + "_Prop"
+        world = World()
+        try:
+            onto = world.get_ontology(owl_path).load()
+            for fmt in formats:
+                output_path = table_path(output_dir, name, fmt)
+                owl_excel_creator(owl_path, output_path, onto=onto)
+                written.append(output_path)
+        finally:
+            world.close()
+    return written
 
 
 if __name__ == '__main__':
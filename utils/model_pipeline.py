@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18
+# @FileName: model_pipeline.py
+# @Software: PyCharm
+"""
+增量式模型生成流水线
+
+每个阶段声明输入（文件、目录或内存数据）与输出文件，运行后把输入/输出的内容哈希
+和耗时记录到清单文件（data/sysml2/<scenario_id>/pipeline_manifest.json）。
+再次运行时，输入哈希未变且输出文件仍与清单一致的阶段直接跳过；
+由于下游阶段的输入就是上游阶段的输出，修改单个要素只会重跑受影响的下游阶段。
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+MANIFEST_FILE = 'pipeline_manifest.json'
+# 清单格式版本（格式变化时递增，使旧清单失效）
+MANIFEST_VERSION = 1
+
+
+def _file_digest(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _data_digest(data: Any) -> str:
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class DirInput:
+    """目录输入/输出：按后缀匹配目录下（不递归）的文件，逐个计算哈希"""
+
+    def __init__(self, path: str, suffixes: Iterable[str] = ()):
+        self.path = path
+        self.suffixes = tuple(suffixes)
+
+    def files(self) -> List[str]:
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(
+            os.path.join(self.path, f) for f in os.listdir(self.path)
+            if os.path.isfile(os.path.join(self.path, f)) and (not self.suffixes or f.endswith(self.suffixes))
+        )
+
+
+class DataInput:
+    """
+    内存数据输入，按 JSON 序列化后的内容计算哈希
+
+    data 可以是可调用对象：在首次计算哈希或读取 value() 时才求值（只求值一次），
+    这样耗时的数据收集发生在流水线运行的线程中，而不是构建流水线时。
+    """
+
+    _UNSET = object()
+
+    def __init__(self, name: str, data: Any):
+        self.name = name
+        self.data = data
+        self._value = self._UNSET
+
+    def value(self) -> Any:
+        if self._value is self._UNSET:
+            self._value = self.data() if callable(self.data) else self.data
+        return self._value
+
+
+class Stage:
+    """
+    流水线中的一个阶段
+
+    Args:
+        name: 阶段名（清单中的键）
+        label: 进度提示文字
+        run: 执行函数，参数为本次变化的输入键集合（首次运行或输出缺失时为全部输入）
+        inputs: 输入列表，元素为文件路径、DirInput 或 DataInput
+        outputs: 输出列表，元素为文件路径或 DirInput
+        check: 可选，返回 False 时即使输入未变也重新运行（用于校验文件以外的产物，如数据库）
+    """
+
+    def __init__(self, name: str, label: str, run: Callable[[Set[str]], Any],
+                 inputs: Iterable[Any] = (), outputs: Iterable[Any] = (),
+                 check: Optional[Callable[[], bool]] = None):
+        self.name = name
+        self.label = label
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.check = check
+
+
+class ModelPipeline:
+    """按顺序执行各阶段，并依据清单跳过输入未变的阶段"""
+
+    def __init__(self, base_dir: str, stages: Optional[List[Stage]] = None, force: bool = False):
+        self.base_dir = os.path.abspath(base_dir)
+        self.manifest_path = os.path.join(self.base_dir, MANIFEST_FILE)
+        self.stages: List[Stage] = list(stages or [])
+        self.force = force
+        self.manifest = self._load_manifest()
+
+    def add_stage(self, stage: Stage) -> Stage:
+        self.stages.append(stage)
+        return stage
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == MANIFEST_VERSION:
+                return manifest
+        except (OSError, ValueError):
+            pass
+        return {'version': MANIFEST_VERSION, 'stages': {}}
+
+    def _save_manifest(self) -> None:
+        os.makedirs(self.base_dir, exist_ok=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def key(self, path: str) -> str:
+        """文件在清单中的键：基目录下的文件用相对路径"""
+        path = os.path.abspath(path)
+        try:
+            rel = os.path.relpath(path, self.base_dir)
+        except ValueError:  # Windows 下不同盘符
+            return path.replace(os.sep, '/')
+        return path.replace(os.sep, '/') if rel.startswith('..') else rel.replace(os.sep, '/')
+
+    def _digests(self, items: Iterable[Any]) -> Dict[str, str]:
+        """输入/输出项 -> {键: 哈希}，不存在的文件记为空字符串"""
+        digests: Dict[str, str] = {}
+        for item in items:
+            if isinstance(item, DataInput):
+                digests[f"data:{item.name}"] = _data_digest(item.value())
+            elif isinstance(item, DirInput):
+                for path in item.files():
+                    digests[self.key(path)] = _file_digest(path)
+            else:
+                digests[self.key(item)] = _file_digest(item) if os.path.isfile(item) else ''
+        return digests
+
+    def changed_inputs(self, stage: Stage) -> Optional[Set[str]]:
+        """
+        返回该阶段变化的输入键集合；返回 None 表示必须完整运行
+        （强制运行、无记录、输出缺失或被改动、check 未通过）
+        """
+        record = self.manifest['stages'].get(stage.name)
+        if self.force or record is None:
+            return None
+        outputs = self._digests(stage.outputs)
+        if any(not digest for digest in outputs.values()) or outputs != record.get('outputs', {}):
+            return None
+        if stage.check is not None and not stage.check():
+            return None
+        inputs = self._digests(stage.inputs)
+        old_inputs = record.get('inputs', {})
+        return {k for k in inputs.keys() | old_inputs.keys() if inputs.get(k) != old_inputs.get(k)}
+
+    def run(self, progress: Optional[Callable[[int, str], None]] = None,
+            checkpoint: Optional[Callable[[], None]] = None,
+            on_stage: Optional[Callable[[str, str, float], None]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        依次执行各阶段，返回 {阶段名: {"status": "ran"/"skipped", "seconds": 耗时}}
+
+        progress(step, label) 在每个阶段开始前调用；checkpoint() 在每个阶段开始前调用，
+        可抛出异常以取消后续阶段；on_stage(name, status, seconds) 在每个阶段结束后调用。
+        某阶段出错或被取消时，已完成阶段的记录仍会写入清单，出错阶段的记录被清除以便下次重新运行。
+        """
+        summary: Dict[str, Dict[str, Any]] = {}
+        try:
+            for step, stage in enumerate(self.stages):
+                if checkpoint:
+                    checkpoint()
+                if progress:
+                    progress(step, stage.label)
+                start = time.perf_counter()
+                changed = self.changed_inputs(stage)
+                if changed is not None and not changed:
+                    summary[stage.name] = {'status': 'skipped', 'seconds': time.perf_counter() - start}
+                    print(f"[pipeline] {stage.name}: 输入未变化，跳过")
+                    if on_stage:
+                        on_stage(stage.name, 'skipped', summary[stage.name]['seconds'])
+                    continue
+
+                # 完整运行时把全部输入视为已变化
+                inputs_before = self._digests(stage.inputs)
+                if changed is None:
+                    changed = set(inputs_before)
+                self.manifest['stages'].pop(stage.name, None)
+                stage.run(changed)
+                seconds = time.perf_counter() - start
+
+                self.manifest['stages'][stage.name] = {
+                    'inputs': inputs_before,
+                    'outputs': self._digests(stage.outputs),
+                    'seconds': round(seconds, 3),
+                    'updated': datetime.datetime.now().isoformat(timespec='seconds'),
+                }
+                summary[stage.name] = {'status': 'ran', 'seconds': seconds}
+                print(f"[pipeline] {stage.name}: 完成，耗时 {seconds:.2f}s")
+                if on_stage:
+                    on_stage(stage.name, 'ran', seconds)
+        finally:
+            self._save_manifest()
+        return summary
@@ -1,9 +1,16 @@
+import atexit
+import hashlib
 import multiprocessing
 import os
 import json
 import logging
+import shutil
+import threading
+import time
 import traceback
+from dataclasses import dataclass
 from datetime import datetime
+from typing import Optional
 from rdflib import Graph
 import owlready2 as owl2
 from owlready2 import default_world
@@ -134,28 +141,35 @@ def process_jsonld(file_name, output_dir):
         return file_name
 
 
-def process_owl(file_name, output_dir):
+# 渲染结果缓存：按 OWL 内容哈希保存 SVG，内容未变时直接复用（渲染逻辑变化时递增版本号）
+SVG_CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../data/cache/owl_svg'))
+SVG_CACHE_VERSION = 1
+
+
+def render_owl_svg(file_name, output_dir):
+    """
+    加载 OWL 并把分类图渲染为 output_dir 下的同名 SVG，返回 SVG 路径；失败时抛出异常。
+
+    渲染进程会被重复使用，结束时销毁本次加载的本体，避免下一个文件的分类图混入其中的类。
+    """
     process_name = multiprocessing.current_process().name
     process_id = os.getpid()
     start_time = datetime.now()
-    logging.info(f"[{process_name} PID:{process_id}] 开始处理OWL文件: '{file_name}'.")
 
-    try:
-        if not os.path.exists(file_name):
-            logging.error(f"[{process_name} PID:{process_id}] OWL文件未找到: '{file_name}'")
-            return None
+    if not os.path.exists(file_name):
+        raise FileNotFoundError(f"OWL文件未找到: '{file_name}'")
 
-        default_world.ontologies.clear()
-        path = os.path.abspath(file_name)
-        logging.debug(f"[{process_name} PID:{process_id}] 加载OWL文件 '{path}'。")
-        ontology = owl2.get_ontology(path).load()
+    default_world.ontologies.clear()
+    path = os.path.abspath(file_name)
+    logging.debug(f"[{process_name} PID:{process_id}] 加载OWL文件 '{path}'。")
+    ontology = owl2.get_ontology(path).load()
+    try:
         logging.debug(f"[{process_name} PID:{process_id}] 成功加载本体 '{path}'。")
 
         logging.debug(f"[{process_name} PID:{process_id}] 生成分类图。")
         G = smt.generate_taxonomy_graph_from_onto(owl2.Thing)
         if G is None:
-            logging.warning(f"[{process_name} PID:{process_id}] 无法从文件 '{file_name}' 生成分类图。")
-            return None
+            raise ValueError(f"无法从文件 '{file_name}' 生成分类图")
 
         logging.debug(f"[{process_name} PID:{process_id}] 分类图生成成功。")
 
@@ -175,88 +189,201 @@ def process_owl(file_name, output_dir):
         svg_fname = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(file_name))[0]}.svg")
         with open(svg_fname, "wb") as svgfile:
             svgfile.write(svg_data)
-        logging.debug(f"[{process_name} PID:{process_id}] SVG图形成功写入文件 '{svg_fname}'。")
         end_time = datetime.now()
         logging.info(f"[{process_name} PID:{process_id}] 成功生成SVG文件: '{svg_fname}'，耗时 {end_time - start_time}.")
         return svg_fname
+    finally:
+        # 从四元组存储中移除本次加载的本体
+        for onto in list(default_world.ontologies.values()):
+            onto.destroy()
+
+
+def process_owl(file_name, output_dir):
+    process_name = multiprocessing.current_process().name
+    process_id = os.getpid()
+    logging.info(f"[{process_name} PID:{process_id}] 开始处理OWL文件: '{file_name}'.")
+    try:
+        return render_owl_svg(file_name, output_dir)
     except Exception as e:
         logging.error(
             f"[{process_name} PID:{process_id}] 处理OWL文件 '{file_name}' 时出错: {e}\n{traceback.format_exc()}")
         return None
 
 
-def handle_file(file_name, output_dir, log_queue):
-    # 在子进程中配置日志
+def _render_task(file_name, output_dir):
+    """渲染进程中执行的任务：必要时先把 JSON-LD 转为 RDF/XML，返回 SVG 路径，失败时抛出异常"""
+    processed_file = process_jsonld(file_name, output_dir)
+    if not processed_file:
+        raise ValueError(f"文件 '{file_name}' 的JSON-LD处理失败")
+    return render_owl_svg(processed_file, output_dir)
+
+
+def _init_render_worker(log_queue):
     setup_child_logger(log_queue)
 
-    process_name = multiprocessing.current_process().name
-    process_id = os.getpid()
-    logging.debug(f"[{process_name} PID:{process_id}] 开始处理文件 '{file_name}'.")
 
-    try:
-        # 首先检查文件是否为JSON-LD
-        processed_file = process_jsonld(file_name, output_dir)
-        if processed_file:
-            logging.debug(f"[{process_name} PID:{process_id}] 文件 '{file_name}' 已处理为 '{processed_file}'。")
-            # 无论是否转换，都尝试处理为OWL
-            result = process_owl(processed_file, output_dir)
-            if result:
-                logging.debug(f"[{process_name} PID:{process_id}] 完成文件 '{file_name}' 的处理，输出: '{result}'。")
-            else:
-                logging.warning(f"[{process_name} PID:{process_id}] 文件 '{file_name}' 的OWL处理未生成输出。")
-        else:
-            logging.warning(f"[{process_name} PID:{process_id}] 文件 '{file_name}' 的JSON-LD处理失败或被跳过。")
-    except Exception as e:
-        logging.error(
-            f"[{process_name} PID:{process_id}] 处理文件 '{file_name}' 时发生未知错误: {e}\n{traceback.format_exc()}")
-    finally:
-        logging.info(f"[{process_name} PID:{process_id}] 完成处理文件 '{file_name}'。")
+def _file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
 
 
-def process_files(file_list, output_dir, log_queue):
-    if not file_list:
-        logging.error("没有要处理的文件。")
-        return
-
-    logging.info(f"开始处理 {len(file_list)} 个文件，输出目录为 '{output_dir}'。")
-    processes = []
-    for file_name in file_list:
-        p = multiprocessing.Process(
-            target=handle_file,
-            args=(file_name, output_dir, log_queue),
-            name=f"Process-{os.path.basename(file_name)}"
-        )
-        processes.append(p)
-        logging.info(f"启动进程 {p.name} 处理文件 '{file_name}'。")
-        p.start()
+@dataclass
+class RenderResult:
+    """单个 OWL 文件的渲染结果"""
+    source: str
+    svg_path: Optional[str] = None
+    cached: bool = False
+    seconds: float = 0.0
+    error: Optional[str] = None
 
-    for p in processes:
-        p.join()
-        logging.info(f"进程 {p.name} 已完成。")
+    @property
+    def ok(self):
+        return self.error is None
 
-    logging.info("所有文件处理完成.")
 
+class OwlSvgRenderer:
+    """
+    常驻的 OWL 分类图渲染进程池
 
-def convert_owl_to_svg(files_to_process, output_directory):
-    multiprocessing.freeze_support()  # 兼容Windows
+    进程池在首次使用时创建并在之后的模型生成中复用（子进程只导入一次 owlready2 等依赖）；
+    同时在途的任务数不超过 max_pending 与进程数，提交的任务都能立即开始，超时从开始渲染算起；
+    某个文件超时后，收完其余在途任务再终止并重建进程池，剩余文件在新进程池中继续渲染；
+    成功的结果按 OWL 内容哈希缓存，失败原因通过 RenderResult.error 返回给调用方。
+    """
 
-    # 创建一个用于日志记录的多进程队列
-    log_queue = multiprocessing.Queue()
+    def __init__(self, processes=None, max_pending=8, timeout=120, cache_dir=SVG_CACHE_DIR):
+        self.processes = processes or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.cache_dir = cache_dir
+        self._pool = None
+        self._log_queue = None
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def _ensure_pool(self):
+        if self._pool is None:
+            multiprocessing.freeze_support()  # 兼容Windows
+            self._log_queue = multiprocessing.Queue()
+            self._listener = setup_main_logger(self._log_queue)
+            self._pool = multiprocessing.Pool(self.processes, initializer=_init_render_worker,
+                                              initargs=(self._log_queue,))
+        return self._pool
+
+    def _cache_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}_v{SVG_CACHE_VERSION}.svg")
+
+    def render(self, files, output_dir, timeout=None):
+        """渲染 files 到 output_dir，返回与 files 顺序一致的 RenderResult 列表"""
+        timeout = self.timeout if timeout is None else timeout
+        os.makedirs(output_dir, exist_ok=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        results = [RenderResult(source=f) for f in files]
+
+        # 1. 命中内容哈希缓存的直接复制
+        pending = []
+        for result in results:
+            if not os.path.exists(result.source):
+                result.error = f"文件未找到: '{result.source}'"
+                continue
+            digest = _file_sha256(result.source)
+            cache_path = self._cache_path(digest)
+            svg_path = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(result.source))[0]}.svg")
+            if os.path.exists(cache_path):
+                shutil.copyfile(cache_path, svg_path)
+                result.svg_path, result.cached = svg_path, True
+                logging.info(f"SVG 缓存命中: '{result.source}'")
+            else:
+                pending.append((result, digest))
+        if not pending:
+            return results
+
+        # 2. 其余文件交给进程池；在途任务数不超过进程数，避免排队等待的时间计入超时
+        with self._lock:
+            limit = max(1, min(self.max_pending, self.processes))
+            queue = list(pending)
+            in_flight = []
+
+            def collect(item):
+                result, digest, async_result, start = item
+                try:
+                    remaining = max(0.0, timeout - (time.perf_counter() - start))
+                    svg_path = async_result.get(remaining)
+                    result.svg_path = svg_path
+                    shutil.copyfile(svg_path, self._cache_path(digest))
+                except multiprocessing.TimeoutError:
+                    result.error = f"渲染超时（{timeout}s）"
+                    return False
+                except Exception as e:
+                    result.error = str(e) or e.__class__.__name__
+                finally:
+                    result.seconds = time.perf_counter() - start
+                return True
+
+            while queue or in_flight:
+                while queue and len(in_flight) < limit:
+                    result, digest = queue.pop(0)
+                    async_result = self._ensure_pool().apply_async(_render_task, (result.source, output_dir))
+                    in_flight.append((result, digest, async_result, time.perf_counter()))
+                if not collect(in_flight.pop(0)):
+                    # 卡住的渲染进程仍占用工作进程且无法单独终止：
+                    # 先收完其余在途任务，再整体重建进程池
+                    for item in in_flight:
+                        collect(item)
+                    in_flight = []
+                    logging.warning("存在超时的渲染任务，重建渲染进程池。")
+                    self._shutdown(terminate=True)
+
+        for result in results:
+            if result.error:
+                logging.error(f"渲染 '{result.source}' 失败: {result.error}")
+        return results
+
+    def _shutdown(self, terminate=False):
+        if self._pool is not None:
+            if terminate:
+                self._pool.terminate()
+            else:
+                self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
 
-    # 配置主日志记录器并启动监听器
-    listener = setup_main_logger(log_queue)
+    def close(self):
+        with self._lock:
+            self._shutdown()
 
-    try:
 
-        # 确保输出目录存在
-        os.makedirs(output_directory, exist_ok=True)
+_renderer = None
+_renderer_lock = threading.Lock()
 
-        # 开始处理文件
-        process_files(files_to_process, output_directory, log_queue)
 
-    finally:
-        # 确保在程序结束时停止QueueListener
-        listener.stop()
+def get_renderer():
+    """进程内共享的渲染器，程序退出时关闭进程池"""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = OwlSvgRenderer()
+            atexit.register(_renderer.close)
+        return _renderer
+
+
+def convert_owl_to_svg(files_to_process, output_directory, timeout=None):
+    """
+    把 OWL 文件的分类图渲染为 output_directory 下的 SVG。
+
+    使用常驻渲染进程池，内容未变化的文件直接复用缓存；返回 RenderResult 列表，
+    失败的文件在 error 中给出原因。
+    """
+    if not files_to_process:
+        logging.error("没有要处理的文件。")
+        return []
+    return get_renderer().render(files_to_process, output_directory, timeout)
 
 
 def main():
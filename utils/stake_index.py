@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# @FileName: stake_index.py
+# @Software: PyCharm
+"""
+桩号坐标索引：road_position_information.xlsx 每个进程只解析一次，文件修改时间变化时自动重建。
+
+- 精确查询：按规范化后的桩号名称 O(1) 命中
+- 插值查询：表中没有的桩号按里程在相邻两个桩号之间线性插值
+- 批量查询：一次查询多个桩号
+"""
+import bisect
+import logging
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+DEFAULT_STAKE_FILE = os.path.join(os.path.dirname(__file__), '../data/required_information/road_position_information.xlsx')
+
+Coordinate = Tuple[float, float]  # (经度, 纬度)
+
+# 形如 K12+300、k12+300.5 的里程桩号
+_CHAINAGE_PATTERN = re.compile(r'^[Kk]\s*(\d+(?:\.\d+)?)\s*(?:\+\s*(\d+(?:\.\d+)?))?$')
+
+
+def normalize_stake(stake) -> str:
+    """桩号名称规范化：去空白、统一大写，数值型桩号 1.0 与 "1" 视为同一桩号"""
+    if isinstance(stake, float) and stake.is_integer():
+        stake = int(stake)
+    text = str(stake).strip().upper()
+    try:
+        value = float(text)
+        if value.is_integer():
+            return str(int(value))
+    except ValueError:
+        pass
+    return re.sub(r'\s+', '', text)
+
+
+def stake_mileage(stake) -> Optional[float]:
+    """
+    桩号对应的里程（米），用于排序与插值
+
+    K12+300 -> 12300；纯数字桩号按公里数处理 -> 数值 × 1000；无法解析时返回 None。
+    """
+    text = normalize_stake(stake)
+    match = _CHAINAGE_PATTERN.match(text)
+    if match:
+        return float(match.group(1)) * 1000 + float(match.group(2) or 0)
+    try:
+        return float(text) * 1000
+    except ValueError:
+        return None
+
+
+class StakeIndex:
+    """桩号 -> 经纬度的内存索引"""
+
+    def __init__(self, coordinates: Dict[str, Coordinate]):
+        self._coordinates = coordinates
+        # 可解析里程的桩号按里程排序，供插值时二分查找相邻桩号
+        chain = sorted((m, c) for m, c in ((stake_mileage(s), c) for s, c in coordinates.items()) if m is not None)
+        self._mileages = [m for m, _ in chain]
+        self._chain = [c for _, c in chain]
+
+    @classmethod
+    def from_excel(cls, path: str) -> 'StakeIndex':
+        df = pd.read_excel(path, header=0, usecols=['桩号名称', '经度', '维度'])
+        df = df.dropna(subset=['桩号名称', '经度', '维度'])
+        coordinates = {}
+        for stake, longitude, latitude in zip(df['桩号名称'], df['经度'], df['维度']):
+            # 与原先按行扫描一致：同名桩号取第一条
+            coordinates.setdefault(normalize_stake(stake), (float(longitude), float(latitude)))
+        logging.info(f"已加载桩号索引 {path}，共 {len(coordinates)} 个桩号")
+        return cls(coordinates)
+
+    def __len__(self):
+        return len(self._coordinates)
+
+    def exact(self, stake) -> Optional[Coordinate]:
+        return self._coordinates.get(normalize_stake(stake))
+
+    def lookup(self, stake, interpolate: bool = True) -> Optional[Coordinate]:
+        """精确命中优先；否则在相邻桩号之间按里程线性插值（超出首尾范围时返回 None）"""
+        coordinate = self.exact(stake)
+        if coordinate is not None or not interpolate:
+            return coordinate
+        mileage = stake_mileage(stake)
+        if mileage is None or not self._mileages:
+            return None
+        i = bisect.bisect_left(self._mileages, mileage)
+        if i == 0 or i == len(self._mileages):
+            return None
+        m0, m1 = self._mileages[i - 1], self._mileages[i]
+        (lon0, lat0), (lon1, lat1) = self._chain[i - 1], self._chain[i]
+        ratio = (mileage - m0) / (m1 - m0)
+        return lon0 + (lon1 - lon0) * ratio, lat0 + (lat1 - lat0) * ratio
+
+    def lookup_many(self, stakes: Iterable, interpolate: bool = True) -> Dict:
+        """批量查询，返回 {原始桩号: 坐标或 None}"""
+        return {stake: self.lookup(stake, interpolate) for stake in stakes}
+
+
+_indexes: Dict[str, Tuple[float, StakeIndex]] = {}
+_index_lock = threading.Lock()
+
+
+def get_stake_index(path: str = DEFAULT_STAKE_FILE) -> StakeIndex:
+    """进程内共享的桩号索引，文件修改时间变化时重新加载"""
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(path)
+    with _index_lock:
+        cached = _indexes.get(path)
+        if cached is None or cached[0] != mtime:
+            _indexes[path] = (mtime, StakeIndex.from_excel(path))
+        return _indexes[path][1]
+
+
+def lookup_stakes(stakes: List, path: str = DEFAULT_STAKE_FILE, interpolate: bool = True) -> Dict:
+    """批量查询桩号坐标"""
+    return get_stake_index(path).lookup_many(stakes, interpolate)
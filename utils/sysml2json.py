@@ -1,9 +1,10 @@
 import json
 import re
-import openpyxl
 import os
 import argparse
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Iterable, Iterator, NamedTuple, TextIO, Union
+
+from utils.table_export import table_path, write_table
 
 
 def parse_arguments() -> Tuple[str, str]:
@@ -282,6 +283,198 @@ def process_actions(result: List[Dict[str, Any]]) -> None:
                 item["outparams"] = outparams
 
 
+# ---------------------------------------------------------------------------
+# 单遍解析：逐行切分为记号，递归下降处理块结构，直接产出扁平记录。
+# 结果与 parse_to_json -> extract_data -> process_states -> process_actions 一致，
+# 状态转移与动作参数通过名称索引在解析结束时一次关联，整体为线性时间。
+# ---------------------------------------------------------------------------
+
+_DATATYPE_KEYWORDS = ['Boolean', 'String', 'Integer', 'Real', 'Enum', 'Bool']
+# 只参与状态转移计算、不出现在结果中的类型
+_TRANSIENT_TYPES = ('then', 'entry', 'accept', 'state')
+
+
+class SysmlToken(NamedTuple):
+    """一行 SysML2 文本对应的记号：kind 为 package / open / close / stmt"""
+    kind: str
+    line: str
+    parts: List[str]
+
+
+def tokenize_sysml(lines: Iterable[str]) -> Iterator[SysmlToken]:
+    """把文本行切分为记号，空行被跳过"""
+    for raw in lines:
+        line = raw.strip()
+        if not line:
+            continue
+        if 'package' in line:
+            yield SysmlToken('package', line, line.split(' ', 1))
+        elif line.endswith('{'):
+            yield SysmlToken('open', line, line[:-1].strip().split(' '))
+        elif line == '}':
+            yield SysmlToken('close', line, [])
+        else:
+            yield SysmlToken('stmt', line, [p.replace(';', '') for p in line.split(' ')])
+
+
+class SysmlParser:
+    """
+    SysML2 子集的递归下降解析器
+
+        records = SysmlParser(tokenize_sysml(lines)).parse()
+
+    记录按先序排列（块本身在其内容之前），字段顺序为 @type、@name、parent 及其余字段。
+    """
+
+    def __init__(self, tokens: Iterable[SysmlToken]):
+        self._tokens = iter(tokens)
+        self._records: List[Dict[str, Any]] = []
+        # 语句的 owner 取最近一次打开的块名（与原实现一致，块关闭后不恢复）
+        self._owner = ""
+        # 状态组 / 动作输入组 / 动作输出组：每个 def 开始新组，之前的零散项构成首组
+        self._state_groups: List[List[Dict[str, Any]]] = []
+        self._in_groups: List[List[Dict[str, Any]]] = []
+        self._out_groups: List[List[Dict[str, Any]]] = []
+        self._state_defs: List[Dict[str, Any]] = []
+        self._action_defs: List[Dict[str, Any]] = []
+
+    def parse(self) -> List[Dict[str, Any]]:
+        root = self._emit({"@type": "package", "@name": ""})
+        self._parse_block(root, top=True)
+        self._link_states()
+        self._link_actions()
+        return self._records
+
+    def _parse_block(self, block: Dict[str, Any], top: bool = False) -> None:
+        for token in self._tokens:
+            if token.kind == 'package':
+                _, name = token.parts
+                block["@name"] = name.rstrip('{').strip()
+            elif token.kind == 'open':
+                self._parse_block(self._open_block(token.parts))
+            elif token.kind == 'close':
+                if not top:
+                    return
+            else:
+                self._emit(self._statement(token.parts, block))
+
+    def _open_block(self, parts: List[str]) -> Dict[str, Any]:
+        self._owner = parts[1] if len(parts) > 1 else ""
+        record = {"@type": parts[0], "@name": ""}
+        # 检查是否有冒号（表示继承关系）
+        if ':' in parts:
+            colon_index = parts.index(':')
+            record["@type"] += "Sub"
+            record["@name"] = parts[1]
+            record["parent"] = parts[colon_index + 1].strip()
+        elif len(parts) > 2 and "def" in parts[1]:
+            record["@type"] += f" {parts[1]}"
+            record["@name"] = parts[2]
+        else:
+            record["@name"] = parts[1] if len(parts) > 1 else ""
+        return self._emit(record)
+
+    def _statement(self, parts: List[str], block: Dict[str, Any]) -> Dict[str, Any]:
+        owner = self._owner
+        if ':' in parts:
+            idx = parts.index(':')
+            name = parts[idx - 1]
+            type_parts = ' '.join(parts[:idx - 1])
+            if any(keyword in parts[idx + 1] for keyword in _DATATYPE_KEYWORDS):
+                datavalue = ' '.join(parts[idx + 3:]) if (idx + 2 < len(parts) and parts[idx + 2] == '=') else None
+                record = {"@type": type_parts, "@name": name, "datatype": parts[idx + 1], "owner": owner}
+                if datavalue:
+                    record["datavalue"] = datavalue
+                return record
+            if 'ref' in parts and 'part' in parts:
+                return {"@type": 'partAssociate', "@name": parts[2], "datavalue": parts[idx + 1], "owner": owner}
+            if 'perform' in parts and 'action' in parts:
+                return {"@type": 'actionSub', "@name": name, "parent": parts[idx + 1], "owner": owner}
+            if 'item' in parts:
+                return {"@type": type_parts, "@name": name, "parent": parts[idx + 1], "owner": owner}
+            return {"@type": type_parts, "@name": name, "datavalue": parts[idx + 1]}
+
+        if len(parts) == 1:
+            return {"@type": block.get("@name", ""), "@name": parts[0]}
+        if 'def' in parts:
+            return {"@type": ' '.join(parts[:2]), "@name": ''.join(parts[2:]).rstrip('{}')}
+        if 'ref' in parts and 'part' in parts:
+            return {"@type": 'partAssociate', "@name": parts[2], "owner": owner}
+        if 'perform' in parts and 'action' in parts:
+            return {"@type": 'actionSub', "@name": parts[2], "owner": owner}
+        if 'exhibit' in parts and 'state' in parts:
+            return {"@type": 'exhibitState', "@name": parts[2], "owner": owner}
+        if 'redefines' in parts:
+            if parts[-2] == '=':
+                return {"@type": parts[0], "@name": parts[2], "datavalue": parts[-1], "owner": owner}
+            return {"@type": parts[0], "@name": parts[2], "owner": owner}
+        return {"@type": parts[0], "@name": parts[1] if len(parts) > 1 else ""}
+
+    def _emit(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        record_type = record["@type"]
+        if record_type == 'state def':
+            self._state_defs.append(record)
+            self._state_groups.append([record])
+        elif record_type in ('state', 'accept', 'then'):
+            self._append_to_group(self._state_groups, record)
+        elif record_type == 'action def':
+            self._action_defs.append(record)
+            self._in_groups.append([record])
+            self._out_groups.append([record])
+        elif record_type == 'in':
+            self._append_to_group(self._in_groups, record)
+        elif record_type == 'out':
+            self._append_to_group(self._out_groups, record)
+
+        if record_type not in _TRANSIENT_TYPES:
+            self._records.append(record)
+        return record
+
+    @staticmethod
+    def _append_to_group(groups: List[List[Dict[str, Any]]], record: Dict[str, Any]) -> None:
+        if not groups:
+            groups.append([])
+        groups[-1].append(record)
+
+    @staticmethod
+    def _index_by_name(records: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        # 名称在解析结束时读取：package 行可能在块打开后才修改其名称
+        index: Dict[str, List[Dict[str, Any]]] = {}
+        for record in records:
+            index.setdefault(record["@name"], []).append(record)
+        return index
+
+    def _link_states(self) -> None:
+        state_defs = self._index_by_name(self._state_defs)
+        for group in self._state_groups:
+            state_names = list(dict.fromkeys(item["@name"] for item in group))
+            transitions = [
+                {'source': state_names[n], 'transit': state_names[n + 1], 'target': state_names[n + 2]}
+                for n in range(1, len(state_names) - 2, 2)
+            ]
+            for item in state_defs.get(state_names[0], []):
+                item["transitions"] = transitions
+
+    def _link_actions(self) -> None:
+        action_defs = self._index_by_name(self._action_defs)
+        for groups, key in ((self._in_groups, "inparams"), (self._out_groups, "outparams")):
+            for group in groups:
+                names = [item["@name"] for item in group]
+                for item in action_defs.get(names[0], []):
+                    item[key] = names[1:]
+
+
+def parse_sysml(source: Union[str, TextIO, Iterable[str]]) -> List[Dict[str, Any]]:
+    """
+    解析 SysML2 文件路径、文本流或文本行，返回已关联状态转移与动作参数的扁平记录
+    （相当于 parse_to_json + extract_data + process_states + process_actions）
+    """
+    if isinstance(source, str):
+        with open(source, 'r', encoding='utf-8') as f:
+            return SysmlParser(tokenize_sysml(f)).parse()
+    return SysmlParser(tokenize_sysml(source)).parse()
+
+
 def rename_types(result: List[Dict[str, Any]]) -> None:
     """重命名类型以统一命名规范。"""
     type_mapping = {
@@ -371,17 +564,15 @@ def print_type_name_dict(type_name_dict: Dict[str, List[str]]) -> None:
         print(f"type: '{item_type}' ------> name: {item_names}")
 
 
-def save_to_excel(result: List[Dict[str, Any]], excel_path: str) -> None:
-    """将结果保存为 Excel 文件。"""
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    headers = [
-        "type", "name", "children", "parent", "datatype",
-        "datavalue", "owner", "inparams", "outparams",
-        "transitions.source", "transitions.transit", "transitions.target"
-    ]
-    sheet.append(headers)
+RESULT_TABLE_HEADERS = [
+    "type", "name", "children", "parent", "datatype",
+    "datavalue", "owner", "inparams", "outparams",
+    "transitions.source", "transitions.transit", "transitions.target"
+]
 
+
+def result_rows(result: List[Dict[str, Any]]) -> Iterator[List[Any]]:
+    """把结果展开为表格行（与 RESULT_TABLE_HEADERS 对应）。"""
     for item in result:
         base_data = [
             item.get("@type", ""),
@@ -396,67 +587,79 @@ def save_to_excel(result: List[Dict[str, Any]], excel_path: str) -> None:
         # 处理 transitions
         if "transitions" in item:
             for transition in item["transitions"]:
-                row = base_data + [
+                yield base_data + [
                     transition.get("source", ""),
                     transition.get("transit", ""),
                     transition.get("target", "")
                 ]
-                sheet.append(row)
         else:
             # 处理 inparams 和 outparams
             inparams = item.get("inparams", [])
             outparams = item.get("outparams", [])
             max_len = max(len(inparams), len(outparams)) if inparams or outparams else 1
             for i in range(max_len):
-                row = base_data.copy()
-                row += [
+                yield base_data + [
                     inparams[i] if i < len(inparams) else "",
                     outparams[i] if i < len(outparams) else "",
                     "",
                     "",
                     ""
                 ]
-                sheet.append(row)
 
             if not inparams and not outparams:
-                sheet.append(base_data)
+                yield base_data
+
 
+def save_table(result: List[Dict[str, Any]], output_path: str) -> None:
+    """将结果保存为表格，格式由扩展名决定（csv / xlsx / parquet / feather）。"""
     try:
-        workbook.save(excel_path)
-        print(f"成功保存 Excel 文件：{excel_path}")
+        write_table(RESULT_TABLE_HEADERS, result_rows(result), output_path)
+        print(f"成功保存表格文件：{output_path}")
     except Exception as e:
-        print(f"保存 Excel 文件时发生错误：{e}")
+        print(f"保存表格文件时发生错误：{e}")
 
 
-def process_file(input_path: str, output_dir: str) -> None:
-    input_str = read_input_file(input_path)
-    filename = os.path.splitext(os.path.basename(input_path))[0]
-
-    if not input_str:
-        return
-
-    parsed_json = parse_to_json(input_str)
-    data_new = extract_data(parsed_json)
+def save_to_excel(result: List[Dict[str, Any]], excel_path: str) -> None:
+    """将结果保存为 Excel 文件。"""
+    save_table(result, excel_path)
 
-    result = []
-    temp = {}
 
-    for key, value in data_new:
-        if key == '@type':
-            if temp:
-                result.append(temp)
-            temp = {}
-        temp[key] = value
+def export_result_tables(result_dir: str, formats: Iterable[str] = ('csv',)) -> List[str]:
+    """
+    按需导出：读取 result_dir 下已生成的 JSON 结果，为每个文件写出指定格式的表格，
+    不重新解析 SysML2 文本。返回写出的文件路径。
+    """
+    written = []
+    for file_name in sorted(os.listdir(result_dir)):
+        if not file_name.endswith('.json'):
+            continue
+        with open(os.path.join(result_dir, file_name), 'r', encoding='utf-8') as f:
+            result = json.load(f)
+        name = os.path.splitext(file_name)[0]
+        for fmt in formats:
+            output_path = table_path(result_dir, name, fmt)
+            save_table(result, output_path)
+            written.append(output_path)
+    return written
+
+
+def process_file(input_path: str, output_dir: str, tables: Iterable[str] = ('xlsx',)) -> None:
+    """
+    解析 SysML2 文件并保存 <文件名>.json；tables 为同时写出的表格格式，
+    传入空元组时只写 JSON（表格可稍后用 export_result_tables 按需导出）。
+    """
+    filename = os.path.splitext(os.path.basename(input_path))[0]
 
-        # 确保 parent 字段被保留
-        if key == 'parent' and value:
-            temp['parent'] = value
+    try:
+        if os.path.getsize(input_path) == 0:
+            return
+        # 逐行流式解析，状态与动作参数在解析过程中关联
+        result = parse_sysml(input_path)
+    except FileNotFoundError:
+        print(f"错误：输入文件 '{input_path}' 未找到。")
+        return
 
-    if temp:
-        result.append(temp)
     # 处理不同的数据部分
-    process_states(result)
-    process_actions(result)
     rename_types(result)
     process_attributes(result)
     process_part_associates(result)
@@ -469,9 +672,9 @@ def process_file(input_path: str, output_dir: str) -> None:
     type_name_dict = create_type_name_dict(result)
     print_type_name_dict(type_name_dict)
 
-    # 保存到 Excel
-    excel_output_path = os.path.join(output_dir, f"{filename}.xlsx")
-    save_to_excel(result, excel_output_path)
+    # 保存表格
+    for fmt in tables:
+        save_table(result, table_path(output_dir, filename, fmt))
 
 
 def main():
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18
+# @FileName: table_export.py
+# @Software: PyCharm
+"""
+表格导出：把 (表头, 行) 写为 CSV / Excel / Parquet / Feather。
+
+- csv：标准库逐行写出，带 BOM 便于 Excel 直接打开，默认格式
+- xlsx：openpyxl 只写模式（write_only），不在内存中保留单元格对象
+- parquet / feather：列式格式，需要安装 pyarrow
+"""
+
+import csv
+import os
+from typing import Any, Iterable, List, Optional, Sequence
+
+TABLE_FORMATS = ('csv', 'xlsx', 'parquet', 'feather')
+
+
+def table_path(output_dir: str, name: str, fmt: str) -> str:
+    """输出目录下 <name>.<fmt> 的路径"""
+    return os.path.join(output_dir, f"{name}.{fmt}")
+
+
+def write_table(headers: Sequence[str], rows: Iterable[Sequence[Any]], output_path: str,
+                sheet_title: Optional[str] = None) -> str:
+    """按输出文件扩展名选择格式写出表格，返回输出路径"""
+    fmt = os.path.splitext(output_path)[1].lstrip('.').lower()
+    if fmt == 'csv':
+        _write_csv(headers, rows, output_path)
+    elif fmt == 'xlsx':
+        _write_xlsx(headers, rows, output_path, sheet_title)
+    elif fmt in ('parquet', 'feather'):
+        _write_arrow(headers, rows, output_path, fmt)
+    else:
+        raise ValueError(f"不支持的表格格式: {fmt}（可选 {', '.join(TABLE_FORMATS)}）")
+    return output_path
+
+
+def _write_csv(headers: Sequence[str], rows: Iterable[Sequence[Any]], output_path: str) -> None:
+    with open(output_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        writer.writerows(rows)
+
+
+def _write_xlsx(headers: Sequence[str], rows: Iterable[Sequence[Any]], output_path: str,
+                sheet_title: Optional[str]) -> None:
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title[:31] if sheet_title else None)
+    sheet.append(list(headers))
+    for row in rows:
+        sheet.append(list(row))
+    workbook.save(output_path)
+
+
+def _write_arrow(headers: Sequence[str], rows: Iterable[Sequence[Any]], output_path: str, fmt: str) -> None:
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError(f"导出 {fmt} 需要安装 pyarrow（pip install pyarrow），或改用 csv 格式")
+
+    columns: List[List[str]] = [[] for _ in headers]
+    for row in rows:
+        # 短行用空字符串补齐，保证各列等长
+        for i, column in enumerate(columns):
+            value = row[i] if i < len(row) else None
+            column.append("" if value is None else str(value))
+    table = pa.table({name: pa.array(column, type=pa.string()) for name, column in zip(headers, columns)})
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, output_path, compression='zstd')
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, output_path, compression='zstd')
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+# @FileName: travel_time.py
+# @Software: PyCharm
+"""
+行驶时间服务：为 responseDuration 证据提供资源到事故点的行驶时间。
+
+- 持久化缓存：按取整后的起终点坐标缓存结果（SQLite），支持 TTL 与 LRU 淘汰
+- 有界并发：在线查询通过固定大小的线程池并发执行
+- 可插拔后端：高德在线路径规划、预计算的离线矩阵、或基于球面距离与速度的估算
+"""
+import csv
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from utils.get_config import get_cfg
+
+Coordinate = Tuple[float, float]  # (经度, 纬度)
+
+DEFAULT_CACHE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../data/cache/travel_time.sqlite'))
+
+
+def round_coordinate(coordinate: Coordinate, precision: int = 4) -> Coordinate:
+    """坐标取整（4 位小数约 10 米），作为缓存键"""
+    return round(float(coordinate[0]), precision), round(float(coordinate[1]), precision)
+
+
+def haversine_km(origin: Coordinate, destination: Coordinate) -> float:
+    """两点间的球面距离（千米）"""
+    lon1, lat1 = map(math.radians, origin)
+    lon2, lat2 = map(math.radians, destination)
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+class TravelTimeBackend:
+    """行驶时间后端基类"""
+    name = 'base'
+    # 是否为在线后端（在线后端才需要并发与限流）
+    remote = False
+
+    def travel_time(self, origin: Coordinate, destination: Coordinate) -> Optional[float]:
+        """返回行驶时间（秒），无法获取时返回 None"""
+        raise NotImplementedError
+
+
+class AmapBackend(TravelTimeBackend):
+    """
+    高德驾车路径规划 API
+
+    并发查询时各请求之间仍保持至少 min_interval 秒的间隔，避免超出 Key 的 QPS 配额；
+    单个请求最多等待 request_timeout 秒，超时视为无法获取（返回 None），不会卡住界面；
+    未配置 Key 时不发请求，直接返回 None（与未接入高德时一样不产生 responseDuration 证据）。
+    """
+    name = 'amap'
+    remote = True
+
+    def __init__(self, api_key: Optional[str], min_interval: float = 0.2, request_timeout: float = 10.0):
+        self.api_key = api_key
+        self.min_interval = max(0.0, min_interval)
+        self.request_timeout = request_timeout
+        self._lock = threading.Lock()
+        self._next_request = 0.0
+
+    def _wait_turn(self) -> None:
+        """按 min_interval 为每个请求分配发送时刻，未到时刻则等待"""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_request)
+            self._next_request = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+    def travel_time(self, origin: Coordinate, destination: Coordinate) -> Optional[float]:
+        if not self.api_key:
+            return None
+        from utils.plan import get_driving_time
+        self._wait_turn()
+        try:
+            return get_driving_time(origin, destination, self.api_key, timeout=self.request_timeout)
+        except Exception as e:
+            logging.error(f"高德路径规划请求失败: {e}")
+            return None
+
+
+class HaversineBackend(TravelTimeBackend):
+    """离线估算：球面距离 × 绕行系数 / 应急车辆速度，结果确定，可用于无网络环境与测试"""
+    name = 'haversine'
+
+    def __init__(self, speed_kmh: float = 60.0, detour_factor: float = 1.3):
+        self.speed_kmh = speed_kmh
+        self.detour_factor = detour_factor
+
+    def travel_time(self, origin: Coordinate, destination: Coordinate) -> Optional[float]:
+        distance = haversine_km(origin, destination) * self.detour_factor
+        return distance / self.speed_kmh * 3600.0
+
+
+class MatrixBackend(TravelTimeBackend):
+    """
+    离线预计算矩阵
+
+    文件为 CSV（列：origin_lon, origin_lat, dest_lon, dest_lat, seconds）或同字段的 JSON 列表；
+    矩阵中没有的点对交给 fallback 后端（默认不估算，返回 None）。
+    """
+    name = 'matrix'
+
+    def __init__(self, path: str, fallback: Optional[TravelTimeBackend] = None, precision: int = 4):
+        self.path = path
+        self.fallback = fallback
+        self.precision = precision
+        self._matrix: Dict[Tuple[Coordinate, Coordinate], float] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if self.path.lower().endswith('.json'):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                rows = json.load(f)
+        else:
+            with open(self.path, 'r', encoding='utf-8', newline='') as f:
+                rows = list(csv.DictReader(f))
+        for row in rows:
+            origin = round_coordinate((row['origin_lon'], row['origin_lat']), self.precision)
+            destination = round_coordinate((row['dest_lon'], row['dest_lat']), self.precision)
+            self._matrix[(origin, destination)] = float(row['seconds'])
+        logging.info(f"已加载离线行驶时间矩阵 {self.path}，共 {len(self._matrix)} 条")
+
+    def travel_time(self, origin: Coordinate, destination: Coordinate) -> Optional[float]:
+        key = (round_coordinate(origin, self.precision), round_coordinate(destination, self.precision))
+        if key in self._matrix:
+            return self._matrix[key]
+        if self.fallback is not None:
+            return self.fallback.travel_time(origin, destination)
+        return None
+
+
+class TravelTimeCache:
+    """基于 SQLite 的持久化行驶时间缓存，支持 TTL 过期与按最近访问时间的 LRU 淘汰"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl_seconds: float = 7 * 24 * 3600,
+                 max_entries: int = 100000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS travel_time ("
+            " cache_key TEXT PRIMARY KEY, seconds REAL, created_at REAL, accessed_at REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_travel_time_accessed ON travel_time (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(backend: str, origin: Coordinate, destination: Coordinate) -> str:
+        return f"{backend}|{origin[0]:.4f},{origin[1]:.4f}|{destination[0]:.4f},{destination[1]:.4f}"
+
+    def get_many(self, keys: List[str]) -> Dict[str, float]:
+        """批量读取未过期的缓存项，并刷新其访问时间"""
+        if not keys:
+            return {}
+        now = time.time()
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT cache_key, seconds FROM travel_time WHERE cache_key IN ({placeholders})"
+                    f" AND created_at >= ?", (*chunk, now - self.ttl_seconds)).fetchall()
+                found.update(rows)
+            if found:
+                self._conn.executemany("UPDATE travel_time SET accessed_at = ? WHERE cache_key = ?",
+                                       [(now, key) for key in found])
+                self._conn.commit()
+        return found
+
+    def put_many(self, items: Dict[str, float]) -> None:
+        """批量写入缓存项，超过容量时淘汰最久未访问的条目"""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO travel_time (cache_key, seconds, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?)", [(key, seconds, now, now) for key, seconds in items.items()])
+            self._conn.execute("DELETE FROM travel_time WHERE created_at < ?", (now - self.ttl_seconds,))
+            overflow = self._conn.execute("SELECT COUNT(*) FROM travel_time").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM travel_time WHERE cache_key IN ("
+                    " SELECT cache_key FROM travel_time ORDER BY accessed_at ASC LIMIT ?)", (overflow,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM travel_time")
+            self._conn.commit()
+
+
+class TravelTimeService:
+    """带缓存与有界并发的行驶时间查询服务"""
+
+    def __init__(self, backend: TravelTimeBackend, cache: Optional[TravelTimeCache] = None,
+                 max_workers: int = 4):
+        self.backend = backend
+        self.cache = cache
+        self.max_workers = max(1, max_workers)
+
+    def travel_times(self, origin: Coordinate, destinations: List[Coordinate]) -> List[Optional[float]]:
+        """
+        查询一个起点到多个终点的行驶时间（秒），顺序与 destinations 一致
+
+        先查缓存，未命中的点对去重后交给后端；在线后端通过线程池并发查询。
+        """
+        origin = round_coordinate(origin)
+        destinations = [round_coordinate(d) for d in destinations]
+        keys = [TravelTimeCache.make_key(self.backend.name, origin, d) for d in destinations]
+
+        known = self.cache.get_many(list(dict.fromkeys(keys))) if self.cache is not None else {}
+        missing = {key: dest for key, dest in zip(keys, destinations) if key not in known}
+
+        if missing:
+            if self.backend.remote and len(missing) > 1:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as pool:
+                    fetched = dict(zip(missing, pool.map(lambda d: self.backend.travel_time(origin, d),
+                                                         missing.values())))
+            else:
+                fetched = {key: self.backend.travel_time(origin, dest) for key, dest in missing.items()}
+            fetched = {key: seconds for key, seconds in fetched.items() if seconds is not None}
+            if self.cache is not None:
+                self.cache.put_many(fetched)
+            known.update(fetched)
+
+        return [known.get(key) for key in keys]
+
+
+_service: Optional[TravelTimeService] = None
+_service_lock = threading.Lock()
+
+
+def create_travel_time_service(config: Dict) -> TravelTimeService:
+    """
+    根据配置创建行驶时间服务
+
+    配置项 travel_time：
+        backend: "amap" | "matrix" | "haversine"
+            只有显式配置为 haversine 时才使用直线距离估算；amap 未配置 Key 时记录警告并不返回行驶时间
+        matrix_path: 离线矩阵文件路径（backend 为 matrix 时使用，矩阵中没有的点对交给高德查询）
+        min_interval_seconds: 高德请求之间的最小间隔（秒），默认 0.2
+        request_timeout_seconds: 单个高德请求的超时（秒），默认 10，超时按无法获取处理
+        detour_factor: 估算时的绕行系数
+        cache_path / cache_ttl_hours / cache_max_entries: 持久化缓存设置，cache_enabled 为 false 时不缓存
+        max_workers: 在线查询的最大并发数
+    估算速度取全局 emergency_speed（千米/小时）。
+    """
+    tt_cfg = config.get('travel_time', {})
+    api_key = config.get('gaode-map', {}).get('web_service_key')
+    backend_name = tt_cfg.get('backend', 'amap')
+    if backend_name == 'haversine':
+        backend = HaversineBackend(speed_kmh=float(config.get('emergency_speed', 60)),
+                                   detour_factor=float(tt_cfg.get('detour_factor', 1.3)))
+    else:
+        if backend_name not in ('amap', 'matrix'):
+            logging.warning(f"未知的行驶时间后端 '{backend_name}'，使用高德路径规划")
+        if not api_key:
+            logging.warning("未配置 gaode-map.web_service_key，无法查询高德行驶时间，responseDuration 证据将缺失；"
+                            "如需离线估算请将 travel_time.backend 设为 haversine")
+        backend = AmapBackend(api_key, min_interval=float(tt_cfg.get('min_interval_seconds', 0.2)),
+                              request_timeout=float(tt_cfg.get('request_timeout_seconds', 10)))
+        if backend_name == 'matrix':
+            if tt_cfg.get('matrix_path'):
+                matrix_path = tt_cfg['matrix_path']
+                if not os.path.isabs(matrix_path):
+                    matrix_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', matrix_path))
+                backend = MatrixBackend(matrix_path, fallback=backend)
+            else:
+                logging.warning("travel_time.backend 为 matrix 但未配置 matrix_path，使用高德路径规划")
+
+    cache = None
+    if tt_cfg.get('cache_enabled', True):
+        cache = TravelTimeCache(path=tt_cfg.get('cache_path', DEFAULT_CACHE_PATH),
+                                ttl_seconds=float(tt_cfg.get('cache_ttl_hours', 24 * 7)) * 3600,
+                                max_entries=int(tt_cfg.get('cache_max_entries', 100000)))
+    return TravelTimeService(backend, cache, max_workers=int(tt_cfg.get('max_workers', 4)))
+
+
+def get_travel_time_service() -> TravelTimeService:
+    """进程内共享的行驶时间服务，首次调用时读取配置"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = create_travel_time_service(get_cfg())
+        return _service
+
+
+def set_travel_time_service(service: Optional[TravelTimeService]) -> None:
+    """替换进程内共享的服务（如切换为离线后端），传入 None 时下次调用重新读取配置"""
+    global _service
+    with _service_lock:
+        _service = service
@@ -20,7 +20,7 @@ from sqlalchemy.orm import Session
 
 # 假设你的 models / utils / views 路径与本示例一致，这里仅示例。
 from models.models import Template, Category
-from utils.bn_svg_update import update_with_evidence
+from utils.bn_svg_update import update_with_evidence, flush_persistence
 from utils.get_config import get_cfg
 from utils.plan import PlanData, PlanDataCollector, convert_to_evidence
 from views.dialogs.custom_information_dialog import CustomInformationDialog
@@ -1160,13 +1160,9 @@ class ConditionSettingTab(QWidget):
             os.path.dirname(os.path.abspath(__file__)), f"../../data/bn/{self.scenario_id}/plans/{plan_name}"
         ))
         print(f"[DEBUG] Output directory: {output_dir}")
-        update_with_evidence(self.analyzer, evidence, output_dir)
-
-        posteriors_file = os.path.join(output_dir, "posterior_probabilities.json")
-        posterior_probabilities = {}
-        if os.path.exists(posteriors_file):
-            with open(posteriors_file, 'r', encoding='utf-8') as f:
-                posterior_probabilities = json.load(f)
+        # 后验直接取自返回值，文件在后台写入
+        result = update_with_evidence(self.analyzer, evidence, output_dir, persist_async=True, render=False)
+        posterior_probabilities = result.posterior_dict()
         print(f"[DEBUG] Posterior probabilities: {posterior_probabilities}")
 
         self.new_plan_generator.upsert_posterior_probability(plan_name, posterior_probabilities)
@@ -1476,13 +1472,9 @@ class ConditionSettingTab(QWidget):
             os.path.dirname(os.path.abspath(__file__)), f"../../data/bn/{self.scenario_id}/plans/{plan_name}"
         ))
         print(f"[DEBUG] Output directory: {output_dir}")
-        update_with_evidence(self.analyzer, evidence, output_dir)
-
-        posteriors_file = os.path.join(output_dir, "posterior_probabilities.json")
-        posterior_probabilities = {}
-        if os.path.exists(posteriors_file):
-            with open(posteriors_file, 'r', encoding='utf-8') as f:
-                posterior_probabilities = json.load(f)
+        # 后验直接取自返回值，文件在后台写入
+        result = update_with_evidence(self.analyzer, evidence, output_dir, persist_async=True, render=False)
+        posterior_probabilities = result.posterior_dict()
         print(f"[DEBUG] Posterior probabilities: {posterior_probabilities}")
 
         # 存数据库 (后验概率)
@@ -1614,7 +1606,7 @@ class ConditionSettingTab(QWidget):
         try:
             self.simulation_table_clear_header()
             print(f"[DEBUG] Loading plans from file: {self.change_path}")
-            self.plans_data = self.new_plan_generator.get_all_plans(change_path=self.change_path)
+            self.plans_data = self.new_plan_generator.get_all_plans(change_path=self.change_path, use_cache=True)
             print(f"[DEBUG] Loaded plans: {self.plans_data}")
 
             for plan_name, plan_data in self.plans_data.items():
@@ -1678,6 +1670,8 @@ class ConditionSettingTab(QWidget):
         # print(f"[DEBUG] Output directory: {output_dir}")
         # update_with_evidence(self.analyzer, evidence, output_dir)
 
+        # 等待后台写入的后验文件落盘
+        flush_persistence()
         posteriors_file = os.path.join(output_dir, "posterior_probabilities.json")
         posterior_probabilities = {}
         if os.path.exists(posteriors_file):
@@ -1951,14 +1945,14 @@ class ConditionSettingTab(QWidget):
 
     def run_stagewise_inference_for_plan(self, plan_name: str):
         """
-        按 t0..tK 循环：收集→分阶段证据→单次推演→读取 posterior_probabilities.json → 按阶段写 posteriori_data
+        采集一次→推导 t0..tK 各阶段证据→按阶段单次推演→按阶段写 posteriori_data
         依赖：
-        - self.format_plan_as_json / self.create_plan / PlanDataCollector / convert_to_evidence
+        - self.format_plan_as_json / self.create_plan / PlanDataCollector / convert_to_evidence_all_stages
         - update_with_evidence(self.analyzer, evidence, output_dir)
-        - self.new_plan_generator.upsert_posterior_probability(...)
+        - self.new_plan_generator.upsert_posterior_stages(...)
         """
         import os, json
-        from utils.plan import PlanDataCollector, convert_to_evidence
+        from utils.plan import PlanDataCollector, convert_to_evidence_all_stages
         from utils.get_config import get_cfg
 
         # 1) 保存/更新 plan
@@ -1976,33 +1970,27 @@ class ConditionSettingTab(QWidget):
         stages = get_cfg().get('time_stages', ["t0", "t1", "t2", "t3"])
 
         last_post = {}
+        posteriors_by_stage = {}
 
-        # 4) 循环执行
-        for t in stages:
-            # 4.1 采集原始数据
-            collected_data = collector.collect_all_data(plan_name=plan_name)
+        # 4) 采集一次原始数据，并一次性推导各阶段证据
+        collected_data = collector.collect_all_data(plan_name=plan_name)
+        evidence_by_stage = convert_to_evidence_all_stages(collected_data, stages)
 
-            # 4.2 分阶段证据
-            evidence = convert_to_evidence(collected_data, time_stage=t)
+        # 5) 循环执行
+        for t in stages:
+            evidence = evidence_by_stage[t]
 
-            # 4.3 调用你原有的一次性推演（会生成 posterior_probabilities.json）
-            update_with_evidence(self.analyzer, evidence, output_dir)
+            # 4.3 单次推演，后验直接取自返回值（posterior_probabilities.json 在后台写入）
+            result = update_with_evidence(self.analyzer, evidence, output_dir, persist_async=True, render=False)
 
-            # 4.4 读取 JSON 并写库（带 time_stage）
-            post_file = os.path.join(output_dir, "posterior_probabilities.json")
-            posterior_probabilities = {}
-            if os.path.exists(post_file):
-                with open(post_file, 'r', encoding='utf-8') as f:
-                    posterior_probabilities = json.load(f)
-                    last_post = posterior_probabilities
+            posterior_probabilities = result.posterior_dict()
+            last_post = posterior_probabilities
+            posteriors_by_stage[t] = posterior_probabilities
 
-            self.new_plan_generator.upsert_posterior_probability(
-                plan_name,
-                posterior_probabilities,
-                time_stage=t
-            )
+        # 4.4 所有阶段一次写库（带 time_stage）
+        self.new_plan_generator.upsert_posterior_stages(plan_name, posteriors_by_stage)
 
-        # 5) 刷新 UI（沿用你原方法）
+        # 6) 刷新 UI（沿用你原方法）
         if last_post:
             self.posterior_probabilities = self.convert_json_to_posterior_probabilities(last_post)
             self.update_evidence_table()
@@ -2341,16 +2329,19 @@ class ConditionSettingTab(QWidget):
           - 'High' / 'Medium' / 'Low'
           - {'Low':p1,'Medium':p2,'High':p3}
         """
-        from utils.plan import PlanDataCollector, convert_to_evidence
+        from utils.plan import PlanDataCollector, convert_to_evidence_all_stages
         collector = PlanDataCollector(self.session, scenario_id=self.scenario_id)
 
         # 预置结构
         nodes = ["Absorption", "Adaptation", "Recovery", "resilience"]
         emissions = {n: {} for n in nodes}
 
+        # 只采集一次，各阶段证据从同一快照推导
+        collected = collector.collect_all_data(plan_name=plan_name)
+        evidence_by_stage = convert_to_evidence_all_stages(collected, stages)
+
         for t in stages:
-            collected = collector.collect_all_data(plan_name=plan_name)
-            ev = convert_to_evidence(collected, time_stage=t)
+            ev = evidence_by_stage[t]
             # 下面根据你 ev 的结构名取值 —— 如果 key 不存在，就让它为 None
             # 你可以在 convert_to_evidence 里直接 RETURN 以上 4 个节点的软/硬观测
             for n in nodes:
@@ -2368,7 +2359,7 @@ class ConditionSettingTab(QWidget):
         import json
         import os
         from utils.dbn_forward import run_chain, rule_resilience_emission_gb
-        from utils.plan import PlanDataCollector, convert_to_evidence
+        from utils.plan import PlanDataCollector, convert_to_evidence_all_stages
 
         # --- 步骤 0: 检查分析器是否已初始化 ---
         if self.analyzer is None:
@@ -2388,10 +2379,13 @@ class ConditionSettingTab(QWidget):
         # 发射概率来自于用当前证据对静态BN进行推理的结果
         emissions_by_node = {node: {} for node in cap_nodes + [resilience_node_name]}
 
+        # 采集一次，并从同一快照推导所有阶段的证据
+        collected_data = collector.collect_all_data(plan_name=plan_name)
+        evidence_by_stage = convert_to_evidence_all_stages(collected_data, stages)
+
         for t in stages:
-            # 2.1) 生成当前阶段的完整证据
-            collected_data = collector.collect_all_data(plan_name=plan_name)
-            evidence_for_t = convert_to_evidence(collected_data, time_stage=t)
+            # 2.1) 取当前阶段的完整证据
+            evidence_for_t = evidence_by_stage[t]
 
             # 2.2) 使用您的分析器进行一次静态推理
             self.analyzer.make_inference(evidence_for_t)
@@ -2399,9 +2393,9 @@ class ConditionSettingTab(QWidget):
             # 2.3) 从推理结果中提取我们需要的四个节点的后验概率，作为DBN的发射概率
             for node_name in cap_nodes + [resilience_node_name]:
                 try:
-                    # analyzer.ie.posterior(node_name) 返回一个 pyAgrum Potential 对象
+                    # analyzer.posterior(node_name) 返回后验数组（长驻模式下命中缓存）
                     # 我们需要将其转换为 {"Bad": p1, "Good": p2} 的字典
-                    posterior_potential = self.analyzer.ie.posterior(node_name)
+                    posterior_potential = self.analyzer.posterior(node_name)
                     prob_dist = {}
                     for i, label in enumerate(self.analyzer.state_mapping[node_name]):
                         prob_dist[label] = posterior_potential[i]
@@ -2438,19 +2432,16 @@ class ConditionSettingTab(QWidget):
                 emissions_by_stage=emissions_by_node.get(node, {})
             )
 
-        # --- 步骤 4: 整理结果并写入数据库 ---
-        for t in stages:
-            # 组合当前阶段所有节点的最终后验概率
-            posterior_probabilities_for_t = {
+        # --- 步骤 4: 整理结果并一次写入数据库 ---
+        posteriors_by_stage = {
+            # 组合每个阶段所有节点的最终后验概率
+            t: {
                 node: final_posteriors_by_node[node][t]
                 for node in all_dynamic_nodes if node in final_posteriors_by_node
             }
-
-            self.new_plan_generator.upsert_posterior_probability(
-                plan_name,
-                posterior_probabilities_for_t,
-                time_stage=t
-            )
+            for t in stages
+        }
+        self.new_plan_generator.upsert_posterior_stages(plan_name, posteriors_by_stage)
 
         # --- 步骤 5: 刷新UI ---
         last_stage = stages[-1]
@@ -15,16 +15,20 @@ from PySide6.QtWidgets import (
 from PySide6.QtCore import Qt, Signal
 from owlready2 import get_ontology, destroy_entity
 
-from utils.bn_svg_update import NetworkVisualizer, ScenarioResilience, bn_svg_update, update_with_evidence
+from utils.bn_svg_update import NetworkVisualizer, ScenarioResilience, bn_svg_update, update_with_evidence, \
+    render_pipeline
 from utils.combinesysml2 import combine_sysml2
 from utils.createowlfromoriginjson import ScenarioOntologyGenerator
 from utils.get_config import get_cfg
-from utils.json2owl import create_ontology, owl_excel_creator, Scenario_owl_creator, Emergency_owl_creator
+from utils.job_runner import JobRunner
+from utils.json2owl import create_ontology, export_owl_properties, Scenario_owl_creator, Emergency_owl_creator
+from utils.model_pipeline import ModelPipeline, Stage, DirInput, DataInput
 from utils.owl2svg import convert_owl_to_svg
 from utils.parserowl import parse_owl
 from utils.plan import PlanDataCollector, convert_to_evidence, PlanData
 
-from utils.sysml2json import process_file
+from utils.sysml2json import process_file, export_result_tables
+from models.models import Owl
 from views.dialogs.custom_error_dialog import CustomErrorDialog
 from views.dialogs.custom_information_dialog import CustomInformationDialog
 from views.dialogs.custom_warning_dialog import CustomWarningDialog
@@ -37,12 +41,20 @@ from views.tabs.condition_setting import ConditionSettingTab
 class CustomTabWidget(QWidget):
     tab_changed = Signal(int)
     generate_model_save_to_database = Signal()
-    generate_bayes_save_to_database = Signal()
+    generate_bayes_save_to_database = Signal(object)
+    # 后台任务写库完成后通知控制器刷新（界面线程）
+    model_saved = Signal(bool)
+    bayes_saved = Signal()
 
     def __init__(self, parent=None):
         super().__init__(parent)
 
         self.analyzer = None
+        # 生成任务在后台线程串行执行，见 utils.job_runner
+        self.job_runner = JobRunner(parent=self)
+        self.db_manager = None
+        self.save_model_to_database = None
+        self.save_bayes_to_database = None
         self.init_ui()
         self.ElementSettingTab.generate_model_show.connect(self.generate_model)
         self.ModelGenerationTab.generate_request.connect(self.generate_bayes)
@@ -329,86 +341,181 @@ class CustomTabWidget(QWidget):
             if i + 1 == index:
                 button.setEnabled(True)
 
+    def set_job_backend(self, db_manager, save_model_to_database, save_bayes_to_database):
+        """
+        设置后台任务使用的数据库管理器与写库函数 fn(session, scenario_id, ...)。
+        未设置时写库仍通过 generate_*_save_to_database 信号交给界面线程完成。
+        """
+        self.db_manager = db_manager
+        self.save_model_to_database = save_model_to_database
+        self.save_bayes_to_database = save_bayes_to_database
+
+    def _worker_session(self):
+        """后台任务自己的短会话；没有数据库管理器时退回共享会话（不提交、不关闭）"""
+        if self.db_manager is not None:
+            return self.db_manager.session_scope()
+        from contextlib import nullcontext
+        return nullcontext(self.ElementSettingTab.session)
+
+    def start_job(self, fn, total_steps, title, on_finished):
+        """
+        在后台执行 fn(job)，显示可取消的进度对话框；
+        成功后在界面线程调用 on_finished(result)，出错时弹出错误提示。
+        """
+        if self.job_runner.is_busy():
+            CustomWarningDialog(self.tr("提示"), self.tr("已有生成任务正在执行，请稍候。"), parent=self).exec()
+            return None
+
+        progress = QProgressDialog(self.tr("准备开始..."), self.tr("取消"), 0, total_steps, self)
+        progress.setWindowTitle(title)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(0)  # 立即显示进度条
+        progress.setMinimumWidth(300)
+        if get_cfg()['i18n']['language'] == "en_US":
+            progress.setMinimumWidth(400)
+        progress.setAutoClose(False)
+        progress.setAutoReset(False)
+
+        job = self.job_runner.submit(fn, total_steps, name=title)
+        timings = []
+
+        def on_progress(step, total, label):
+            progress.setValue(step)
+            progress.setLabelText(label)
+
+        def on_stage(name, status, seconds):
+            timings.append(f"{name}={'跳过' if status == 'skipped' else f'{seconds:.2f}s'}")
+
+        def close_progress():
+            progress.canceled.disconnect()
+            progress.close()
+            if timings:
+                print(f"{title} 各阶段: {', '.join(timings)}")
+
+        def on_done(result):
+            close_progress()
+            on_finished(result)
+
+        def on_failed(message):
+            close_progress()
+            CustomErrorDialog(self.tr("错误"), message, parent=self).exec()
+            print(f"Error: {message}")
+
+        def on_cancelled():
+            close_progress()
+            CustomInformationDialog(" ", self.tr("已取消。"), parent=self).exec()
+
+        def on_cancel_requested():
+            job.cancel()
+            progress.show()  # 取消按钮会隐藏对话框，当前阶段结束前继续显示
+            progress.setLabelText(self.tr("正在取消，当前阶段完成后停止..."))
+
+        job.signals.progress.connect(on_progress)
+        job.signals.stage_finished.connect(on_stage)
+        job.signals.finished.connect(on_done)
+        job.signals.failed.connect(on_failed)
+        job.signals.cancelled.connect(on_cancelled)
+        progress.canceled.connect(on_cancel_requested)
+        progress.show()
+        return job
+
     def generate_model(self):
         try:
-            from PySide6.QtWidgets import QProgressDialog
-            from PySide6.QtCore import Qt, QTimer
-            from PySide6.QtWidgets import QApplication
-            import time
-
-            # 创建进度条对话框
-            progress = QProgressDialog(self.tr("准备开始..."), None, 0, 8, self)
-            progress.setWindowTitle(self.tr("生成模型"))
-            progress.setWindowModality(Qt.WindowModal)
-            progress.setMinimumDuration(0)  # 立即显示进度条
-            progress.setMinimumWidth(300)
-            if get_cfg()['i18n']['language'] == "en_US":
-                progress.setMinimumWidth(400)
-            progress.setCancelButton(None)  # 不显示取消按钮
-            progress.setAutoClose(True)
-            progress.show()
-
-            def update_progress(step, text):
-                progress.setValue(step)
-                progress.setLabelText(text)
-                QApplication.processEvents()  # 强制刷新界面
-                time.sleep(0.1)  # 添加小延迟让进度条可见
-
-            # 第1步：初始化
-            update_progress(0, self.tr("正在初始化..."))
-
-
             scenario_id = self.ElementSettingTab.scenario_data['scenario_id']
-            input_dir = os.path.join(os.path.dirname(__file__), f'../../data/sysml2/{scenario_id}')
-            output_dir = os.path.join(os.path.dirname(__file__), f'../../data/sysml2/{scenario_id}/combined')
+            pipeline = self.build_model_pipeline(scenario_id)
+        except Exception as e:
+            CustomErrorDialog(self.tr("错误"), self.tr('模型生成失败:{0}').format(str(e)), parent=self).exec()
+            print(f"Error: {str(e)}")
+            return
 
-            # 第2步：合并SysML2文件
-            update_progress(1, self.tr("正在合并SysML2文件..."))
+        def run_pipeline(job):
+            # 各阶段按清单增量执行，输入未变化的阶段直接跳过
+            return pipeline.run(progress=lambda step, label: job.progress(step + 1, label),
+                                checkpoint=job.checkpoint, on_stage=job.stage_done)
 
+        def finished(summary):
+            print(f"模型生成各阶段: {summary}")
+            self.model_saved.emit(True)
+            self.unlock_tabs(2)
+            self.switch_tab(2)
+            CustomInformationDialog(" ", self.tr("已成功生成情景级孪生模型。"), parent=self).exec()
+
+        self.start_job(run_pipeline, len(pipeline.stages) + 1, self.tr("生成模型"), finished)
+
+    def collect_plan_evidence(self, session, scenario_id):
+        """从数据库中的预案数据生成贝叶斯网络证据"""
+        collector = PlanDataCollector(session, scenario_id=scenario_id)
+        plan_data = collector.collect_all_data(plan_name=None)
+        evidence = convert_to_evidence(plan_data)
+        # 查看有没有设置resource
+        related_usage = collector.get_related_resource()
+        if not related_usage:
+            evidence.pop('responseDuration', None)
+            evidence.pop('disposalDuration', None)
+            evidence['AidResource'] = 0
+            evidence['TowResource'] = 0
+            evidence['FirefightingResource'] = 0
+            evidence['RescueResource'] = 0
+        return evidence
+
+    def build_model_pipeline(self, scenario_id, force=False):
+        """
+        构建模型生成流水线（见 utils.model_pipeline）：
+        合并 SysML2 -> 解析为 JSON -> ScenarioElement/Scenario/Emergency 本体 -> 合并 OWL
+        -> SVG -> 本体结构 JSON -> 保存到数据库。
+        清单与各阶段耗时记录在 data/sysml2/<scenario_id>/pipeline_manifest.json。
+        """
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), f'../../data/sysml2/{scenario_id}'))
+        combined_dir = os.path.join(base_dir, 'combined')
+        result_dir = os.path.join(base_dir, 'result')
+        owl_dir = os.path.join(base_dir, 'owl')
+        config_path = os.path.join(os.path.dirname(__file__), '../../config.json')
+        for path in (combined_dir, result_dir, owl_dir):
+            os.makedirs(path, exist_ok=True)
+
+        scenario_element_owl = os.path.join(owl_dir, "ScenarioElement.owl")
+        scenario_output_path = os.path.join(owl_dir, "Scenario.owl")
+        emergency_output_path = os.path.join(owl_dir, "Emergency.owl")
+        combined_output_path = os.path.join(owl_dir, "Merge.owl")
+        part_owl_files = [scenario_element_owl, scenario_output_path, emergency_output_path]
+        all_owl_files = part_owl_files + [combined_output_path]
+        structure_file = lambda owl: os.path.splitext(owl)[0] + "_ontology_structure.json"
+
+        converted_data = [item[1] for item in self.ElementSettingTab.element_data.items()]  # 直接提取值部分
+        config = get_cfg()
+        sysml_defs = {"action-def": config.get("action-def", {}), "state-def": config.get("state-def", {})}
+
+        # Scenario 本体的证据来自数据库中的预案数据（含行驶时间查询），
+        # 在后台任务中用独立会话收集；没有独立会话时在界面线程中用共享会话预先收集
+        def collect_evidence():
+            with self._worker_session() as session:
+                return self.collect_plan_evidence(session, scenario_id)
+
+        evidence = DataInput("evidence", collect_evidence if self.db_manager is not None else
+                             self.collect_plan_evidence(self.ElementSettingTab.session, scenario_id))
+
+        pipeline = ModelPipeline(base_dir, force=force)
+
+        def combine(changed):
             try:
-                config_path = os.path.join(os.path.dirname(__file__), '../../config.json')
-                combine_sysml2(input_dir, output_dir, config_path)
+                combine_sysml2(base_dir, combined_dir, config_path)
             except Exception as e:
                 raise Exception(self.tr('合并SysML2文件失败: {e}').format(e=str(e)))
 
-            # 第3步：处理文件
-            update_progress(2, self.tr("正在处理文件..."))
-
-            input_dir = output_dir
-            output_dir = os.path.join(os.path.dirname(__file__), f'../../data/sysml2/{scenario_id}/result')
-            os.makedirs(output_dir, exist_ok=True)
-
+        def sysml_to_json(changed):
             try:
-                for file_name in os.listdir(input_dir):
-                    if file_name.endswith('.txt'):
-                        input_path = os.path.join(input_dir, file_name)
-                        process_file(input_path, output_dir)
+                # 只重新解析内容变化的合并文件
+                for input_path in DirInput(combined_dir, ('.txt',)).files():
+                    if pipeline.key(input_path) in changed:
+                        process_file(input_path, result_dir, tables=())
             except Exception as e:
                 raise Exception(self.tr('处理文件失败: {e}'.format(e=str(e))))
 
-            # 第4步：生成ScenarioElement本体
-            update_progress(3, self.tr("正在生成ScenarioElement本体..."))
-
+        def scenario_element(changed):
             try:
-                input_dir = output_dir
-                output_dir = os.path.join(os.path.dirname(__file__), f'../../data/sysml2/{scenario_id}/owl')
-                os.makedirs(output_dir, exist_ok=True)
-
-                for f in os.listdir(output_dir):
-                    if f.endswith('.owl'):
-                        os.remove(os.path.join(output_dir, f))
-
-                json_files = [f for f in os.listdir(input_dir) if f.endswith('.json')]
-                scenario_element_owl = os.path.join(output_dir, "ScenarioElement.owl")
-
-                # for input_file in json_files:
-                #     input_path = os.path.join(input_dir, input_file)
-                #     create_ontology(input_path, scenario_element_owl)
+                if os.path.exists(scenario_element_owl):
+                    os.remove(scenario_element_owl)
                 generator = ScenarioOntologyGenerator()
-                element_list = list(self.ElementSettingTab.element_data.items())
-                converted_data = [item[1] for item in element_list]  # 直接提取值部分
-                json_data = converted_data
-                # print(f"23123{json_data}")
                 generator.generate(converted_data, scenario_element_owl)
 
                 onto = get_ontology(scenario_element_owl).load()
@@ -418,291 +525,241 @@ class CustomTabWidget(QWidget):
                     if 'Resource' in onto.classes():
                         destroy_entity(onto.Resource)
                 onto.save(file=scenario_element_owl, format="rdfxml")
-
-                owl_excel_creator(scenario_element_owl, os.path.join(output_dir, "ScenarioElement_Prop.xlsx"))
             except Exception as e:
                 raise Exception(self.tr('生成ScenarioElement本体失败: {e}').format(e=str(e)))
 
-            # 第5步：创建其他本体文件
-            update_progress(4, self.tr("正在创建其他本体文件..."))
-
-            collector = PlanDataCollector(self.ElementSettingTab.session, scenario_id=scenario_id)
-
-            # 收集数据
-            plan_data = collector.collect_all_data(plan_name=None)
-
-            # 转换为贝叶斯网络证据
-            evidence = convert_to_evidence(plan_data)
-            # 查看有没有设置resource
-            related_usage = collector.get_related_resource()
-            print(f"324234243{related_usage}")
-            if not related_usage:
-                evidence.pop('responseDuration', None)
-                evidence.pop('disposalDuration', None)
-                # evidence.pop('AidResource', None)
-                # evidence.pop('TowResource', None)
-                # evidence.pop('FirefightingResource', None)
-                # evidence.pop('RescueResource', None)
-                evidence['AidResource'] = 0
-                evidence['TowResource'] = 0
-                evidence['FirefightingResource'] = 0
-                evidence['RescueResource'] = 0
-
+        def scenario_owl(changed):
             try:
-                scenario_output_path = os.path.join(output_dir, "Scenario.owl")
-                Scenario_owl_creator(scenario_output_path,evidence)
-                owl_excel_creator(scenario_output_path, os.path.join(output_dir, "Scenario_Prop.xlsx"))
+                Scenario_owl_creator(scenario_output_path, evidence.value())
+            except Exception as e:
+                raise Exception(self.tr('创建Scenario和Emergency本体失败: {e}').format(e=str(e)))
 
-                emergency_output_path = os.path.join(output_dir, "Emergency.owl")
+        def emergency_owl(changed):
+            try:
                 Emergency_owl_creator(emergency_output_path)
-                owl_excel_creator(emergency_output_path, os.path.join(output_dir, "Emergency_Prop.xlsx"))
             except Exception as e:
                 raise Exception(self.tr('创建Scenario和Emergency本体失败: {e}').format(e=str(e)))
 
-            # 第6步：合并OWL文件
-            update_progress(5, self.tr("正在合并OWL文件..."))
-
+        def merge_owl(changed):
             try:
-                input_owl_files = [
-                    scenario_element_owl,
-                    scenario_output_path,
-                    emergency_output_path
-                ]
-                combined_output_path = os.path.join(output_dir, "Merge.owl")
                 combined_graph = rdflib.Graph()
-
-                for owl_file in input_owl_files:
+                for owl_file in part_owl_files:
                     combined_graph.parse(owl_file, format="xml")
-
                 combined_graph.serialize(destination=combined_output_path, format="xml")
             except Exception as e:
                 raise Exception(self.tr('合并OWL文件失败: {e}').format(e=str(e)))
 
-            # 第7步：创建OWL图片和解析模型
-            update_progress(6, self.tr("正在创建OWL图片和解析模型..."))
-
+        def render_svg(changed):
             try:
-                input_owl_files = input_owl_files + [combined_output_path]
-                convert_owl_to_svg(input_owl_files, output_dir)
-
-                for input_owl in input_owl_files:
-                    element_list = list(self.ElementSettingTab.element_data.items())
-                    converted_data = [item[1] for item in element_list]  # 直接提取值部分
-                    json_data = converted_data
-                    parse_owl(input_owl, json_data)
+                # 只渲染内容变化（或图片缺失）的本体
+                stale = [f for f in all_owl_files
+                         if pipeline.key(f) in changed or not os.path.exists(os.path.splitext(f)[0] + ".svg")]
+                results = convert_owl_to_svg(stale, owl_dir)
             except Exception as e:
                 raise Exception(self.tr('创建OWL图片或解析模型失败: {e}').format(e=str(e)))
+            # 图片失败不影响后续阶段；缺失的图片在下次生成时重新渲染
+            for result in results:
+                if not result.ok:
+                    print(f"生成 {os.path.basename(result.source)} 的图片失败: {result.error}")
 
-            # 第8步：保存到数据库
-            update_progress(7, self.tr("正在保存到数据库..."))
+        def parse_parts(changed):
+            try:
+                for input_owl in part_owl_files:
+                    if pipeline.key(input_owl) in changed:
+                        parse_owl(input_owl, converted_data)
+            except Exception as e:
+                raise Exception(self.tr('创建OWL图片或解析模型失败: {e}').format(e=str(e)))
 
+        def parse_merge(changed):
             try:
-                self.generate_model_save_to_database.emit()
+                # Merge 的结构 JSON 由其余本体的结构 JSON 合并而来
+                parse_owl(combined_output_path, converted_data)
+            except Exception as e:
+                raise Exception(self.tr('创建OWL图片或解析模型失败: {e}').format(e=str(e)))
 
+        def save_to_database(changed):
+            try:
+                if self.save_model_to_database is not None and self.db_manager is not None:
+                    with self.db_manager.session_scope() as session:
+                        self.save_model_to_database(session, scenario_id)
+                else:
+                    self.generate_model_save_to_database.emit()
             except Exception as e:
                 raise Exception(self.tr('保存到数据库失败: {e}').format(e=str(e)))
 
-            # 完成
-            update_progress(8, self.tr("完成"))
-            time.sleep(0.5)  # 让用户看到100%的进度
-            progress.close()
-            self.unlock_tabs(2)
-            self.switch_tab(2)
-            CustomInformationDialog(" ", self.tr("已成功生成情景级孪生模型。"), parent=self).exec()
-
-        except Exception as e:
-            if 'progress' in locals():
-                progress.close()
-            CustomErrorDialog(self.tr("错误"), self.tr('模型生成失败:{0}').format(str(e)), parent=self).exec()
-            print(f"Error: {str(e)}")
+        def database_has_owl():
+            with self._worker_session() as session:
+                return session is not None and session.query(Owl.owl_id).filter(
+                    Owl.scenario_id == scenario_id).first() is not None
+
+        sysml_inputs = DirInput(base_dir, ('.txt',))
+        pipeline.add_stage(Stage("combine_sysml2", self.tr("正在合并SysML2文件..."), combine,
+                                 inputs=[sysml_inputs, DataInput("sysml_defs", sysml_defs)],
+                                 outputs=[DirInput(combined_dir, ('.txt',))]))
+        pipeline.add_stage(Stage("sysml2json", self.tr("正在处理文件..."), sysml_to_json,
+                                 inputs=[DirInput(combined_dir, ('.txt',))],
+                                 outputs=[DirInput(result_dir, ('.json',))]))
+        pipeline.add_stage(Stage("scenario_element_owl", self.tr("正在生成ScenarioElement本体..."), scenario_element,
+                                 inputs=[DataInput("element_data", converted_data)],
+                                 outputs=[scenario_element_owl]))
+        # 本体构建代码本身也作为输入，修改后对应阶段会重新运行
+        owl_creator_source = Emergency_owl_creator.__code__.co_filename
+        pipeline.add_stage(Stage("scenario_owl", self.tr("正在创建其他本体文件..."), scenario_owl,
+                                 inputs=[evidence, owl_creator_source],
+                                 outputs=[scenario_output_path]))
+        pipeline.add_stage(Stage("emergency_owl", self.tr("正在创建其他本体文件..."), emergency_owl,
+                                 inputs=[owl_creator_source],
+                                 outputs=[emergency_output_path]))
+        pipeline.add_stage(Stage("merge_owl", self.tr("正在合并OWL文件..."), merge_owl,
+                                 inputs=part_owl_files, outputs=[combined_output_path]))
+        pipeline.add_stage(Stage("owl_svg", self.tr("正在创建OWL图片和解析模型..."), render_svg,
+                                 inputs=all_owl_files,
+                                 outputs=[os.path.splitext(f)[0] + ".svg" for f in all_owl_files]))
+        pipeline.add_stage(Stage("parse_owl", self.tr("正在创建OWL图片和解析模型..."), parse_parts,
+                                 inputs=part_owl_files, outputs=[structure_file(f) for f in part_owl_files]))
+        pipeline.add_stage(Stage("parse_merge", self.tr("正在创建OWL图片和解析模型..."), parse_merge,
+                                 inputs=[structure_file(f) for f in part_owl_files],
+                                 outputs=[structure_file(combined_output_path)]))
+        pipeline.add_stage(Stage("save_to_database", self.tr("正在保存到数据库..."), save_to_database,
+                                 inputs=all_owl_files + [structure_file(f) for f in all_owl_files],
+                                 check=database_has_owl))
+
+        # 属性表/结果表不在生成主路径上，仅在配置 model.export_tables 时作为最后一个阶段导出
+        table_formats = list(config.get("model", {}).get("export_tables", []))
+        if table_formats:
+            def export_tables(changed):
+                # 表格只是附带产物，导出失败不影响模型生成
+                try:
+                    export_result_tables(result_dir, table_formats)
+                    export_owl_properties(part_owl_files, owl_dir, table_formats)
+                except Exception as e:
+                    print(f"导出表格失败: {e}")
+
+            suffixes = tuple(f".{fmt}" for fmt in table_formats)
+            pipeline.add_stage(Stage("export_tables", self.tr("正在导出表格..."), export_tables,
+                                     inputs=[DirInput(result_dir, ('.json',)), DataInput("table_formats", table_formats)]
+                                     + part_owl_files,
+                                     outputs=[DirInput(result_dir, suffixes), DirInput(owl_dir, suffixes)]))
+        return pipeline
 
     def generate_bayes(self):
-        try:
-            import time
-
-            # 创建进度条对话框
-            progress = QProgressDialog(self.tr("准备开始..."), None, 0, 8, self)
-            progress.setWindowTitle(self.tr("生成贝叶斯网络"))
-            progress.setWindowModality(Qt.WindowModal)
-            progress.setMinimumDuration(0)
-            progress.setMinimumWidth(300)
-            if get_cfg()['i18n']['language'] == "en_US":
-                progress.setMinimumWidth(400)
-            progress.setCancelButton(None)
-            progress.setAutoClose(True)
-            progress.show()
-
-            def update_progress(step, text):
-                progress.setValue(step)
-                progress.setLabelText(text)
-                QApplication.processEvents()
-                time.sleep(0.1)
-
-            # 步骤1：初始化
-            update_progress(0, self.tr("正在初始化..."))
-
-            scenario_id = self.ElementSettingTab.scenario_data['scenario_id']
-
-            # 步骤2：加载OWL文件
-            update_progress(1, self.tr("正在加载OWL文件..."))
+        scenario_id = self.ElementSettingTab.scenario_data['scenario_id']
+
+        prior_prob_test_path = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                            f'../../data/required_information/root_prior_data.xlsx'))
+        expert_info_path = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                        f'../../data/required_information/expert_info_data.xlsx'))
+        expert_estimation_path = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                              f'../../data/required_information/expert_estimation_data.xlsx'))
+        output_dir = os.path.join(os.path.dirname(__file__), f'../../data/bn/{scenario_id}')
+        self.ModelTransformationTab.info_dir = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                                            f'../../data/required_information'))
+        # 没有独立会话时证据在界面线程中用共享会话预先收集
+        evidence = None if self.db_manager is not None else \
+            self.collect_plan_evidence(self.ElementSettingTab.session, scenario_id)
+
+        def build(job):
+            # 步骤1：加载OWL文件（本体延迟加载，并检查已编译网络的缓存）
+            job.progress(1, self.tr("正在加载OWL文件..."))
             try:
                 input_owl = os.path.abspath(os.path.join(os.path.dirname(__file__),
                                                          f'../../data/sysml2/{scenario_id}/owl/Scenario.owl'))
                 analyzer = ScenarioResilience(input_owl)
+                input_hashes = analyzer.input_hashes(prior_prob_test_path, expert_info_path, expert_estimation_path)
+                stale_parts = analyzer.load_cached_network(output_dir, input_hashes)
             except Exception as e:
                 raise Exception(self.tr('加载OWL文件失败: {e}').format(e=str(e)))
 
-            # 步骤3：提取数据属性
-            update_progress(2, self.tr("正在提取数据属性..."))
+            # 步骤2：提取数据属性
+            job.checkpoint()
+            job.progress(2, self.tr("正在提取数据属性..."))
             try:
-                analyzer.extract_data_properties()
+                if 'structure' in stale_parts:
+                    analyzer.extract_data_properties()
             except Exception as e:
                 raise Exception(self.tr('提取数据属性失败: {e}').format(e=str(e)))
 
-            # 步骤4：创建贝叶斯网络结构
-            update_progress(3, self.tr("正在创建贝叶斯网络结构..."))
+            # 步骤3：创建贝叶斯网络结构
+            job.checkpoint()
+            job.progress(3, self.tr("正在创建贝叶斯网络结构..."))
             try:
-                analyzer.create_bayesian_network()
+                if 'structure' in stale_parts:
+                    analyzer.create_bayesian_network()
             except Exception as e:
                 raise Exception(self.tr('创建贝叶斯网络结构失败: {e}').format(e=str(e)))
 
-            # 步骤5：设置先验概率
-            update_progress(4, self.tr("正在设置先验概率..."))
-            # try:
-            #     # 当前脚本所在的目录
-            #     current_dir = os.path.dirname(__file__)
-            #
-            #     # 源文件所在目录
-            #     source_dir = os.path.abspath(os.path.join(current_dir, '../../data/required_information'))
-            #
-            #     # 指定的目标文件夹
-            #     destination_dir = os.path.abspath(os.path.join(current_dir, f'../../data/bn/{scenario_id}/required_information'))
-            #     self.ModelTransformationTab.info_dir = destination_dir
-            #
-            #     # 如果目标文件夹不存在，则创建它
-            #     if not os.path.exists(destination_dir):
-            #         os.makedirs(destination_dir)
-            #
-            #
-            #     # 文件列表
-            #     files = [
-            #         'prior prob test.xlsx',
-            #         'expertInfo.xlsx',
-            #         'expert estimation test.xlsx'
-            #     ]
-            #
-            #     # 循环复制每个文件
-            #     # 如果已经存在，跳过复制
-            #     for file_name in files:
-            #
-            #         src_path = os.path.join(source_dir, file_name)
-            #         dst_path = os.path.join(destination_dir, file_name)
-            #
-            #         # 复制文件，保留元数据（使用 copy2）；
-            #         # 如果不需要保留元数据，可以使用 shutil.copy
-            #
-            #         # 如果已经存在，跳过复制
-            #         if os.path.exists(dst_path):
-            #             continue
-            #         shutil.copy2(src_path, dst_path)
-            #
-            #     print("文件复制成功！")
-            #
-            # except Exception as e:
-            #     raise Exception(f"复制文件失败: {str(e)}")
+            # 步骤4：设置先验概率
+            job.checkpoint()
+            job.progress(4, self.tr("正在设置先验概率..."))
             try:
-                prior_prob_test_path = os.path.abspath(os.path.join(os.path.dirname(__file__),
-                                                                    f'../../data/required_information/root_prior_data.xlsx'))
-                expert_info_path = os.path.abspath(os.path.join(os.path.dirname(__file__),
-                                                                f'../../data/required_information/expert_info_data.xlsx'))
-                expert_estimation_path = os.path.abspath(os.path.join(os.path.dirname(__file__),
-                                                                      f'../../data/required_information/expert_estimation_data.xlsx'))
-
-                analyzer.set_prior_probabilities(prior_prob_test_path)
-                self.ModelTransformationTab.info_dir = os.path.abspath(os.path.join(os.path.dirname(__file__),
-                                                                f'../../data/required_information'))
+                if 'prior' in stale_parts:
+                    analyzer.set_prior_probabilities(prior_prob_test_path)
             except Exception as e:
                 raise Exception(self.tr('设置先验概率失败: {e}').format(e=str(e)))
 
-            # 步骤6：处理专家评估
-            update_progress(5, self.tr("正在处理专家评估..."))
+            # 步骤5：处理专家评估
+            job.checkpoint()
+            job.progress(5, self.tr("正在处理专家评估..."))
             try:
-                expert_df = analyzer.process_expert_evaluation(
-                    expert_info_path=expert_info_path,
-                    expert_estimation_path=expert_estimation_path
-                )
-                analyzer.set_conditional_probabilities(expert_df)
+                if 'cpt' in stale_parts:
+                    expert_df = analyzer.process_expert_evaluation(
+                        expert_info_path=expert_info_path,
+                        expert_estimation_path=expert_estimation_path
+                    )
+                    analyzer.set_conditional_probabilities(expert_df)
+                if stale_parts:
+                    analyzer.save_cached_network(output_dir, input_hashes)
             except Exception as e:
                 raise Exception(self.tr('处理专家评估失败: {e}').format(e=str(e)))
 
-            # 步骤7：执行推理和保存网络
-            update_progress(6, self.tr("正在执行推理和保存网络..."))
+            # 步骤6：执行推理和保存网络
+            job.checkpoint()
+            job.progress(6, self.tr("正在执行推理和保存网络..."))
             try:
+                # 联结树只编译一次，后续各预案的推演以证据差量更新
+                analyzer.enable_persistent_inference()
                 analyzer.make_inference()
 
-                output_dir = os.path.join(os.path.dirname(__file__), f'../../data/bn/{scenario_id}')
                 structure_path, params_path = analyzer.save_network(output_dir)
             except Exception as e:
                 raise Exception(self.tr('执行推理或保存网络失败: {e}').format(e=str(e)))
 
-            # 步骤8：可视化网络
-            update_progress(7, self.tr("正在可视化网络..."))
+            # 步骤7：可视化网络并保存到数据库
+            job.checkpoint()
+            job.progress(7, self.tr("正在可视化网络..."))
             try:
-                visualizer = NetworkVisualizer()
-                ie = visualizer.visualize_network(
-                    bn=analyzer.bn,
-                    output_dir=output_dir,
-                    state_mapping=analyzer.state_mapping
-                )
-
                 node_data_path = os.path.join(output_dir, "node_data.json")
-
-                # 创建会话和收集器实例
-                collector = PlanDataCollector(self.ElementSettingTab.session, scenario_id=scenario_id)
-
-                # 收集数据
-                plan_data = collector.collect_all_data(plan_name=None)
-
-                # 转换为贝叶斯网络证据
-                evidence = convert_to_evidence(plan_data)
-                # 查看有没有设置resource
-                related_usage = collector.get_related_resource()
-                print(f"324234243{related_usage}")
-                if not related_usage:
-                    evidence.pop('responseDuration', None)
-                    evidence.pop('disposalDuration', None)
-                    # evidence.pop('AidResource', None)
-                    # evidence.pop('TowResource', None)
-                    # evidence.pop('FirefightingResource', None)
-                    # evidence.pop('RescueResource', None)
-                    evidence['AidResource']= 0
-                    evidence['TowResource'] = 0
-                    evidence['FirefightingResource'] = 0
-                    evidence['RescueResource'] = 0
-                update_with_evidence(analyzer, evidence,output_dir)
-
-                self.ModelTransformationTab.set_node_data(json.load(open(node_data_path, 'r')))
-                self.ModelTransformationTab.set_bayesian_network_image(
-                    os.path.join(output_dir, "combined_visualization.svg"))
-                self.generate_bayes_save_to_database.emit()
+                if evidence is None:
+                    with self._worker_session() as session:
+                        plan_evidence = self.collect_plan_evidence(session, scenario_id)
+                else:
+                    plan_evidence = evidence
+                update_with_evidence(analyzer, plan_evidence, output_dir)
+                # 视图需要图片时才真正渲染
+                image_path = render_pipeline.render(output_dir) or os.path.join(output_dir, "combined_visualization.svg")
+
+                if self.save_bayes_to_database is not None and self.db_manager is not None:
+                    with self.db_manager.session_scope() as session:
+                        self.save_bayes_to_database(session, scenario_id, analyzer)
+                else:
+                    self.generate_bayes_save_to_database.emit(analyzer)
             except Exception as e:
                 raise Exception(self.tr('可视化网络失败: {e}').format(e=str(e)))
 
-            # 完成
-            update_progress(8, self.tr("完成"))
-            time.sleep(0.5)  # 让用户看到100%的进度
-            progress.close()
+            return analyzer, node_data_path, image_path
+
+        def finished(result):
+            analyzer, node_data_path, image_path = result
+            with open(node_data_path, 'r') as f:
+                self.ModelTransformationTab.set_node_data(json.load(f))
+            self.ModelTransformationTab.set_bayesian_network_image(image_path)
+            self.bayes_saved.emit()
             self.unlock_tabs(3)
             self.switch_tab(3)
             self.analyzer = analyzer
             CustomInformationDialog(" ", self.tr("已成功生成推演模型。"), parent=self).exec()
 
-        except Exception as e:
-            if 'progress' in locals():
-                progress.close()
-            CustomErrorDialog(self.tr("错误"), self.tr('生成推演模型失败:{e}').format(e=str(e)), parent=self).exec()
-            print(f"Error: {str(e)}")
-
+        self.start_job(build, 8, self.tr("生成贝叶斯网络"), finished)
 
     def set_inference_conditions(self):
         self.ConditionSettingTab.session = self.ElementSettingTab.session